@@ -177,6 +177,7 @@ def analyze_data():
         unique_data.append(unique_row_data)
 
     print(f"unique rows: {unique_data}")
+    unique_data_by_i = {row['i']: row for row in unique_data}
 
     # generate graphical plot of unique data
     metrics = ['sin', 'cos', 'e', 'log']
@@ -212,11 +213,11 @@ def analyze_data():
         # Add interactive hover showing all unique values and UUIDs for this iteration
         cursor = mplcursors.cursor(scatter, hover=True)
         @cursor.connect("add")
-        def on_add(sel):
+        def on_add(sel, metric=metric, x_vals=x_vals):
             idx = sel.index
             i_hover = x_vals[idx]
             # Find the row in unique_data for this iteration
-            row = next(r for r in unique_data if r['i'] == i_hover)
+            row = unique_data_by_i[i_hover]
             values = row[metric]
             uuids_per_value = row[f"{metric}_uuids"]
             info = [f"Value: {v}\nUUIDs: {', '.join(u)}" for v, u in zip(values, uuids_per_value)]
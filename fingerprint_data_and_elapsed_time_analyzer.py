@@ -7,9 +7,11 @@ import time
 import os
 import csv
 import json
-import matplotlib.pyplot as plt
-import numpy as np
-import mplcursors
+import gzip
+import lzma
+
+# numpy, matplotlib and mplcursors are imported inside the functions that use them,
+# so the stages that do not plot start quickly (and work on machines without a display)
 
 
 # Directory containing the fingerprint data files
@@ -17,6 +19,111 @@ data_directory = "python scripts/fingerprint_results"
 aggregate_fingerprint_data_filename = "python scripts/aggregate_fingerprint_data.json"
 aggregate_system_data_filename = "python scripts/aggregate_system_data.json"
 inconsistant_rows_filename = "python scripts/inconsistent_rows.json"
+ulp_errors_filename = "python scripts/ulp_errors.json"
+adaptive_hints_filename = "python scripts/adaptive_hints.json"
+adaptive_inconsistent_rows_filename = "python scripts/adaptive_inconsistent_rows.json"
+watch_status_filename = "python scripts/watch_status.json"
+backend_comparison_filename = "python scripts/backend_comparison.json"
+interference_filename = "python scripts/interference_slowdowns.json"
+operand_classes_filename = "python scripts/operand_class_timing.json"
+cycle_costs_filename = "python scripts/cycle_costs.json"
+order_effects_filename = "python scripts/order_effects.json"
+precision_tiers_filename = "python scripts/precision_tier_divergence.json"
+quick_classes_filename = "python scripts/quick_classes.json"
+
+# the columns analyze() (and watch()) compare between UUIDs: the values and elapsed times of the math
+# kernels, and of the libm backend, which only the UUIDs collected with --libm have
+analyzed_columns = [
+    'sin_value', 'cos_value', 'e_value', 'log_value', 'cosh_value', 'tan_value',
+    'sin_elapsed', 'cos_elapsed', 'e_elapsed', 'log_elapsed', 'cosh_elapsed', 'tan_elapsed',
+    'sin_libm_value', 'cos_libm_value', 'e_libm_value', 'log_libm_value', 'cosh_libm_value', 'tan_libm_value',
+    'sin_libm_elapsed', 'cos_libm_elapsed', 'e_libm_elapsed', 'log_libm_elapsed', 'cosh_libm_elapsed', 'tan_libm_elapsed'
+]
+
+# compressed collector outputs (e.g. fingerprint_results_<UUID>.csv.gz), and how to open them as a stream
+compressed_openers = {".gz": gzip.open, ".xz": lzma.open}
+
+
+# uuid from filename
+"""
+get the UUID out of a collector output filename, e.g. fingerprint_results_<UUID>.csv or fingerprint_results_<UUID>.csv.xz
+"""
+def uuid_from_filename(filename):
+    return filename.split('_')[-1].split('.')[0]
+
+
+
+# is data file
+"""
+check if filename is a collector output with the given prefix and extension, plain or compressed
+"""
+def is_data_file(filename, prefix, extension):
+    return filename.startswith(prefix) and filename.endswith(
+        tuple([extension] + [extension + suffix for suffix in compressed_openers]))
+
+
+
+# open data file
+"""
+open a collector output for reading as text; compressed files are decompressed as they are read,
+never to a temporary file
+"""
+def open_data_file(directory, filename):
+    opener = compressed_openers.get(os.path.splitext(filename)[1], open)
+    return opener(f"{directory}/{filename}", mode='rt')
+
+
+
+# write json array
+"""
+write a list to a JSON file as an array, one (indented) entry at a time
+"""
+def write_json_array(filename, entries):
+    with open(filename, mode='w') as json_file:
+        json_file.write("[")
+        for index, entry in enumerate(entries):
+            if index > 0:
+                json_file.write(",")
+            json_file.write(json.dumps(entry, indent=4))
+        json_file.write("]")
+
+
+
+# append to json array
+"""
+append entries to the JSON array in filename, without reading or rewriting what is already there
+(the closing "]" is overwritten, and put back after the new entries)
+"""
+def append_to_json_array(filename, entries):
+    if not os.path.exists(filename) or os.path.getsize(filename) == 0:
+        write_json_array(filename, entries)
+        return
+
+    with open(filename, mode='r+b') as json_file:
+        # find the closing bracket, skipping any trailing whitespace
+        position = json_file.seek(0, os.SEEK_END)
+        while position > 0:
+            position -= 1
+            json_file.seek(position)
+            character = json_file.read(1)
+            if not character.isspace():
+                break
+        if character != b"]":
+            raise ValueError(f"{filename} does not end in a JSON array")
+
+        # an empty array gets no leading comma
+        json_file.seek(max(position - 1, 0))
+        empty = json_file.read(1) == b"[" and position > 0
+
+        json_file.seek(position)
+        json_file.truncate()
+        for index, entry in enumerate(entries):
+            if index > 0 or not empty:
+                json_file.write(b",")
+            json_file.write(json.dumps(entry, indent=4).encode())
+        json_file.write(b"]")
+
+
 
 # read txt
 """
@@ -26,7 +133,7 @@ returns array of directories
 def read_txt(directory, filename):
     print(f"Reading {filename}")
 
-    with open(f"{directory}/{filename}", mode='r') as txtfile:
+    with open_data_file(directory, filename) as txtfile:
         reader = txtfile.readlines()
         system_information = {
             'OS Type' : reader[0].split(":")[-1].lower().strip(),
@@ -38,6 +145,12 @@ def read_txt(directory, filename):
             'Script Hash' : reader[6].split(":")[-1].strip("\n").strip(' '),
             'UUID' : reader[7].split(":")[-1].strip("\n").strip(' ')
         }
+
+        # any lines after the fixed ones are optional "Key: Value" settings (e.g. the adaptive seed)
+        for line in reader[8:]:
+            if ':' in line:
+                key, value = line.split(':', 1)
+                system_information[key.strip()] = value.strip()
     return system_information
 
 
@@ -51,10 +164,10 @@ def read_csv(directory, filename):
     print(f"Reading {filename}")
 
     # get uuid from filename 
-    uuid = filename.split('_')[-1].split('.')[0]
+    uuid = uuid_from_filename(filename)
     
     data = []
-    with open(f"{directory}/{filename}", mode='r') as csvfile:
+    with open_data_file(directory, filename) as csvfile:
         reader = csv.DictReader(csvfile)
         for row in reader:
             fingerprint = {
@@ -73,6 +186,10 @@ def read_csv(directory, filename):
                 'tan_value': row['tan_value'],
                 'tan_elapsed': row['tan_elapsed']
             }
+            # the libm backend's columns, when the collector was run with --libm
+            for column, value in row.items():
+                if '_libm_' in column:
+                    fingerprint[column] = value
             data.append(fingerprint)
     return data
 
@@ -92,13 +209,14 @@ def aggregate():
 
     for filename in os.listdir(data_directory):
         # for the CSV files, which hold the fingerprint data
-        if filename.endswith(".csv"):
+        # (other CSV files, like the adaptive samples, have their own readers)
+        if is_data_file(filename, "fingerprint_results_", ".csv"):
             csv_data = read_csv(data_directory, filename)
             aggregate_csv_data.append(csv_data)
           
 
         # for the .txt files, which hold the system data
-        if filename.endswith(".txt"):
+        if is_data_file(filename, "system_info_", ".txt"):
             txt_data = read_txt(data_directory, filename)
             aggregate_txt_data.append(txt_data)
 
@@ -111,33 +229,31 @@ def aggregate():
         os.remove(inconsistant_rows_filename)
 
 
-    # write each line of the aggregate_csv_data 
-    with open(aggregate_fingerprint_data_filename, mode='a') as aggregate_fingerprint_data_file:
-        data_line = json.dumps(aggregate_csv_data[0], indent=4)
-        aggregate_fingerprint_data_file.write("["+data_line+",")
-
-        for line in aggregate_csv_data[1:-2]:
-            #print(f"{line}\n\n")
-            data_line = json.dumps(line, indent=4)
-            aggregate_fingerprint_data_file.write(data_line+",")
+    # write the aggregate files, one JSON list entry per UUID
+    write_json_array(aggregate_fingerprint_data_filename, aggregate_csv_data)
+    write_json_array(aggregate_system_data_filename, aggregate_txt_data)
 
-        data_line = json.dumps(aggregate_csv_data[-1], indent=4)
-        aggregate_fingerprint_data_file.write(data_line+"]")
-            
-
-    # write each line of the aggregate_txt_data
-    with open(aggregate_system_data_filename, mode='a') as aggregate_system_data_file:
-        data_line = json.dumps(aggregate_txt_data[0], indent=4).strip('\n')         
-        aggregate_system_data_file.write('['+data_line+',')
+    return 1
 
-        for line in aggregate_txt_data[1:-2]:
-            data_line = json.dumps(line, indent=4)         
-            aggregate_system_data_file.write(data_line+',')
 
-        data_line = json.dumps(aggregate_txt_data[-1], indent=4)         
-        aggregate_system_data_file.write(data_line+']')
 
-    return 1
+# load unstable cells
+"""
+    read the stability files from the collector's --repeat mode, and return the set of (i, function)
+    cells whose value was not bit-identical over repeated runs on at least one host.
+    a difference between machines in one of these cells does not say anything about the CPU
+"""
+def load_unstable_cells():
+    unstable_cells = set()
+    for filename in os.listdir(data_directory):
+        if is_data_file(filename, "fingerprint_stability_", ".csv"):
+            print(f"Reading {filename}")
+            with open_data_file(data_directory, filename) as csvfile:
+                for row in csv.DictReader(csvfile):
+                    for column, stable in row.items():
+                        if column.endswith('_stable') and stable != '1':
+                            unstable_cells.add((int(row['i']), column[:-len('_stable')] + '_value'))
+    return unstable_cells
 
 
 
@@ -145,7 +261,7 @@ def aggregate():
 """
     analyze the aggregated data files, searching for instances where the recorded values differ
 """
-def analyze():
+def analyze(mask_unstable=True):
     # Load the aggregate data file
     with open(aggregate_fingerprint_data_filename, 'r') as f:
         data = json.load(f)  # List of lists of dicts, one list per UUID
@@ -167,20 +283,22 @@ def analyze():
         grouped[record['i']].append(record)
 
     # For each iteration, check for differing values and elapsed times
-    functions = [
-        'sin_value', 'cos_value', 'e_value', 'log_value',
-        'cosh_value', 'tan_value'
-    ]
-    elapsed_functions = [
-        'sin_elapsed', 'cos_elapsed', 'e_elapsed', 'log_elapsed',
-        'cosh_elapsed', 'tan_elapsed'
-    ]
+    # cells that vary between runs on a single host are left out
+    unstable_cells = load_unstable_cells() if mask_unstable else set()
+    if unstable_cells:
+        print(f"Masking {len(unstable_cells)} cells that are unstable on a single host")
+
     inconsistent_rows = []
     for i, records in grouped.items():
-        for func in functions + elapsed_functions:
+        for func in analyzed_columns:
+            if (i, func) in unstable_cells:
+                continue
             values = {}
             sysinfos = {}
             for rec in records:
+                # only the UUIDs that were collected with the libm backend have its columns
+                if func not in rec:
+                    continue
                 uuid = rec['UUID']
                 values[uuid] = rec.get(func)
                 sysinfos[uuid] = uuid_to_sysinfo.get(uuid, {})
@@ -197,7 +315,125 @@ def analyze():
     with open(inconsistant_rows_filename, "w") as out_f:
         json.dump(inconsistent_rows, out_f, indent=4)
 
-def visualize():
+
+
+# measure ulp errors
+"""
+    compare every UUID's values against the cached high-precision reference values,
+    and record how far (in units in the last place) each CPU is from the true answer
+"""
+def measure_ulp_errors():
+    import numpy as np
+    from fingerprint_reference_values import load_reference_table, ulp_distance
+
+    # Load the aggregate data file
+    with open(aggregate_fingerprint_data_filename, 'r') as f:
+        data = json.load(f)  # List of lists of dicts, one list per UUID
+
+    uuids = [uuid_records[0]['UUID'] for uuid_records in data]
+    iterations = 1 + max(record['i'] for uuid_records in data for record in uuid_records)
+
+    ulp_errors = {uuid: {} for uuid in uuids}
+    for kernel in ['sin', 'cos', 'e', 'log', 'cosh', 'tan']:
+        func = f"{kernel}_value"
+
+        # one row per UUID, one column per iteration; "Overflow" (and anything missing) is NaN
+        measured = np.full((len(uuids), iterations), np.nan)
+        for row, uuid_records in enumerate(data):
+            for record in uuid_records:
+                try:
+                    measured[row, record['i']] = float(record.get(func))
+                except (TypeError, ValueError):
+                    pass
+
+        reference = np.array([np.nan if value is None else value
+                              for value in load_reference_table(kernel, 0, iterations)])
+        distance = ulp_distance(measured, reference[np.newaxis, :])
+
+        # cells where only one side overflowed are a different kind of wrong
+        overflow_mismatch = np.isnan(measured) != np.isnan(reference)[np.newaxis, :]
+
+        for row, uuid in enumerate(uuids):
+            comparable = distance[row] >= 0
+            wrong = np.nonzero(distance[row] > 0)[0]
+            ulp_errors[uuid][func] = {
+                'max_ulp': int(distance[row].max(initial=0)),
+                'mean_ulp': float(distance[row][comparable].mean()) if comparable.any() else 0.0,
+                'incorrect_cells': int(len(wrong)),
+                'overflow_mismatches': int(overflow_mismatch[row].sum()),
+                'errors': {int(i): int(distance[row, i]) for i in wrong}
+            }
+
+    # Export the per-UUID ulp errors to a JSON file
+    with open(ulp_errors_filename, "w") as out_f:
+        json.dump(ulp_errors, out_f, indent=4)
+
+    return ulp_errors
+
+
+
+# compare backends
+"""
+    for every UUID collected with the libm backend, compare it to the math backend:
+    the iterations where the two give different values (Python's own handling, not the CPU),
+    and the median time per call of each (how much of the math timing is interpreter overhead),
+    next to the median cost of a bare ctypes call, which the libm times include
+"""
+def compare_backends():
+    import statistics
+
+    with open(aggregate_fingerprint_data_filename, 'r') as f:
+        data = json.load(f)
+
+    comparison = {}
+    for uuid_records in data:
+        if 'sin_libm_value' not in uuid_records[0]:
+            continue
+        uuid = uuid_records[0]['UUID']
+        comparison[uuid] = {}
+        for kernel in ['sin', 'cos', 'e', 'log', 'cosh', 'tan']:
+            # where math raised (recorded as "Overflow") libm just returns inf/nan, so those are counted apart
+            differing = [record['i'] for record in uuid_records
+                         if record[f"{kernel}_value"] != "Overflow"
+                         and record[f"{kernel}_value"] != record[f"{kernel}_libm_value"]]
+            python_overflows = sum(1 for record in uuid_records
+                                   if record[f"{kernel}_value"] == "Overflow"
+                                   and record[f"{kernel}_libm_value"] != "Overflow")
+            math_times = [float(record[f"{kernel}_elapsed"]) for record in uuid_records
+                          if record[f"{kernel}_elapsed"] != "N/A"]
+            libm_times = [float(record[f"{kernel}_libm_elapsed"]) for record in uuid_records
+                          if record[f"{kernel}_libm_elapsed"] != "N/A"]
+            # older corpora have no baseline column, their libm times are already net of it
+            baseline_times = [float(record[f"{kernel}_libm_baseline"]) for record in uuid_records
+                              if record.get(f"{kernel}_libm_baseline", "N/A") != "N/A"]
+            comparison[uuid][kernel] = {
+                'differing_iterations': differing,
+                'overflow_only_in_math': python_overflows,
+                'math_median_elapsed': statistics.median(math_times) if math_times else None,
+                'libm_median_elapsed': statistics.median(libm_times) if libm_times else None,
+                'libm_median_baseline': statistics.median(baseline_times) if baseline_times else None
+            }
+
+    with open(backend_comparison_filename, "w") as out_f:
+        json.dump(comparison, out_f, indent=4)
+
+    return comparison
+
+
+
+# visualize
+"""
+    plot where the UUIDs differ, one figure per function.
+    with output_directory, the figures are saved there as PNG files instead of shown (no display needed)
+"""
+def visualize(output_directory=None):
+    import matplotlib
+    if output_directory:
+        matplotlib.use("Agg")
+        os.makedirs(output_directory, exist_ok=True)
+    import matplotlib.pyplot as plt
+    import mplcursors
+
     # Load the aggregate data file
     with open(aggregate_fingerprint_data_filename, 'r') as f:
         data = json.load(f)
@@ -230,21 +466,11 @@ def visualize():
 
     for func in functions:
         inconsistencies = []
-        uuids_per_inconsistency = []
         i_vals = []
 
         for i in iterations:
-            records = grouped[i]
-            values = {}
-            for rec in records:
-                values[rec['UUID']] = rec.get(func)
-            unique_vals = set(values.values())
-            if len(unique_vals) > 1:
-                inconsistencies.append(1)
-                uuids_per_inconsistency.append(list(values.keys()))
-            else:
-                inconsistencies.append(0)
-                uuids_per_inconsistency.append([])
+            unique_vals = {rec.get(func) for rec in grouped[i]}
+            inconsistencies.append(1 if len(unique_vals) > 1 else 0)
             i_vals.append(i)
 
         plt.figure(figsize=(12, 8))
@@ -256,15 +482,22 @@ def visualize():
         plt.grid(True)
         plt.tight_layout()
 
+        if output_directory:
+            plt.savefig(f"{output_directory}/{func}.png")
+            plt.close()
+            continue
+
+        # the hovered point's UUIDs are looked up when it is hovered, and the loop variables are bound
+        # now (as defaults), so every figure's callback keeps its own function instead of the last one
         cursor = mplcursors.cursor(scatter, hover=True)
         @cursor.connect("add")
-        def on_add(sel):
+        def on_add(sel, func=func, inconsistencies=inconsistencies, i_vals=i_vals):
             idx = sel.index
             if inconsistencies[idx]:
                 sel.annotation.set_text(
                     f"Iteration: {i_vals[idx]}\n"
                     f"Function: {func}\n"
-                    f"UUIDs: {', '.join(uuids_per_inconsistency[idx])}"
+                    f"UUIDs: {', '.join(rec['UUID'] for rec in grouped[i_vals[idx]])}"
                 )
             else:
                 sel.annotation.set_text(
@@ -273,7 +506,880 @@ def visualize():
                     f"No inconsistency"
                 )
 
-    plt.show()
+    if not output_directory:
+        plt.show()
+
+
+# explore
+"""
+    open the indexed explorer (heatmap -> divergent iterations -> per-UUID values) on the matrix store,
+    building the store and the explorer's indexes first if they are missing or out of date
+"""
+def explore(output_filename=None):
+    from fingerprint_matrix_store import matrix_store_directory
+    from fingerprint_explorer import explorer_index_directory, build_explorer_index, explore as open_explorer
+
+    if matrix_store_is_stale():
+        analyze_out_of_core()
+    index_filename = f"{explorer_index_directory}/classes.json"
+    if (not os.path.exists(index_filename)
+            or os.path.getmtime(index_filename) < os.path.getmtime(f"{matrix_store_directory}/divergence.npy")):
+        build_explorer_index()
+    open_explorer(output_filename=output_filename)
+
+
+
+# export adaptive hints
+"""
+    write, for each kernel, the iterations where CPUs gave differing values,
+    so the collector's adaptive mode can densify its sampling around them (--hints)
+"""
+def export_adaptive_hints():
+    with open(inconsistant_rows_filename, 'r') as f:
+        inconsistent_rows = json.load(f)
+
+    # only the kernels the adaptive mode samples (not the libm backend's columns)
+    kernels = ['sin', 'cos', 'e', 'log', 'cosh', 'tan']
+    hints = {}
+    for row in inconsistent_rows:
+        kernel = row['function'][:-len('_value')]
+        if row['function'].endswith('_value') and kernel in kernels:
+            hints.setdefault(kernel, set()).add(row['iteration'])
+
+    with open(adaptive_hints_filename, "w") as out_f:
+        json.dump({kernel: sorted(iterations) for kernel, iterations in hints.items()}, out_f, indent=4)
+
+
+
+# analyze adaptive
+"""
+    compare the adaptive samples of every UUID. every machine samples the same (seeded) sequence of inputs,
+    so samples line up by (function, t); only the samples every machine got to are compared
+"""
+def analyze_adaptive():
+    from collections import defaultdict
+    samples = defaultdict(dict)  # (function, t) -> {uuid: value}
+
+    for filename in os.listdir(data_directory):
+        if is_data_file(filename, "fingerprint_adaptive_", ".csv"):
+            print(f"Reading {filename}")
+            uuid = uuid_from_filename(filename)
+            with open_data_file(data_directory, filename) as csvfile:
+                for row in csv.DictReader(csvfile):
+                    samples[(row['function'], row['t'])][uuid] = row['value']
+
+    uuids = set()
+    for values in samples.values():
+        uuids.update(values.keys())
+
+    inconsistent_rows = []
+    for (func, t), values in samples.items():
+        if len(values) == len(uuids) and len(set(values.values())) > 1:
+            inconsistent_rows.append({
+                'function': func,
+                't': float(t),
+                'values': values
+            })
+    inconsistent_rows.sort(key=lambda row: (row['function'], row['t']))
+
+    with open(adaptive_inconsistent_rows_filename, "w") as out_f:
+        json.dump(inconsistent_rows, out_f, indent=4)
+
+    return inconsistent_rows
+
+
+
+# analyze interference
+"""
+    for every UUID collected with co-runners, the median slowdown of each kernel under each co-runner
+    workload, relative to the same cells timed without one (e.g. 1.3 = 30% slower).
+    runs where the co-runner shared the measuring cpu (single cpu hosts, before the collector refused them)
+    measured time slicing, not interference, and are left out
+"""
+def analyze_interference():
+    import statistics
+    operations = ['sin', 'cos', 'e', 'log', 'cosh', 'tan']
+
+    slowdowns = {}
+    for filename in sorted(os.listdir(data_directory)):
+        if is_data_file(filename, "fingerprint_interference_", ".csv"):
+            print(f"Reading {filename}")
+            uuid = uuid_from_filename(filename)
+            timings = {}  # condition -> {(operation, i): elapsed}
+            with open_data_file(data_directory, filename) as csvfile:
+                for row in csv.DictReader(csvfile):
+                    for operation in operations:
+                        elapsed = row[f"{operation}_elapsed"]
+                        if elapsed not in ("N/A", ""):
+                            timings.setdefault(row['condition'], {})[(operation, int(row['i']))] = float(elapsed)
+
+            system_info_filenames = [name for name in os.listdir(data_directory)
+                                     if is_data_file(name, f"system_info_{uuid}", ".txt")]
+            system_info = read_txt(data_directory, system_info_filenames[0]) if system_info_filenames else {}
+            measure_cpu, _, co_runner_cpus = system_info.get('Interference CPUs', '').partition("/")
+            if measure_cpu.isdigit() and measure_cpu in co_runner_cpus.split(","):
+                print(f"{uuid}: the co-runner shared the measuring cpu {measure_cpu}, skipping")
+                continue
+            baseline = timings.get('none', {})
+            slowdowns[uuid] = {
+                'placement': system_info.get('Interference Placement', 'unknown'),
+                'cpus': system_info.get('Interference CPUs', 'unknown'),
+                'conditions': {}
+            }
+            for condition, cells in timings.items():
+                if condition == 'none':
+                    continue
+                slowdowns[uuid]['conditions'][condition] = {}
+                for operation in operations:
+                    ratios = [elapsed / baseline[cell] for cell, elapsed in cells.items()
+                              if cell[0] == operation and baseline.get(cell)]
+                    slowdowns[uuid]['conditions'][condition][operation] = (statistics.median(ratios)
+                                                                           if ratios else None)
+
+    with open(interference_filename, "w") as out_f:
+        json.dump(slowdowns, out_f, indent=4)
+
+    return slowdowns
+
+
+
+# analyze probes
+"""
+    contrast the operand classes (normal, subnormal, zero, inf, NaN) of the special operand probes, per UUID:
+    the median time per call of each operation for each class, and how much slower subnormal operands are
+    than normal ones (the probe times include the Python call, which is the same for every operand of an
+    operation, so only differences between the classes of one operation are reported, never a time on its own).
+    also lists the probes where UUIDs returned different values (e.g. a subnormal flushed to zero)
+"""
+def analyze_probes():
+    import statistics
+
+    timings = {}  # uuid -> operation -> operand class -> [elapsed, ...]
+    values = {}   # (operation, operand) -> {uuid: value}
+    for filename in sorted(os.listdir(data_directory)):
+        if is_data_file(filename, "fingerprint_probes_", ".csv"):
+            print(f"Reading {filename}")
+            uuid = uuid_from_filename(filename)
+            with open_data_file(data_directory, filename) as csvfile:
+                for row in csv.DictReader(csvfile):
+                    values.setdefault((row['operation'], row['operand']), {})[uuid] = row['value']
+                    if row['elapsed'] not in ("N/A", ""):
+                        (timings.setdefault(uuid, {}).setdefault(row['operation'], {})
+                         .setdefault(row['operand_class'], []).append(float(row['elapsed'])))
+
+    operand_classes = {}
+    for uuid, operations in timings.items():
+        operand_classes[uuid] = {}
+        for operation, classes in operations.items():
+            medians = {operand_class: statistics.median(elapsed) for operand_class, elapsed in classes.items()}
+            operand_classes[uuid][operation] = {
+                'median_elapsed': medians,
+                'subnormal_penalty': (medians['subnormal'] - medians['normal']
+                                      if 'subnormal' in medians and 'normal' in medians else None)
+            }
+
+    value_differences = [{'operation': operation, 'operand': operand, 'values': by_uuid}
+                         for (operation, operand), by_uuid in sorted(values.items())
+                         if len(set(by_uuid.values())) > 1]
+
+    with open(operand_classes_filename, "w") as out_f:
+        json.dump({'uuids': operand_classes, 'value_differences': value_differences}, out_f, indent=4)
+
+    for uuid, operations in operand_classes.items():
+        penalties = ", ".join(f"{operation} {result['subnormal_penalty'] * 1e9:+.1f} ns"
+                              for operation, result in operations.items() if result['subnormal_penalty'] is not None)
+        print(f"{uuid} subnormal penalty: {penalties}")
+
+    return operand_classes, value_differences
+
+
+
+# schedule positions
+"""
+    rebuild the order a UUID's cells ran in, from the schedule and seed in its system info
+    (runs from before the scheduler were interleaved), and check it against the recorded digest.
+    returns the position of every cell number (i * 6 + function) in that order, and the order itself,
+    or None if the rebuilt order does not match the one that ran
+"""
+def schedule_positions(system_info, iterations):
+    import fingerprinting
+    mode = system_info.get('Schedule', 'interleaved')
+    seed = int(system_info.get('Schedule Seed', fingerprinting.schedule_seed))
+    order = fingerprinting.execution_order(iterations, mode, seed)
+
+    digest = system_info.get('Schedule Digest')
+    if digest is not None and fingerprinting.order_digest(order) != digest:
+        print(f"{system_info.get('UUID', 'unknown')}: schedule digest does not match, skipping")
+        return None
+
+    positions = [0] * len(order)
+    for position, cell in enumerate(order):
+        positions[cell] = position
+    return positions, order
+
+
+
+# analyze cycles
+"""
+    normalize every UUID's elapsed times by the core frequency sampled for its timing block, so timings
+    from machines (or moments) with different clocks can be compared:
+        cycles      - elapsed seconds x scaling_cur_freq, where the collector could read cpufreq
+        loop units  - elapsed seconds x busy-loop rate, for every UUID (the cost in busy-loop iterations)
+    per function, the medians of both, and each UUID's loop-unit cost relative to the corpus median
+"""
+def analyze_cycles():
+    import bisect
+    import statistics
+    functions = ['sin', 'cos', 'e', 'log', 'cosh', 'tan']
+
+    filenames = os.listdir(data_directory)
+    cycle_costs = {}
+    for filename in sorted(filenames):
+        if not is_data_file(filename, "fingerprint_frequency_", ".csv"):
+            continue
+        print(f"Reading {filename}")
+        uuid = uuid_from_filename(filename)
+        with open_data_file(data_directory, filename) as csvfile:
+            blocks = list(csv.DictReader(csvfile))
+        results_filenames = [name for name in filenames if is_data_file(name, f"fingerprint_results_{uuid}", ".csv")]
+        if not blocks or not results_filenames:
+            continue
+        block_starts = [int(block['block_start']) for block in blocks]
+        records = read_csv(data_directory, results_filenames[0])
+        system_info_filenames = [name for name in filenames if is_data_file(name, f"system_info_{uuid}", ".txt")]
+        system_info = read_txt(data_directory, system_info_filenames[0]) if system_info_filenames else {}
+        schedule = schedule_positions(system_info, len(records))
+        if schedule is None:
+            continue
+        positions = schedule[0]
+
+        cycles = {func: [] for func in functions}
+        loop_units = {func: [] for func in functions}
+        for record in records:
+            for f, func in enumerate(functions):
+                elapsed = record[f"{func}_elapsed"]
+                if elapsed in ("N/A", "", None):
+                    continue
+                # blocks are counted in rows' worth of cells of the execution order (i, when interleaved)
+                row = positions[record['i'] * len(functions) + f] // len(functions)
+                block = blocks[max(bisect.bisect_right(block_starts, row) - 1, 0)]
+                loop_units[func].append(float(elapsed) * float(block['loop_rate']))
+                if block['frequency_hz'] not in ("N/A", ""):
+                    cycles[func].append(float(elapsed) * float(block['frequency_hz']))
+
+        frequencies = [float(block['frequency_hz']) for block in blocks if block['frequency_hz'] not in ("N/A", "")]
+        loop_rates = [float(block['loop_rate']) for block in blocks]
+        cycle_costs[uuid] = {
+            'source': blocks[0]['source'],
+            'frequency_hz': [min(frequencies), max(frequencies)] if frequencies else None,
+            'loop_rate': [min(loop_rates), max(loop_rates)],
+            'functions': {func: {
+                'median_cycles': statistics.median(cycles[func]) if cycles[func] else None,
+                'median_loop_units': statistics.median(loop_units[func]) if loop_units[func] else None
+            } for func in functions}
+        }
+
+    # how each UUID's cost compares with the rest of the corpus, per function
+    for func in functions:
+        costs = [entry['functions'][func]['median_loop_units'] for entry in cycle_costs.values()
+                 if entry['functions'][func]['median_loop_units']]
+        corpus_median = statistics.median(costs) if costs else None
+        for entry in cycle_costs.values():
+            cost = entry['functions'][func]['median_loop_units']
+            entry['functions'][func]['relative_cost'] = cost / corpus_median if cost and corpus_median else None
+
+    with open(cycle_costs_filename, "w") as out_f:
+        json.dump(cycle_costs, out_f, indent=4)
+
+    return cycle_costs
+
+
+
+# analyze order effects
+"""
+    check whether the execution order left a mark on the timings, per UUID and function:
+        deciles        - the median elapsed time in each tenth of the timed cells (by position in the execution order),
+                         with the ratio of the last measured tenth to the first (warm-up, thermal drift) and the spread
+        after_same / after_other  - the median elapsed time when the previous cell ran the same function
+                         or a different one (cache and branch predictor state carried over between cells)
+    blocked runs show drift as differences between functions, interleaved runs cannot separate
+    after_same from after_other, and seeded-random runs separate both
+"""
+def analyze_order_effects():
+    import bisect
+    import statistics
+    functions = ['sin', 'cos', 'e', 'log', 'cosh', 'tan']
+
+    filenames = os.listdir(data_directory)
+    order_effects = {}
+    for filename in sorted(filenames):
+        if not is_data_file(filename, "fingerprint_results_", ".csv"):
+            continue
+        uuid = uuid_from_filename(filename)
+        system_info_filenames = [name for name in filenames if is_data_file(name, f"system_info_{uuid}", ".txt")]
+        if not system_info_filenames:
+            continue
+        system_info = read_txt(data_directory, system_info_filenames[0])
+        records = read_csv(data_directory, filename)
+        schedule = schedule_positions(system_info, len(records))
+        if schedule is None:
+            continue
+        positions, order = schedule
+
+        # the positions of the timed cells (overflowed cells take no time), so the tenths are tenths of the timed run
+        timed = sorted(positions[record['i'] * len(functions) + f] for record in records
+                       for f, func in enumerate(functions) if record[f"{func}_elapsed"] not in ("N/A", "", None))
+
+        order_effects[uuid] = {
+            'schedule': system_info.get('Schedule', 'interleaved'),
+            'seed': system_info.get('Schedule Seed'),
+            'functions': {}
+        }
+        for f, func in enumerate(functions):
+            deciles = [[] for _ in range(10)]
+            after_same, after_other = [], []
+            for record in records:
+                elapsed = record[f"{func}_elapsed"]
+                if elapsed in ("N/A", "", None):
+                    continue
+                position = positions[record['i'] * len(functions) + f]
+                deciles[bisect.bisect_left(timed, position) * 10 // len(timed)].append(float(elapsed))
+                if position:
+                    previous = order[position - 1] % len(functions)
+                    (after_same if previous == f else after_other).append(float(elapsed))
+
+            medians = [statistics.median(decile) if decile else None for decile in deciles]
+            measured = [median for median in medians if median is not None]
+            order_effects[uuid]['functions'][func] = {
+                'decile_medians': medians,
+                'last_to_first': measured[-1] / measured[0] if len(measured) > 1 and measured[0] else None,
+                'spread': ((max(measured) - min(measured)) / statistics.median(measured)
+                           if measured and statistics.median(measured) else None),
+                'after_same': statistics.median(after_same) if after_same else None,
+                'after_other': statistics.median(after_other) if after_other else None
+            }
+
+    with open(order_effects_filename, "w") as out_f:
+        json.dump(order_effects, out_f, indent=4)
+
+    for uuid, entry in order_effects.items():
+        drift = ", ".join(f"{func} {result['last_to_first']:.2f}x" for func, result in entry['functions'].items()
+                          if result['last_to_first'] is not None)
+        print(f"{uuid} ({entry['schedule']}) last/first tenth: {drift}")
+
+    return order_effects
+
+
+
+# analyze precision tiers
+"""
+    find where UUIDs diverge at each precision tier (float32, float64, longdouble), comparing the values as
+    numbers of the tier itself rather than as text: two cells agree when they are equal and have the same sign
+    (so -0.0 and 0.0 differ), or when both overflowed.
+    longdouble is a different format on different systems, so it is only compared between UUIDs whose long
+    double has the same number of mantissa bits (e.g. "longdouble/63" for x87 extended precision).
+    per tier and operation: the iteration ranges that diverge, and the widest spread in ULPs of the tier
+"""
+def analyze_precision_tiers():
+    functions = ['sin', 'cos', 'e', 'log', 'cosh', 'tan']
+
+    filenames = os.listdir(data_directory)
+    tiers = {}  # tier key -> {uuid: {function: [value text, ...]}}
+    for filename in sorted(filenames):
+        if not is_data_file(filename, "fingerprint_precision_", ".csv"):
+            continue
+        print(f"Reading {filename}")
+        uuid = uuid_from_filename(filename)
+        system_info_filenames = [name for name in filenames if is_data_file(name, f"system_info_{uuid}", ".txt")]
+        system_info = read_txt(data_directory, system_info_filenames[0]) if system_info_filenames else {}
+        with open_data_file(data_directory, filename) as csvfile:
+            for row in csv.DictReader(csvfile):
+                tier = row['tier']
+                if tier == 'longdouble':
+                    tier = f"longdouble/{system_info.get('Long Double Mantissa Bits', 'unknown')}"
+                cells = tiers.setdefault(tier, {}).setdefault(uuid, {func: [] for func in functions})
+                for func in functions:
+                    cells[func].append(row[f"{func}_value"])
+
+    # numpy is only needed to compare the tiers, so a corpus without them is analyzed without it
+    if tiers:
+        import numpy as np
+        from fingerprint_group_by import compact_ranges
+
+    precision_tiers = {}
+    for tier, uuids in sorted(tiers.items()):
+        dtype = np.dtype(tier.split("/")[0])
+        precision_tiers[tier] = {'uuids': sorted(uuids), 'functions': {}}
+        if tier.startswith("longdouble/") and tier != f"longdouble/{np.finfo(np.longdouble).nmant}":
+            # parsed into this machine's long double, so the last bits of a wider format can be lost
+            precision_tiers[tier]['rounded_to'] = f"longdouble/{np.finfo(np.longdouble).nmant}"
+
+        for func in functions:
+            iterations = min(len(cells[func]) for cells in uuids.values())
+            texts = [uuids[uuid][func][:iterations] for uuid in precision_tiers[tier]['uuids']]
+            overflow = np.array([[text == "Overflow" for text in row] for row in texts], dtype=bool)
+            values = np.array([[text if text != "Overflow" else "nan" for text in row] for row in texts], dtype=dtype)
+
+            agree = (((values == values[0]) & (np.signbit(values) == np.signbit(values[0])))
+                     | (overflow & overflow[0]))
+            divergent = ~agree.all(axis=0) if len(texts) else np.zeros(0, dtype=bool)
+
+            max_ulp_spread = 0.0
+            comparable = divergent & ~overflow.any(axis=0)
+            if comparable.any():
+                low, high = values[:, comparable].min(axis=0), values[:, comparable].max(axis=0)
+                spacing = np.spacing(np.maximum(np.abs(low), np.abs(high)))
+                max_ulp_spread = float(((high - low) / spacing).max())
+
+            precision_tiers[tier]['functions'][func] = {
+                'divergent': compact_ranges(np.nonzero(divergent)[0]),
+                'divergent_count': int(divergent.sum()),
+                'max_ulp_spread': max_ulp_spread
+            }
+
+    with open(precision_tiers_filename, "w") as out_f:
+        json.dump(precision_tiers, out_f, indent=4)
+
+    for tier, result in precision_tiers.items():
+        counts = ", ".join(f"{func} {entry['divergent_count']}" for func, entry in result['functions'].items())
+        print(f"{tier} ({len(result['uuids'])} UUIDs) divergent cells: {counts}")
+
+    return precision_tiers
+
+
+
+# export probe manifest
+"""
+    derive the smallest set of cells that separates the equivalence classes of the matrix store, for the
+    collector's --quick mode (building and analyzing the store first, if needed)
+"""
+def export_probe_manifest():
+    from fingerprint_probe_manifest import build_probe_manifest
+
+    if matrix_store_is_stale():
+        analyze_out_of_core()
+    return build_probe_manifest()
+
+
+
+# classify quick
+"""
+    match every quick fingerprint (fingerprint_quick_<UUID>.csv) against the classes of the probe manifest.
+    a quick fingerprint taken with an older manifest is matched on the probes both have in common
+"""
+def classify_quick():
+    from fingerprint_probe_manifest import probe_manifest_filename, classify_probes
+    if not os.path.exists(probe_manifest_filename):
+        return {}
+    with open(probe_manifest_filename, "r") as f:
+        probe_manifest = json.load(f)
+
+    quick_classes = {}
+    for filename in sorted(os.listdir(data_directory)):
+        if is_data_file(filename, "fingerprint_quick_", ".csv"):
+            print(f"Reading {filename}")
+            with open_data_file(data_directory, filename) as csvfile:
+                values = {(row['function'], int(row['i'])): row['value'] for row in csv.DictReader(csvfile)}
+            match = classify_probes(probe_manifest, [values.get((probe['function'], probe['i']))
+                                                     for probe in probe_manifest['probes']])
+            quick_classes[uuid_from_filename(filename)] = {
+                'class': match,
+                'members': probe_manifest['classes'][match]['members'] if match is not None else []
+            }
+
+    with open(quick_classes_filename, "w") as out_f:
+        json.dump(quick_classes, out_f, indent=4)
+
+    return quick_classes
+
+
+
+# read pair
+"""
+    read and check one UUID's fingerprint_results/system_info pair for the watch.
+    raises ValueError (or whatever the readers raise) for a pair that cannot be ingested
+"""
+def read_pair(pair):
+    records = read_csv(data_directory, pair['csv'])
+    system_information = read_txt(data_directory, pair['txt'])
+    if not records:
+        raise ValueError(f"{pair['csv']} has no rows")
+    if system_information['UUID'] != records[0]['UUID']:
+        raise ValueError(f"{pair['txt']} is for UUID {system_information['UUID']}, not {records[0]['UUID']}")
+    return records, system_information
+
+
+
+# ingest records
+"""
+    add one UUID's records to the watch state: (i, function) -> {value: set of UUIDs},
+    and mark the cells it touched, so only those rows of the results are serialized again
+"""
+def ingest_records(watch_state, records, unstable_cells):
+    for record in records:
+        for func in analyzed_columns:
+            # like analyze(), only the UUIDs that have a column are compared on it
+            if (record['i'], func) in unstable_cells or func not in record:
+                continue
+            cell = watch_state['cells'].setdefault((record['i'], func), {})
+            cell.setdefault(record.get(func), set()).add(record['UUID'])
+            watch_state['touched'].setdefault((record['i'], func), set()).add(record['UUID'])
+    watch_state['ingested'].add(records[0]['UUID'])
+
+
+
+# write watch results
+"""
+    write the divergence results (same format as analyze()) and the status file from the watch state.
+    each inconsistent row is kept serialized, as its 'values' and 'system_info' entries: a new UUID only
+    serializes its own entries in the rows it touched (and the rows it made inconsistent, in full).
+    both files are written to a temporary file first, so readers never see half a file
+"""
+def write_watch_results(watch_state, write_inconsistent_rows=True):
+    if write_inconsistent_rows:
+        rows = watch_state['rows']
+        for (i, func), uuids in watch_state['touched'].items():
+            cell = watch_state['cells'][(i, func)]
+            if len(cell) < 2:
+                continue
+            if (i, func) not in rows:
+                rows[(i, func)] = ([], [])
+                uuids = set().union(*cell.values())
+            value_of = {uuid: value for value, members in cell.items() for uuid in members}
+            for uuid in sorted(uuids):
+                rows[(i, func)][0].append(f"{json.dumps(uuid)}: {json.dumps(value_of[uuid])}")
+                rows[(i, func)][1].append(f"{json.dumps(uuid)}: {json.dumps(watch_state['sysinfo'].get(uuid, {}))}")
+        watch_state['touched'] = {}
+
+        with open(inconsistant_rows_filename + ".tmp", "w") as out_f:
+            out_f.write("[\n" + ",\n".join(
+                f'{{"iteration": {i}, "function": {json.dumps(func)}, '
+                f'"values": {{{", ".join(rows[(i, func)][0])}}}, "system_info": {{{", ".join(rows[(i, func)][1])}}}}}'
+                for i, func in sorted(rows)) + "\n]")
+        os.replace(inconsistant_rows_filename + ".tmp", inconsistant_rows_filename)
+        watch_state['inconsistent_cells'] = len(rows)
+
+    with open(watch_status_filename + ".tmp", "w") as out_f:
+        json.dump({
+            'updated': time.strftime("%Y-%m-%d %H:%M:%S"),
+            'ingested_uuids': len(watch_state['ingested']),
+            'last_ingested': watch_state['last_ingested'],
+            'inconsistent_cells': watch_state.get('inconsistent_cells', 0),
+            'waiting_for_pair': sorted(watch_state['waiting_for_pair']),
+            'skipped': {uuid: reason for uuid, (_, reason) in sorted(watch_state['skipped'].items())}
+        }, out_f, indent=4)
+    os.replace(watch_status_filename + ".tmp", watch_status_filename)
+
+
+
+# watch
+"""
+    keep running, polling the data directory for new fingerprint_results/system_info pairs.
+    a pair is ingested once both files are there and neither has changed size since the last poll
+    (so half-copied files are not read). each new UUID is checked, then appended to the aggregate files and
+    folded into the divergence results, without re-reading anything that was already ingested.
+    a pair that cannot be read is logged and skipped until one of its files changes
+"""
+def watch(poll_interval=2.0):
+    unstable_cells = load_unstable_cells()
+    watch_state = {'cells': {}, 'touched': {}, 'rows': {}, 'ingested': set(), 'sysinfo': {},
+                   'last_ingested': [], 'waiting_for_pair': set(), 'skipped': {}}
+
+    # pick up where the last aggregate (or watch) left off, once, at startup
+    if os.path.exists(aggregate_fingerprint_data_filename) and os.path.exists(aggregate_system_data_filename):
+        print("Loading the existing aggregate files...")
+        with open(aggregate_system_data_filename, 'r') as sys_f:
+            watch_state['sysinfo'] = {entry['UUID']: entry for entry in json.load(sys_f)}
+        with open(aggregate_fingerprint_data_filename, 'r') as f:
+            for uuid_records in json.load(f):
+                ingest_records(watch_state, uuid_records, unstable_cells)
+    else:
+        write_json_array(aggregate_fingerprint_data_filename, [])
+        write_json_array(aggregate_system_data_filename, [])
+    write_watch_results(watch_state)
+
+    print(f"Watching {data_directory} for new results (Ctrl+C to stop)...")
+    last_seen = {}
+    try:
+        while True:
+            # what is in the directory now, and how big is it
+            seen = {}
+            for entry in os.scandir(data_directory):
+                if entry.is_file():
+                    seen[entry.name] = (entry.stat().st_size, entry.stat().st_mtime)
+
+            # files that have not changed since the last poll, by UUID
+            settled = {}
+            for filename, size in seen.items():
+                if last_seen.get(filename) == size:
+                    if is_data_file(filename, "fingerprint_results_", ".csv"):
+                        settled.setdefault(uuid_from_filename(filename), {})['csv'] = filename
+                    elif is_data_file(filename, "system_info_", ".txt"):
+                        settled.setdefault(uuid_from_filename(filename), {})['txt'] = filename
+            last_seen = seen
+
+            new_uuids = []
+            watch_state['waiting_for_pair'] = set()
+            for uuid, pair in settled.items():
+                if uuid in watch_state['ingested']:
+                    continue
+                if 'csv' not in pair or 'txt' not in pair:
+                    watch_state['waiting_for_pair'].add(uuid)
+                    continue
+
+                # the (size, mtime) of both files, so a skipped pair is retried once it is replaced
+                version = (seen[pair['csv']], seen[pair['txt']])
+                if watch_state['skipped'].get(uuid, (None,))[0] == version:
+                    continue
+                try:
+                    records, system_information = read_pair(pair)
+                except Exception as error:
+                    print(f"Skipping {uuid}: {error!r}")
+                    watch_state['skipped'][uuid] = (version, repr(error))
+                    continue
+                watch_state['skipped'].pop(uuid, None)
+
+                append_to_json_array(aggregate_fingerprint_data_filename, [records])
+                append_to_json_array(aggregate_system_data_filename, [system_information])
+                watch_state['sysinfo'][uuid] = system_information
+                ingest_records(watch_state, records, unstable_cells)
+                new_uuids.append(uuid)
+
+            if new_uuids:
+                print(f"Ingested {len(new_uuids)} new UUID(s): {', '.join(new_uuids)}")
+                watch_state['last_ingested'] = new_uuids
+            write_watch_results(watch_state, write_inconsistent_rows=bool(new_uuids))
+
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+
+
+
+# analyze out of core
+"""
+    analyze a corpus that does not fit in memory: stream the csv files into memory-mapped
+    (UUID x i) matrices, then analyze them in i-range chunks that fit in memory_budget bytes
+    (on `workers` processes, if more than one)
+"""
+def analyze_out_of_core(memory_budget=256 * 1024**2, workers=1):
+    from fingerprint_matrix_store import build_matrix_store, analyze_matrix_store
+
+    print(f"Building the matrix store...")
+    build_matrix_store(data_directory, read_csv, is_data_file, unstable_cells=load_unstable_cells())
+
+    print(f"Analyzing the matrix store...")
+    return analyze_matrix_store(memory_budget=memory_budget, workers=workers)
+
+
+
+# matrix store is stale
+"""
+    True if the matrix store has not been analyzed yet, or is older than the data directory: than its newest
+    results or stability file, or than the directory itself (which changes when a file is removed)
+"""
+def matrix_store_is_stale():
+    from fingerprint_matrix_store import matrix_store_directory
+
+    divergence_filename = f"{matrix_store_directory}/divergence.npy"
+    if not os.path.exists(divergence_filename):
+        return True
+    newest = max([os.path.getmtime(data_directory)] +
+                 [os.path.getmtime(f"{data_directory}/{filename}") for filename in os.listdir(data_directory)
+                  if is_data_file(filename, "fingerprint_results_", ".csv")
+                  or is_data_file(filename, "fingerprint_stability_", ".csv")])
+    return os.path.getmtime(divergence_filename) < newest
+
+
+
+# read system data
+"""
+    read the system info of every UUID straight from the data directory
+    (with 'Submitted', when the run was collected, or else when the file was written,
+    to order submissions from the same host)
+"""
+def read_system_data():
+    import calendar
+    system_data = []
+    for filename in sorted(os.listdir(data_directory)):
+        if is_data_file(filename, "system_info_", ".txt"):
+            system_information = read_txt(data_directory, filename)
+            if 'Collected (UTC)' in system_information:
+                system_information['Submitted'] = calendar.timegm(
+                    time.strptime(system_information['Collected (UTC)'], "%Y-%m-%d %H:%M:%S"))
+            else:
+                system_information['Submitted'] = os.path.getmtime(f"{data_directory}/{filename}")
+            system_data.append(system_information)
+    return system_data
+
+
+
+# build query index
+"""
+    build the SQLite query index over the divergent cells of the matrix store
+    (building and analyzing the store first, if it is missing or older than the data)
+"""
+def build_query_index(include_elapsed=False):
+    from fingerprint_query import build_query_index as build_index
+
+    if matrix_store_is_stale():
+        analyze_out_of_core()
+
+    print(f"Building the query index...")
+    build_index(read_system_data(), include_elapsed=include_elapsed)
+
+
+
+# query index is stale
+"""
+    true if the query index is missing, or older than the matrix store, or the store itself is stale
+    (an index with no data directory to rebuild it from is used as it is)
+"""
+def query_index_is_stale():
+    from fingerprint_matrix_store import matrix_store_directory
+    from fingerprint_query import query_index_filename
+
+    if not os.path.exists(query_index_filename):
+        return True
+    if not os.path.isdir(data_directory):
+        return False
+    if matrix_store_is_stale():
+        return True
+    return os.path.getmtime(query_index_filename) < os.path.getmtime(f"{matrix_store_directory}/divergence.npy")
+
+
+
+# print query
+"""
+    run a query against the index and print one line per divergent cell,
+    with the requested system info fields for each UUID (building the index first, if it is missing or out of date)
+"""
+def print_query(function=None, i_range=None, uuid=None, where=None, show=("CPU Info",)):
+    from fingerprint_query import query
+
+    if query_index_is_stale():
+        if not os.path.isdir(data_directory):
+            print(f"There is no query index, and no {data_directory} directory to build one from")
+            return None
+        build_query_index()
+
+    rows = query(function, i_range, uuid, where)
+    for row in rows:
+        fields = "  ".join(f"{field}: {row['system_info'].get(field, '?')}" for field in show)
+        print(f"{row['function']:<13} i={row['i']:<6} {row['uuid']}  {row['value']:<24}  {fields}")
+    print(f"{len(rows)} divergent cells, {len({row['uuid'] for row in rows})} UUIDs")
+    return rows
+
+
+
+# analyze stage
+"""
+    everything that runs on the aggregate files, without plotting
+"""
+def analyze_stage():
+    print(f"Analyzing aggregated data file...")
+    analyze()
+
+    compare_backends()
+    # the hints are what focus the first adaptive run, so they are always written;
+    # the adaptive samples are only there once someone has run the collector's --adaptive mode
+    export_adaptive_hints()
+    if any(is_data_file(filename, "fingerprint_adaptive_", ".csv") for filename in os.listdir(data_directory)):
+        analyze_adaptive()
+    analyze_interference()
+    analyze_probes()
+    analyze_cycles()
+    analyze_order_effects()
+    analyze_precision_tiers()
+    classify_quick()
+
+
+
+# group divergence
+"""
+    roll the divergence, ULP and timing results of the matrix store up by system info fields,
+    and print the per-group table (building and analyzing the store first, if needed)
+"""
+def group_divergence(fields):
+    from fingerprint_group_by import group_by, format_group_table
+
+    if matrix_store_is_stale():
+        analyze_out_of_core()
+
+    table = group_by(read_system_data(), fields)
+    print(format_group_table(table))
+    return table
+
+
+
+# snapshot
+"""
+    freeze the current matrix store as a named baseline (building and analyzing the store first, if needed)
+"""
+def snapshot(name):
+    from fingerprint_snapshots import take_snapshot
+
+    if matrix_store_is_stale():
+        analyze_out_of_core()
+    take_snapshot(name, read_system_data())
+
+
+
+# host drift
+"""
+    bring the drift store up to date with the data directory, then print how one host drifted over its runs
+    (`host` is a host id, or the UUID of any of its runs); with no host, list the hosts and their runs
+"""
+def host_drift(host=None):
+    from fingerprint_drift_store import drift_store_directory, update_drift_store, load_runs
+    from fingerprint_drift_store import host_drift as drift_of_host
+
+    system_data = read_system_data()
+    added = update_drift_store(data_directory, read_csv, is_data_file, system_data)
+    print(f"{added} new runs in the drift store")
+
+    if host is None:
+        hosts = sorted(os.listdir(drift_store_directory)) if os.path.exists(drift_store_directory) else []
+        for stored_host in hosts:
+            runs = load_runs(f"{drift_store_directory}/{stored_host}")
+            print(f"{stored_host}: {len(runs)} runs, {', '.join(run['uuid'] for run in runs)}")
+        return hosts
+
+    host = next((entry['Host ID'] for entry in system_data if entry['UUID'] == host and entry.get('Host ID')), host)
+    drift = drift_of_host(host)
+    if drift['hostname_fallback']:
+        print(f"Host {host}: the host id was derived from the host name, not from a machine identifier, "
+              f"so these runs may come from different machines with the same name")
+    for transition in drift['transitions']:
+        changed = sum(len(cells) for cells in transition['changed_values'].values())
+        shifted = sum(transition['timing_shifts'].values())
+        updates = ", ".join(f"{field}: {before} -> {after}"
+                            for field, (before, after) in transition['system_info_changes'].items())
+        print(f"{transition['before']} -> {transition['after']}: {changed} changed values, "
+              f"{shifted} timing shifts{f' ({updates})' if updates else ''}")
+    return drift
+
+
+
+# print diff
+"""
+    print a summary of a snapshot (or host) diff
+"""
+def print_diff(diff):
+    for key in ['added_uuids', 'removed_uuids']:
+        if diff.get(key):
+            print(f"{key.replace('_', ' ')}: {', '.join(diff[key])}")
+    for key in ['changed_values', 'timing_shifts']:
+        cells = diff[key]
+        if isinstance(cells, dict):
+            for uuid, deltas in cells.items():
+                print(f"{uuid}: {len(deltas)} {key.replace('_', ' ')}")
+        else:
+            print(f"{len(cells)} {key.replace('_', ' ')}")
+    for key in ['new_divergences', 'resolved_divergences']:
+        for column, iterations in diff.get(key, {}).items():
+            print(f"{key.replace('_', ' ')} on {column}: {len(iterations)} iterations")
+
 
 
 # main function
@@ -284,8 +1390,7 @@ def main_function():
     print(f"Aggregating data files...")
     aggregate()
 
-    print(f"Analyzing aggregated data file...")
-    analyze()
+    analyze_stage()
     
     print(f"Generating visualization...")
     visualize()
@@ -296,4 +1401,107 @@ def main_function():
 
 
 if __name__ == "__main__":
-    main_function()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="aggregate, analyze and visualize CPU fingerprint data")
+    subcommands = parser.add_subparsers(dest="command",
+                                        help="run one stage on its own (with no subcommand, aggregate, analyze and render all run)")
+
+    subcommands.add_parser("aggregate", help="combine the data files into the aggregate files")
+    subcommands.add_parser("analyze", help="find inconsistencies in the aggregate files")
+    subcommands.add_parser("ulp", help="measure every UUID's error in ULPs against the high-precision reference values")
+    render_parser = subcommands.add_parser("render", help="plot the inconsistencies in the aggregate files")
+    render_parser.add_argument("--output", metavar="DIRECTORY",
+                               help="save the figures as PNG files in this directory, instead of showing them")
+
+    explore_parser = subcommands.add_parser("explore", help="browse the divergence of a large corpus interactively")
+    explore_parser.add_argument("--output", metavar="FILE",
+                                help="save the heatmap as a PNG file, instead of opening the explorer")
+
+    subcommands.add_parser("watch", help="keep ingesting new results as they arrive in the data directory")
+
+    out_of_core_parser = subcommands.add_parser("out-of-core", help="analyze a corpus too large for memory")
+    out_of_core_parser.add_argument("memory_budget", nargs="?", type=int, default=256,
+                                    help="memory budget in MB (default 256)")
+    out_of_core_parser.add_argument("--workers", type=int, default=1,
+                                    help="analyze (column, i-range) shards on this many processes (default 1)")
+
+    index_parser = subcommands.add_parser("index", help="build the SQLite query index")
+    index_parser.add_argument("--include-elapsed", action="store_true",
+                              help="also index the elapsed columns (much larger)")
+
+    query_parser = subcommands.add_parser("query", help="look up divergent cells in the query index")
+    query_parser.add_argument("--function", help="column name, e.g. tan_value")
+    query_parser.add_argument("--i", dest="i_range", help="iteration, or inclusive range like 300:320")
+    query_parser.add_argument("--uuid")
+    query_parser.add_argument("--where", action="append", default=[], metavar="FIELD=VALUE",
+                              help='system info filter, e.g. "CPU Info=x86_64" (repeatable)')
+    query_parser.add_argument("--show", action="append", metavar="FIELD",
+                              help="system info field to print for each UUID (repeatable, default CPU Info)")
+
+    group_by_parser = subcommands.add_parser("group-by", help="roll divergence up by system info fields")
+    group_by_parser.add_argument("--field", action="append", required=True, metavar="FIELD",
+                                 help='system info field to group by, e.g. "Running on VM" (repeat to combine fields)')
+
+    subcommands.add_parser("probe-manifest",
+                           help="pick the fewest cells that tell the equivalence classes apart, for the collector's --quick mode")
+
+    drift_parser = subcommands.add_parser("drift", help="update the per-host drift store, and show how a host drifted")
+    drift_parser.add_argument("host", nargs="?", help="host id, or the UUID of one of its runs (default: list the hosts)")
+
+    snapshot_parser = subcommands.add_parser("snapshot", help="freeze the current matrix store as a baseline")
+    snapshot_parser.add_argument("name")
+
+    diff_parser = subcommands.add_parser("diff", help="cell-level changes between two snapshots")
+    diff_parser.add_argument("before")
+    diff_parser.add_argument("after")
+
+    diff_host_parser = subcommands.add_parser("diff-host",
+                                              help="cell-level changes since the same host's previous submission")
+    diff_host_parser.add_argument("uuid")
+
+    args = parser.parse_args()
+    if args.command == "aggregate":
+        aggregate()
+    elif args.command == "analyze":
+        analyze_stage()
+    elif args.command == "ulp":
+        print(f"Measuring errors against reference values...")
+        measure_ulp_errors()
+    elif args.command == "render":
+        visualize(args.output)
+    elif args.command == "explore":
+        explore(args.output)
+    elif args.command == "watch":
+        watch()
+    elif args.command == "out-of-core":
+        analyze_out_of_core(args.memory_budget * 1024**2, args.workers)
+    elif args.command == "index":
+        build_query_index(args.include_elapsed)
+    elif args.command == "probe-manifest":
+        export_probe_manifest()
+    elif args.command == "drift":
+        host_drift(args.host)
+    elif args.command == "snapshot":
+        snapshot(args.name)
+    elif args.command == "diff":
+        from fingerprint_snapshots import diff_snapshots
+        print_diff(diff_snapshots(args.before, args.after))
+    elif args.command == "diff-host":
+        from fingerprint_snapshots import diff_host
+        if matrix_store_is_stale():
+            analyze_out_of_core()
+        print_diff(diff_host(args.uuid, read_system_data()))
+    elif args.command == "group-by":
+        group_divergence(args.field)
+    elif args.command == "query":
+        i_range = None
+        if args.i_range:
+            first, _, last = args.i_range.partition(":")
+            i_range = (int(first), int(last or first))
+        for condition in args.where:
+            if "=" not in condition:
+                query_parser.error(f"--where {condition!r} is not of the form FIELD=VALUE")
+        where = dict(condition.split("=", 1) for condition in args.where)
+        print_query(args.function, i_range, args.uuid, where, args.show or ["CPU Info"])
+    else:
+        main_function()
\ No newline at end of file
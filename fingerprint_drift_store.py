@@ -0,0 +1,290 @@
+# fingerprint drift store
+"""
+    a time-indexed store of every host's successive fingerprints, linked by the collector's host id,
+    so drift over months (values that change after an update, timings that creep) can be queried
+    without reading every historical csv file again.
+
+    each host has a chain of runs in collection order. the first run (and every keyframe_interval-th run) is
+    stored in full, and every other run only as its delta against the run before it:
+        values   - the (i, before, after) bit patterns of the cells that changed, per value column
+        elapsed  - the change in each cell's elapsed time bucket (a quarter of a power of two, like the
+                   snapshots), which is almost all zeros and compresses to almost nothing
+    each run's exact per-function timing summary is kept in the host's runs.json, so timing trends are read
+    without decoding anything.
+    a host id the collector could only derive from the host name (no machine identifier was readable) is
+    flagged in runs.json: two machines with the same name share such a host id, and a renamed machine gets a new one.
+"""
+
+import os
+import json
+import time
+import numpy as np
+
+from fingerprint_matrix_store import (value_columns, elapsed_columns, parse_cell, cell_text,
+                                      missing_bits)
+
+
+# where the drift store is kept, and where drift queries are written
+drift_store_directory = "python scripts/drift_store"
+host_drift_filename = "python scripts/host_drift.json"
+
+# every this many runs of a host is stored in full, so decoding a run never applies more deltas than this
+keyframe_interval = 16
+
+# elapsed time buckets for cells that were not timed, and for timings that were too short to measure
+unmeasured_bucket = -32768
+zero_bucket = -32767
+
+# a timing counts as shifted when it changes by more than this factor (either way)
+timing_shift_factor = 1.5
+
+# the system info fields that change on every run, and are left out of the system info changes
+run_fields = ['UUID', 'Results UUID', 'Collected (UTC)', 'Submitted']
+
+
+
+# elapsed buckets
+"""
+round elapsed times (float64 array, NaN where not timed) to quarter powers of two, as int16 buckets
+"""
+def elapsed_buckets(elapsed):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        buckets = np.round(np.log2(elapsed) * 4)
+    return np.where(np.isnan(elapsed), unmeasured_bucket,
+                    np.where(elapsed == 0, zero_bucket, np.clip(np.nan_to_num(buckets), -32000, 32000))).astype(np.int16)
+
+
+
+# run rows
+"""
+    turn one UUID's records into the stored form: the value bits (value columns x i, uint64), the elapsed
+    buckets (elapsed columns x i, int16), and the exact median and mean elapsed time of every function
+"""
+def run_rows(records):
+    iterations = max(record['i'] for record in records) + 1
+    values = np.full((len(value_columns), iterations), missing_bits, dtype=np.uint64)
+    elapsed = np.full((len(elapsed_columns), iterations), np.nan)
+    for record in records:
+        for c, column in enumerate(value_columns):
+            values[c, record['i']] = parse_cell(record.get(column))
+        for c, column in enumerate(elapsed_columns):
+            if record.get(column) not in ("N/A", "", None, "Overflow"):
+                elapsed[c, record['i']] = float(record[column])
+
+    timing = {}
+    for c, column in enumerate(elapsed_columns):
+        measured = elapsed[c][~np.isnan(elapsed[c])]
+        timing[column] = {'median': float(np.median(measured)) if len(measured) else None,
+                          'mean': float(measured.mean()) if len(measured) else None}
+    return values, elapsed_buckets(elapsed), timing
+
+
+
+# run filename
+"""
+build the filename of the stored (full or delta) run at position `index` of a host's chain
+"""
+def run_filename(host_directory, index):
+    return f"{host_directory}/run_{index:05d}.npz"
+
+
+
+# load runs
+"""
+load a host's chain of runs (an empty chain for a new host)
+"""
+def load_runs(host_directory):
+    if not os.path.exists(f"{host_directory}/runs.json"):
+        return []
+    with open(f"{host_directory}/runs.json", "r") as f:
+        return json.load(f)['runs']
+
+
+
+# write run
+"""
+    store the run at position `index` of the chain: in full if it is a keyframe, otherwise as its delta
+    against the previous run's (values, buckets)
+"""
+def write_run(host_directory, index, values, buckets, previous=None, keyframe=False):
+    if keyframe:
+        np.savez_compressed(run_filename(host_directory, index), values=values, buckets=buckets)
+        return
+
+    previous_values, previous_buckets = previous
+    arrays = {'bucket_delta': buckets - previous_buckets}
+    for c, column in enumerate(value_columns):
+        changed = np.nonzero(values[c] != previous_values[c])[0]
+        arrays[f"{column}_i"] = changed.astype(np.uint32)
+        arrays[f"{column}_before"] = previous_values[c, changed]
+        arrays[f"{column}_after"] = values[c, changed]
+    np.savez_compressed(run_filename(host_directory, index), **arrays)
+
+
+
+# decode run
+"""
+    rebuild the (values, buckets) of the run at position `index`: start from the keyframe before it,
+    and apply the deltas after it in order
+"""
+def decode_run(host_directory, runs, index):
+    start = max(k for k in range(index + 1) if runs[k]['keyframe'])
+    with np.load(run_filename(host_directory, start)) as stored:
+        values, buckets = stored['values'].copy(), stored['buckets'].copy()
+    for k in range(start + 1, index + 1):
+        with np.load(run_filename(host_directory, k)) as delta:
+            buckets += delta['bucket_delta']
+            for c, column in enumerate(value_columns):
+                values[c, delta[f"{column}_i"]] = delta[f"{column}_after"]
+    return values, buckets
+
+
+
+# update drift store
+"""
+    add every run in data_directory that has a host id to its host's chain, in collection order.
+    system_data is the system info of every UUID (with 'Submitted', the collection time in seconds),
+    read_csv(directory, filename) the analyzer's csv reader and is_data_file(filename, prefix, extension)
+    its filename check. a run collected before the last stored run of its host (e.g. results mailed in late)
+    rewrites the host's chain from where it belongs.
+    returns the number of runs added
+"""
+def update_drift_store(data_directory, read_csv, is_data_file, system_data, store_directory=drift_store_directory):
+    results_filenames = {}
+    for filename in os.listdir(data_directory):
+        if is_data_file(filename, "fingerprint_results_", ".csv"):
+            results_filenames[filename[len("fingerprint_results_"):].split(".")[0]] = filename
+
+    hosts = {}
+    for entry in system_data:
+        if entry.get('Host ID') and entry['UUID'] in results_filenames:
+            hosts.setdefault(entry['Host ID'], []).append(entry)
+
+    added = 0
+    for host, entries in sorted(hosts.items()):
+        host_directory = f"{store_directory}/{host}"
+        os.makedirs(host_directory, exist_ok=True)
+        runs = load_runs(host_directory)
+        stored = {run['uuid'] for run in runs}
+        new = [entry for entry in entries if entry['UUID'] not in stored]
+        if not new:
+            continue
+
+        # the chain in collection order, and the first position where it differs from what is stored
+        chain = sorted(runs + [{'uuid': entry['UUID'], 'collected': entry['Submitted'], 'entry': entry}
+                               for entry in new], key=lambda run: (run['collected'], run['uuid']))
+        first = next(k for k, run in enumerate(chain) if k >= len(runs) or runs[k]['uuid'] != run['uuid'])
+
+        # the stored runs that move are decoded before their files are rewritten
+        moved = {run['uuid']: decode_run(host_directory, runs, runs.index(run)) for run in chain[first:] if run in runs}
+        previous = decode_run(host_directory, runs, first - 1) if first else None
+
+        rewritten = runs[:first]
+        for k, run in enumerate(chain[first:], start=first):
+            if 'entry' in run:
+                print(f"Adding {run['uuid']} to the drift store of host {host}")
+                values, buckets, timing = run_rows(read_csv(data_directory, results_filenames[run['uuid']]))
+                # runs from before the collector recorded the source of its host id hashed the host name
+                run = {'uuid': run['uuid'], 'collected': run['collected'], 'iterations': values.shape[1],
+                       'host_id_source': run['entry'].get('Host ID Source', 'hostname'),
+                       'system_info': {field: value for field, value in run['entry'].items() if field not in run_fields},
+                       'timing': timing}
+                added += 1
+            else:
+                values, buckets = moved[run['uuid']]
+                run = {field: value for field, value in run.items() if field != 'keyframe'}
+
+            run['keyframe'] = (k % keyframe_interval == 0 or previous is None
+                               or previous[0].shape != values.shape)
+            write_run(host_directory, k, values, buckets, previous, run['keyframe'])
+            rewritten.append(run)
+            previous = (values, buckets)
+
+        with open(f"{host_directory}/runs.json", "w") as f:
+            json.dump({'host': host, 'hostname_fallback': hostname_fallback(rewritten), 'runs': rewritten}, f, indent=4)
+
+    return added
+
+
+
+# hostname fallback
+"""
+whether any run of a chain has a host id derived from the host name, rather than from a machine identifier
+"""
+def hostname_fallback(runs):
+    return any(run.get('host_id_source', 'hostname') == 'hostname' for run in runs)
+
+
+
+# host drift
+"""
+    how one host's fingerprint drifted over its runs, read from the drift store.
+    returns (and writes to output_filename):
+        hostname_fallback - whether the host id is (partly) derived from the host name, so runs may be linked
+                            by name rather than by hardware
+        runs          - UUID and collection time of every run, in order
+        transitions   - per pair of consecutive runs: the system info fields that changed (e.g. the kernel),
+                        the value cells that changed, and how many cells per function shifted in timing
+        timing_trend  - per function, the median elapsed time of every run
+"""
+def host_drift(host, store_directory=drift_store_directory, output_filename=host_drift_filename):
+    host_directory = f"{store_directory}/{host}"
+    runs = load_runs(host_directory)
+    if not runs:
+        raise ValueError(f"host {host} is not in the drift store")
+
+    shift = np.log2(timing_shift_factor) * 4
+
+    transitions = []
+    for k in range(1, len(runs)):
+        before, after = runs[k - 1], runs[k]
+        transition = {
+            'before': before['uuid'],
+            'after': after['uuid'],
+            'system_info_changes': {field: [before['system_info'].get(field), value]
+                                    for field, value in after['system_info'].items()
+                                    if before['system_info'].get(field) != value},
+            'changed_values': {},
+            'timing_shifts': {}
+        }
+
+        if after['keyframe']:
+            # no delta is stored against a keyframe, so both runs are decoded
+            before_values, before_buckets = decode_run(host_directory, runs, k - 1)
+            after_values, after_buckets = decode_run(host_directory, runs, k)
+            comparable = before_values.shape == after_values.shape
+            changes = {}
+            if comparable:
+                for c, column in enumerate(value_columns):
+                    changed = np.nonzero(before_values[c] != after_values[c])[0]
+                    changes[column] = (changed, before_values[c, changed], after_values[c, changed])
+                bucket_delta = after_buckets - before_buckets
+        else:
+            comparable = True
+            with np.load(run_filename(host_directory, k)) as delta:
+                changes = {column: (delta[f"{column}_i"], delta[f"{column}_before"], delta[f"{column}_after"])
+                           for column in value_columns}
+                bucket_delta = delta['bucket_delta']
+
+        if comparable:
+            for column, (changed, before_bits, after_bits) in changes.items():
+                if len(changed):
+                    transition['changed_values'][column] = [
+                        {'i': int(i), 'before': cell_text(int(b)), 'after': cell_text(int(a))}
+                        for i, b, a in zip(changed, before_bits, after_bits)]
+            for c, column in enumerate(elapsed_columns):
+                transition['timing_shifts'][column] = int((np.abs(bucket_delta[c].astype(np.int32)) > shift).sum())
+        transitions.append(transition)
+
+    drift = {
+        'host': host,
+        'hostname_fallback': hostname_fallback(runs),
+        'runs': [{'uuid': run['uuid'], 'collected': time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(run['collected']))}
+                 for run in runs],
+        'transitions': transitions,
+        'timing_trend': {column: [run['timing'][column]['median'] for run in runs] for column in elapsed_columns}
+    }
+    with open(output_filename, "w") as out_f:
+        json.dump(drift, out_f, indent=4)
+
+    return drift
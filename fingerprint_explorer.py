@@ -0,0 +1,269 @@
+# fingerprint explorer
+"""
+    an interactive explorer for corpora too large for the per-point plots of visualize(): a heatmap of where
+    every function diverges, which drills down to the divergent iterations of one block of the heatmap,
+    and from there to the per-UUID value table of one cell.
+
+    everything shown on hover or click is looked up in indexes built once from the matrix store, so the
+    latency of an interaction does not grow with the corpus:
+        i -> record       per value column, the offset of each divergent iteration's record (-1 if it agrees)
+        record            the value of every equivalence class at that iteration (members of a class are
+                          identical in every value column, so one value per class says it all)
+        UUID -> class, class -> members
+    the records are memory-mapped, and a column's are only opened the first time it is hovered over.
+"""
+
+import os
+import json
+import numpy as np
+
+from fingerprint_matrix_store import (matrix_store_directory, matrix_store_summary_filename, columns, value_columns,
+                                      load_manifest, open_column, cell_text)
+
+
+# where the explorer's indexes are kept
+explorer_index_directory = "python scripts/explorer_index"
+
+# iterations per block of the heatmap
+heatmap_bin_size = 100
+
+# rows shown in a per-UUID value table (the rest are counted)
+table_rows = 40
+
+
+
+# build explorer index
+"""
+    build the explorer's indexes from an analyzed matrix store (its divergence bits and equivalence classes):
+    classes.json (the classes, and the class of every UUID), heatmap.npy (divergent iterations per column and
+    block of iterations), and per value column <column>_offsets.npy and <column>_records.npy
+"""
+def build_explorer_index(store_directory=matrix_store_directory, summary_filename=matrix_store_summary_filename,
+                         index_directory=explorer_index_directory):
+    manifest = load_manifest(store_directory)
+    uuids, iterations = manifest['uuids'], manifest['iterations']
+    rows = {uuid: u for u, uuid in enumerate(uuids)}
+    with open(summary_filename, "r") as f:
+        classes = json.load(f)['classes']
+    representatives = np.array([rows[members[0]] for members in classes], dtype=np.int64)
+    divergence = np.load(f"{store_directory}/divergence.npy")
+
+    os.makedirs(index_directory, exist_ok=True)
+    bins = -(-iterations // heatmap_bin_size)
+    heatmap = np.zeros((len(value_columns), bins), dtype=np.int32)
+    for c, column in enumerate(value_columns):
+        print(f"Indexing {column}")
+        divergent_row = divergence[columns.index(column)]
+        divergent = np.nonzero(divergent_row)[0]
+        # reduceat needs at least one block, which an empty corpus does not have
+        if iterations:
+            heatmap[c] = np.add.reduceat(divergent_row.astype(np.int32), np.arange(0, iterations, heatmap_bin_size))
+
+        offsets = np.full(iterations, -1, dtype=np.int32)
+        offsets[divergent] = np.arange(len(divergent), dtype=np.int32)
+        class_values = np.asarray(open_column(store_directory, column)[representatives]).view(np.uint64)
+        np.save(f"{index_directory}/{column}_offsets.npy", offsets)
+        np.save(f"{index_directory}/{column}_records.npy", np.ascontiguousarray(class_values[:, divergent].T))
+
+    np.save(f"{index_directory}/heatmap.npy", heatmap)
+    with open(f"{index_directory}/classes.json", "w") as f:
+        json.dump({'iterations': iterations, 'bin_size': heatmap_bin_size, 'classes': classes,
+                   'class_of_uuid': {uuid: k for k, members in enumerate(classes) for uuid in members}}, f)
+
+
+
+# load explorer index
+"""
+load the small parts of the explorer's indexes; the per-column records are opened by column_index() when needed
+"""
+def load_explorer_index(index_directory=explorer_index_directory):
+    with open(f"{index_directory}/classes.json", "r") as f:
+        index = json.load(f)
+    index['directory'] = index_directory
+    index['heatmap'] = np.load(f"{index_directory}/heatmap.npy")
+    index['columns'] = {}
+    return index
+
+
+
+# column index
+"""
+the (offsets, records) of one value column, memory-mapped the first time the column is used
+"""
+def column_index(index, column):
+    if column not in index['columns']:
+        index['columns'][column] = (np.load(f"{index['directory']}/{column}_offsets.npy", mmap_mode='r'),
+                                    np.load(f"{index['directory']}/{column}_records.npy", mmap_mode='r'))
+    return index['columns'][column]
+
+
+
+# cell detail
+"""
+    the values of one (column, i) cell, as a list of (value text, class numbers, number of UUIDs),
+    most common value first; None where the UUIDs agree
+"""
+def cell_detail(index, column, i):
+    offsets, records = column_index(index, column)
+    if not 0 <= i < len(offsets) or offsets[i] < 0:
+        return None
+
+    by_value = {}
+    for k, bits in enumerate(records[offsets[i]]):
+        by_value.setdefault(int(bits), []).append(k)
+    detail = [(cell_text(bits), classes, sum(len(index['classes'][k]) for k in classes))
+              for bits, classes in by_value.items()]
+    return sorted(detail, key=lambda entry: -entry[2])
+
+
+
+# value table
+"""
+    the per-UUID value table of one (column, i) cell: up to `limit` rows of (UUID, class, value), taken
+    class by class, and the number of UUIDs left out
+"""
+def value_table(index, column, i, limit=table_rows):
+    detail = cell_detail(index, column, i) or []
+    table, total = [], 0
+    for value, classes, members in detail:
+        total += members
+        for k in classes:
+            for uuid in index['classes'][k][:limit - len(table)]:
+                table.append((uuid, k, value))
+    return table, total - len(table)
+
+
+
+# explore
+"""
+    open the explorer: the heatmap of divergent iterations per function and block of iterations.
+    hovering over the heatmap shows the block, clicking it opens the divergent iterations of that block,
+    where hovering shows the values of an iteration, and clicking opens its per-UUID value table.
+    with output_filename, the heatmap is saved as a PNG file instead of shown
+"""
+def explore(index_directory=explorer_index_directory, output_filename=None):
+    import matplotlib
+    if output_filename:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    index = load_explorer_index(index_directory)
+    heatmap, bin_size, iterations = index['heatmap'], index['bin_size'], index['iterations']
+    functions = [column[:-len('_value')] for column in value_columns]
+    if not iterations:
+        print("The corpus is empty, there is nothing to explore")
+        return None
+
+    figure, axes = plt.subplots(figsize=(14, 5))
+    image = axes.imshow(heatmap, aspect='auto', cmap='Reds', interpolation='nearest',
+                        extent=(0, heatmap.shape[1] * bin_size, len(value_columns) - 0.5, -0.5))
+    axes.set_yticks(range(len(value_columns)), functions)
+    axes.set_xlabel('Iteration (i)')
+    axes.set_title(f'Divergent iterations per {bin_size} iterations ({len(index["classes"])} classes, '
+                   f'{len(index["class_of_uuid"])} UUIDs) - click a block to drill down')
+    figure.colorbar(image, ax=axes, label='divergent iterations')
+    figure.tight_layout()
+
+    if output_filename:
+        figure.savefig(output_filename)
+        plt.close(figure)
+        return figure
+
+    annotation = axes.annotate("", xy=(0, 0), xytext=(15, 15), textcoords="offset points",
+                               bbox=dict(boxstyle="round", fc="w"), visible=False)
+
+    def heatmap_block(event):
+        if event.inaxes is not axes or event.xdata is None:
+            return None
+        row, block = int(round(event.ydata)), int(event.xdata // bin_size)
+        if 0 <= row < len(value_columns) and 0 <= block < heatmap.shape[1]:
+            return row, block
+        return None
+
+    def on_heatmap_move(event):
+        found = heatmap_block(event)
+        annotation.set_visible(found is not None)
+        if found is not None:
+            row, block = found
+            annotation.xy = (event.xdata, event.ydata)
+            annotation.set_text(f"{functions[row]}, i={block * bin_size}..{min((block + 1) * bin_size, iterations) - 1}\n"
+                                f"{heatmap[row, block]} divergent iterations")
+        figure.canvas.draw_idle()
+
+    def on_heatmap_click(event):
+        found = heatmap_block(event)
+        if found is not None and heatmap[found]:
+            row, block = found
+            drill_down(plt, index, value_columns[row], block * bin_size, min((block + 1) * bin_size, iterations))
+
+    figure.canvas.mpl_connect("motion_notify_event", on_heatmap_move)
+    figure.canvas.mpl_connect("button_press_event", on_heatmap_click)
+    plt.show()
+    return figure
+
+
+
+# drill down
+"""
+    the divergent iterations of one column over [first, last), plotted by how many distinct values they have.
+    hovering shows the values of an iteration, clicking opens its per-UUID value table
+"""
+def drill_down(plt, index, column, first, last):
+    offsets, records = column_index(index, column)
+    divergent = np.nonzero(np.asarray(offsets[first:last]) >= 0)[0] + first
+    distinct = [len(np.unique(records[offsets[i]])) for i in divergent]
+
+    figure, axes = plt.subplots(figsize=(12, 5))
+    axes.scatter(divergent, distinct, c='red', marker='s')
+    axes.set_xlim(first - 0.5, last - 0.5)
+    axes.set_xlabel('Iteration (i)')
+    axes.set_ylabel('Distinct values')
+    axes.set_title(f'{column}, i={first}..{last - 1} - click an iteration for its per-UUID values')
+    axes.grid(True)
+    figure.tight_layout()
+
+    annotation = axes.annotate("", xy=(0, 0), xytext=(15, 15), textcoords="offset points",
+                               bbox=dict(boxstyle="round", fc="w"), visible=False)
+
+    def iteration(event):
+        if event.inaxes is not axes or event.xdata is None:
+            return None
+        i = int(round(event.xdata))
+        return i if first <= i < last and offsets[i] >= 0 else None
+
+    def on_move(event):
+        i = iteration(event)
+        annotation.set_visible(i is not None)
+        if i is not None:
+            annotation.xy = (i, event.ydata)
+            annotation.set_text(f"{column}, i={i}\n" + "\n".join(
+                f"{value}: {members} UUIDs in {len(classes)} classes" for value, classes, members
+                in cell_detail(index, column, i)))
+        figure.canvas.draw_idle()
+
+    def on_click(event):
+        i = iteration(event)
+        if i is not None:
+            show_value_table(plt, index, column, i)
+
+    figure.canvas.mpl_connect("motion_notify_event", on_move)
+    figure.canvas.mpl_connect("button_press_event", on_click)
+    figure.show()
+    return figure
+
+
+
+# show value table
+"""
+open the per-UUID value table of one (column, i) cell
+"""
+def show_value_table(plt, index, column, i):
+    table, left_out = value_table(index, column, i)
+    figure, axes = plt.subplots(figsize=(10, 0.3 * (len(table) + 3)))
+    axes.axis('off')
+    axes.set_title(f"{column}, i={i}" + (f" ({left_out} more UUIDs not shown)" if left_out else ""))
+    axes.table(cellText=[[uuid, k, value] for uuid, k, value in table], colLabels=["UUID", "class", "value"],
+               loc='upper center')
+    figure.tight_layout()
+    figure.show()
+    return figure
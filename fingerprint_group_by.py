@@ -0,0 +1,222 @@
+# fingerprint group by
+"""
+    roll divergence, ULP errors and timing up by any system info field (or combination of fields),
+    e.g. "VM guests diverge from bare metal on cosh at these i".
+
+    it works on the matrix store (fingerprint_matrix_store.py) in a single pass: the UUID rows are put in
+    group order once, and every chunk of every column is then reduced per group with numpy's reduceat,
+    so the cost does not grow with the number of groups.
+"""
+
+import json
+import numpy as np
+
+from fingerprint_reference_values import ulp_distance
+from fingerprint_matrix_store import (matrix_store_directory, columns, value_columns, elapsed_columns,
+                                      default_memory_budget, load_manifest, open_column, chunk_size_for_budget,
+                                      load_reference_arrays)
+
+
+# where the group tables are written
+group_divergence_filename = "python scripts/group_divergence.json"
+
+
+
+# compact ranges
+"""
+turn a sorted list of iterations into [first, last] ranges, e.g. [1, 2, 3, 7] -> [[1, 3], [7, 7]]
+"""
+def compact_ranges(iterations):
+    ranges = []
+    for i in iterations:
+        i = int(i)
+        if ranges and ranges[-1][1] == i - 1:
+            ranges[-1][1] = i
+        else:
+            ranges.append([i, i])
+    return ranges
+
+
+
+# group uuids
+"""
+    work out which group every UUID of the store belongs to, for the given system info fields.
+    returns the group keys (one dictionary of field values per group), the row order that puts the
+    UUIDs in group order, and where each group starts in that order (for reduceat)
+"""
+def group_uuids(uuids, system_data, fields):
+    system_info = {entry['UUID']: entry for entry in system_data}
+    labels = [tuple(str(system_info.get(uuid, {}).get(field, 'unknown')) for field in fields) for uuid in uuids]
+
+    keys = sorted(set(labels))
+    group_of_key = {key: g for g, key in enumerate(keys)}
+    group_of_uuid = np.array([group_of_key[label] for label in labels], dtype=np.int64)
+    order = np.argsort(group_of_uuid, kind='stable')
+    starts = np.searchsorted(group_of_uuid[order], np.arange(len(keys)))
+    sizes = np.bincount(group_of_uuid, minlength=len(keys))
+
+    return [dict(zip(fields, key)) for key in keys], order, starts, sizes
+
+
+
+# reduce value chunk
+"""
+    for one chunk of a value column, with the rows already in group order, work out per group and iteration:
+        internal   - the group's members do not all agree
+        separates  - the group agrees, everyone else agrees, and the two answers differ
+        differs    - the group agrees, and some other group agrees on a different answer
+"""
+def reduce_value_chunk(bits, starts):
+    group_min = np.minimum.reduceat(bits, starts, axis=0)
+    group_max = np.maximum.reduceat(bits, starts, axis=0)
+    uniform = group_min == group_max
+    internal = ~uniform
+
+    # the min and max of everyone outside each group, from running minimums/maximums over the other groups
+    groups = len(starts)
+    high = np.iinfo(np.uint64).max
+    prefix_min = np.vstack([np.full((1, bits.shape[1]), high, dtype=np.uint64),
+                            np.minimum.accumulate(group_min, axis=0)[:-1]])
+    suffix_min = np.vstack([np.minimum.accumulate(group_min[::-1], axis=0)[::-1][1:],
+                            np.full((1, bits.shape[1]), high, dtype=np.uint64)])
+    prefix_max = np.vstack([np.zeros((1, bits.shape[1]), dtype=np.uint64),
+                            np.maximum.accumulate(group_max, axis=0)[:-1]])
+    suffix_max = np.vstack([np.maximum.accumulate(group_max[::-1], axis=0)[::-1][1:],
+                            np.zeros((1, bits.shape[1]), dtype=np.uint64)])
+    rest_min = np.minimum(prefix_min, suffix_min)
+    rest_max = np.maximum(prefix_max, suffix_max)
+    rest_uniform = rest_min == rest_max
+
+    separates = uniform & rest_uniform & (group_min != rest_min) & (groups > 1)
+
+    # another uniform group with a different value: the uniform groups' values are not all this group's,
+    # i.e. their smallest or largest value is not this group's
+    uniform_min = np.where(uniform, group_min, high).min(axis=0)
+    uniform_max = np.where(uniform, group_min, 0).max(axis=0)
+    differs = uniform & ((uniform_min != group_min) | (uniform_max != group_min))
+
+    return internal, separates, differs
+
+
+
+# write group table
+"""
+write the group tables as json
+"""
+def write_group_table(table, output_filename=group_divergence_filename):
+    with open(output_filename, "w") as out_f:
+        json.dump(table, out_f, indent=4)
+
+
+
+# group by
+"""
+    single pass over the matrix store, rolling everything up by the given system info fields.
+    returns (and writes to output_filename) one table per group:
+        members   - number of UUIDs in the group
+        columns   - per value column: iteration ranges where the group is internally inconsistent,
+                    separates from everyone else, or differs from another group; and its ULP statistics
+        timing    - per elapsed column: the group's mean time per call, and its ratio to the overall mean
+    cells that are unstable on a single host are masked out of the ranges, as in the divergence results
+"""
+def group_by(system_data, fields, store_directory=matrix_store_directory, memory_budget=default_memory_budget,
+             output_filename=group_divergence_filename):
+    manifest = load_manifest(store_directory)
+    uuids, iterations = manifest['uuids'], manifest['iterations']
+    keys, order, starts, sizes = group_uuids(uuids, system_data, fields)
+    chunk_size = chunk_size_for_budget(len(uuids), memory_budget)
+    references = load_reference_arrays(iterations)
+
+    groups = [{'group': key, 'members': int(size), 'columns': {}, 'timing': {}} for key, size in zip(keys, sizes)]
+    table = {'fields': list(fields), 'groups': groups}
+
+    # reduceat needs at least one group, which an empty corpus does not have
+    if not uuids or not iterations:
+        print("The corpus is empty, there is nothing to group")
+        write_group_table(table, output_filename)
+        return table
+
+    unstable = np.load(f"{store_directory}/unstable.npy", mmap_mode='r')
+
+    for column in value_columns:
+        matrix = open_column(store_directory, column)
+        internal = np.zeros((len(keys), iterations), dtype=bool)
+        separates = np.zeros((len(keys), iterations), dtype=bool)
+        differs = np.zeros((len(keys), iterations), dtype=bool)
+        # float64, the int64 sum of a few huge distances overflows
+        ulp_max = np.zeros(len(keys))
+        ulp_sum = np.zeros(len(keys))
+        ulp_count = np.zeros(len(keys), dtype=np.int64)
+
+        for i_start in range(0, iterations, chunk_size):
+            i_stop = min(i_start + chunk_size, iterations)
+            chunk = np.ascontiguousarray(matrix[:, i_start:i_stop])[order]
+            bits = chunk.view(np.uint64)
+
+            (internal[:, i_start:i_stop], separates[:, i_start:i_stop],
+             differs[:, i_start:i_stop]) = reduce_value_chunk(bits, starts)
+            stable = ~unstable[columns.index(column), i_start:i_stop]
+            internal[:, i_start:i_stop] &= stable
+            separates[:, i_start:i_stop] &= stable
+            differs[:, i_start:i_stop] &= stable
+
+            distance = ulp_distance(chunk, references[column][np.newaxis, i_start:i_stop])
+            comparable = distance >= 0
+            ulp_max = np.maximum(ulp_max, np.maximum.reduceat(distance.max(axis=1), starts))
+            ulp_sum += np.add.reduceat(np.where(comparable, distance, 0).sum(axis=1, dtype=np.float64), starts)
+            ulp_count += np.add.reduceat(comparable.sum(axis=1), starts)
+
+        for g, group in enumerate(groups):
+            group['columns'][column] = {
+                'internal': compact_ranges(np.nonzero(internal[g])[0]),
+                'separates': compact_ranges(np.nonzero(separates[g])[0]),
+                'differs': compact_ranges(np.nonzero(differs[g])[0]),
+                'max_ulp': int(max(ulp_max[g], 0)),
+                'mean_ulp': float(ulp_sum[g] / ulp_count[g]) if ulp_count[g] else 0.0
+            }
+
+    for column in elapsed_columns:
+        matrix = open_column(store_directory, column)
+        time_sum = np.zeros(len(keys))
+        time_count = np.zeros(len(keys), dtype=np.int64)
+        for i_start in range(0, iterations, chunk_size):
+            chunk = np.ascontiguousarray(matrix[:, i_start:min(i_start + chunk_size, iterations)])[order]
+            measured = ~np.isnan(chunk)
+            time_sum += np.add.reduceat(np.where(measured, chunk, 0.0).sum(axis=1), starts)
+            time_count += np.add.reduceat(measured.sum(axis=1), starts)
+
+        overall = time_sum.sum() / time_count.sum() if time_count.sum() else 0.0
+        for g, group in enumerate(groups):
+            mean = float(time_sum[g] / time_count[g]) if time_count[g] else None
+            group['timing'][column] = {
+                'mean_elapsed': mean,
+                'relative_to_overall': mean / overall if mean is not None and overall else None
+            }
+
+    write_group_table(table, output_filename)
+    return table
+
+
+
+# format group table
+"""
+one line per group and value column where the group stands apart, for printing
+"""
+def format_group_table(table):
+    def ranges_text(ranges):
+        return ", ".join(str(first) if first == last else f"{first}-{last}" for first, last in ranges)
+
+    lines = []
+    for group in table['groups']:
+        name = ", ".join(f"{field}={value}" for field, value in group['group'].items())
+        lines.append(f"{name} ({group['members']} UUIDs)")
+        for column, result in group['columns'].items():
+            if result['separates']:
+                lines.append(f"    diverges from everyone else on {column} at i: {ranges_text(result['separates'])}")
+            elif result['differs']:
+                lines.append(f"    differs from another group on {column} at i: {ranges_text(result['differs'])}")
+            if result['internal']:
+                lines.append(f"    disagrees internally on {column} at i: {ranges_text(result['internal'])}")
+            if result['max_ulp']:
+                lines.append(f"    {column}: max {result['max_ulp']} ulp, mean {result['mean_ulp']:.3g} ulp")
+    return "\n".join(lines)
@@ -0,0 +1,415 @@
+# fingerprint matrix store
+"""
+    out-of-core storage and analysis for corpora that are too big to hold in memory as Python objects.
+
+    every column of the fingerprint csv files (sin_value, sin_elapsed, ...) is stored as its own
+    (UUID x i) float64 matrix in a memory-mapped .npy file, and the analysis walks over the matrices
+    in i-range chunks, so peak memory is bounded by a configurable budget instead of by corpus size.
+
+    the non-numeric csv cells are stored as NaNs with their own bit patterns, so cells can be
+    compared bit for bit without ever going back to strings.
+"""
+
+import os
+import json
+import struct
+import hashlib
+import numpy as np
+
+
+# directory holding the memory-mapped matrices, and what the analysis writes next to them
+matrix_store_directory = "python scripts/matrix_store"
+matrix_store_summary_filename = "python scripts/matrix_store_summary.json"
+
+# the csv columns stored as matrices
+value_columns = ['sin_value', 'cos_value', 'e_value', 'log_value', 'cosh_value', 'tan_value']
+elapsed_columns = ['sin_elapsed', 'cos_elapsed', 'e_elapsed', 'log_elapsed', 'cosh_elapsed', 'tan_elapsed']
+columns = value_columns + elapsed_columns
+
+# bit patterns for the cells that are not numbers (all quiet NaNs, so they never compare equal to a value)
+overflow_bits = 0x7FF8000000000001       # "Overflow"
+not_available_bits = 0x7FF8000000000002  # "N/A"
+missing_bits = 0x7FF8000000000003        # no row for this i in the csv
+
+# the bit patterns of the non-numeric csv cells, by their text
+special_cells = {"Overflow": overflow_bits, "N/A": not_available_bits, "": not_available_bits, None: not_available_bits}
+
+# and the text of each of those bit patterns, as the collector wrote it (missing cells have none)
+special_bits = {overflow_bits: "Overflow", not_available_bits: "N/A", missing_bits: None}
+
+# default memory budget for the chunked analysis (bytes)
+default_memory_budget = 256 * 1024**2
+
+# how many chunk-sized float64 arrays the analysis of one chunk holds at its peak: the chunk, and the
+# temporaries of the divergence pass and of ulp_distance() (measured with tracemalloc at about 7.5 for
+# analyze_chunk() and 9 for the group-by, so this is the larger, with some room)
+chunk_working_set = 10
+
+# with several workers, the work is split into about this many shards per worker, so they finish together
+shards_per_worker = 4
+
+
+
+# parse cell
+"""
+parse one csv cell into its float64 bit pattern
+"""
+def parse_cell(text):
+    if text in special_cells:
+        return special_cells[text]
+    return struct.unpack('<Q', struct.pack('<d', float(text)))[0]
+
+
+
+# cell text
+"""
+turn a stored float64 bit pattern back into the text the collector wrote.
+special maps the non-numeric bit patterns to their text
+"""
+def cell_text(bits, special=special_bits):
+    if bits in special:
+        return special[bits]
+    return repr(struct.unpack('<d', struct.pack('<Q', bits))[0])
+
+
+
+# parse column
+"""
+parse a column of csv cells into a uint64 array of float64 bit patterns, converting the numbers all at once
+"""
+def parse_column(texts):
+    texts = np.array(list(texts), dtype=object)
+    codes = np.array([special_cells.get(text, 0) for text in texts], dtype=np.uint64)
+    special = codes != 0
+    texts[special] = "nan"
+    bits = texts.astype(str).astype(np.float64).view(np.uint64)
+    bits[special] = codes[special]
+    return bits
+
+
+
+# column matrix filename
+"""
+build the filename of the memory-mapped matrix for one column
+"""
+def column_matrix_filename(store_directory, column):
+    return f"{store_directory}/{column}.npy"
+
+
+
+# load manifest
+"""
+load the list of UUIDs, the number of iterations, and the stored columns of a matrix store
+"""
+def load_manifest(store_directory=matrix_store_directory):
+    with open(f"{store_directory}/manifest.json", "r") as f:
+        return json.load(f)
+
+
+
+# open column
+"""
+open one column matrix of the store as a read-only memory map (nothing is read until it is sliced)
+"""
+def open_column(store_directory, column, mode='r'):
+    return np.load(column_matrix_filename(store_directory, column), mmap_mode=mode)
+
+
+
+# widen matrix
+"""
+    (re)allocate the memory-mapped matrix of one column with room for `iterations` iterations, keeping the
+    first stored_rows rows of the old matrix (and marking their new iterations missing)
+"""
+def widen_matrix(store_directory, column, matrix, uuid_count, iterations, stored_rows):
+    filename = column_matrix_filename(store_directory, column)
+    if matrix is None:
+        return np.lib.format.open_memmap(filename, mode='w+', dtype=np.float64, shape=(uuid_count, iterations))
+
+    widened = np.lib.format.open_memmap(filename + ".widening", mode='w+', dtype=np.float64,
+                                        shape=(uuid_count, iterations))
+    widened[:stored_rows, :matrix.shape[1]] = matrix[:stored_rows]
+    widened[:stored_rows, matrix.shape[1]:].view(np.uint64)[:] = missing_bits
+    widened.flush()
+    del matrix, widened
+    os.replace(filename + ".widening", filename)
+    return np.load(filename, mmap_mode='r+')
+
+
+
+# build matrix store
+"""
+    stream every fingerprint_results csv in data_directory into the column matrices, one UUID at a time.
+    only one UUID's rows are ever held in memory, and every csv is read once: the matrices are sized by
+    the first file, and only widened (copied) if a later file has more iterations.
+    read_csv(directory, filename) is the analyzer's csv reader (one UUID's records, as dictionaries), and
+    is_data_file(filename, prefix, extension) its filename check, so the store reads exactly what aggregate()
+    reads, compressed files included.
+    unstable_cells is a set of (i, column) cells to mask out of the divergence results
+"""
+def build_matrix_store(data_directory, read_csv, is_data_file, store_directory=matrix_store_directory,
+                       unstable_cells=()):
+    filenames = sorted(filename for filename in os.listdir(data_directory)
+                       if is_data_file(filename, "fingerprint_results_", ".csv"))
+
+    os.makedirs(store_directory, exist_ok=True)
+    uuids = []
+    iterations = 0
+    matrices = {}
+    for k, filename in enumerate(filenames):
+        print(f"Storing {filename} ({k + 1}/{len(filenames)})")
+        records = read_csv(data_directory, filename)
+        # a results file with only its header (e.g. a run that was interrupted) has nothing to store
+        if not records:
+            print(f"Skipping {filename}, it has no rows")
+            continue
+        u = len(uuids)
+        uuids.append(records[0]['UUID'])
+        file_iterations = max(record['i'] for record in records) + 1
+        if file_iterations > iterations:
+            iterations = file_iterations
+            matrices = {column: widen_matrix(store_directory, column, matrices.pop(column, None), len(filenames),
+                                             iterations, u)
+                        for column in columns}
+
+        # one UUID's row, column by column, then into the matrices
+        i = np.array([record['i'] for record in records], dtype=np.int64)
+        row_buffer = np.full(iterations, missing_bits, dtype=np.uint64)
+        for column in columns:
+            row_buffer[i] = parse_column(record.get(column) for record in records)
+            matrices[column][u] = row_buffer.view(np.float64)
+
+    # the rows of skipped files are dropped, and an empty data directory still gets its (empty) matrices
+    if matrices and len(uuids) < len(filenames):
+        matrices = {column: widen_matrix(store_directory, column, matrices.pop(column), len(uuids), iterations,
+                                         len(uuids))
+                    for column in columns}
+    if not matrices:
+        matrices = {column: widen_matrix(store_directory, column, None, 0, 0, 0) for column in columns}
+
+    for matrix in matrices.values():
+        matrix.flush()
+    del matrices
+
+    # cells that are unstable on a single host, as one boolean row per column
+    unstable = np.zeros((len(columns), iterations), dtype=bool)
+    for i, column in unstable_cells:
+        if column in columns and i < iterations:
+            unstable[columns.index(column), i] = True
+    np.save(f"{store_directory}/unstable.npy", unstable)
+
+    with open(f"{store_directory}/manifest.json", "w") as f:
+        json.dump({'uuids': uuids, 'iterations': iterations, 'columns': columns}, f, indent=4)
+
+    return uuids, iterations
+
+
+
+# chunk size for budget
+"""
+how many iterations fit in one chunk, given the number of UUIDs and the memory budget
+(a chunk is read once, and its analysis holds up to chunk_working_set arrays of the same size)
+"""
+def chunk_size_for_budget(uuid_count, memory_budget=default_memory_budget):
+    bytes_per_iteration = max(uuid_count, 1) * 8 * chunk_working_set
+    return max(1, memory_budget // bytes_per_iteration)
+
+
+
+# shard size
+"""
+how many iterations go in one shard of the parallel analysis: small enough for every worker's chunk to fit
+in its share of the memory budget, and for there to be a few shards per worker to balance the load
+"""
+def shard_size(uuid_count, iterations, workers, memory_budget=default_memory_budget):
+    budget_size = chunk_size_for_budget(uuid_count, memory_budget // workers)
+    shards_per_column = -(-shards_per_worker * workers // len(columns))
+    return max(1, min(budget_size, -(-iterations // shards_per_column)))
+
+
+
+# analyze chunk
+"""
+    analyze one column over the iterations [i_start, i_stop), and return the compact partial result:
+        divergent  - bool per iteration, True where any two UUIDs differ (unstable cells masked out)
+        digests    - per UUID digest of its values in this chunk (merged into class signatures)
+        ulp        - for value columns, per UUID [sum, max, incorrect cells, comparable cells, overflow mismatches]
+    reference is the full reference array for value columns (NaN for overflow), or None
+"""
+def analyze_chunk(store_directory, column, i_start, i_stop, reference=None):
+    matrix = open_column(store_directory, column)
+    chunk = np.ascontiguousarray(matrix[:, i_start:i_stop])
+    bits = chunk.view(np.uint64)
+
+    # divergence: compare every UUID's bits against the first UUID's
+    divergent = (bits != bits[:1]).any(axis=0) if len(bits) else np.zeros(i_stop - i_start, dtype=bool)
+    unstable = np.load(f"{store_directory}/unstable.npy", mmap_mode='r')
+    divergent &= ~unstable[columns.index(column), i_start:i_stop]
+
+    digests = [hashlib.blake2b(row.tobytes(), digest_size=16).digest() for row in bits]
+
+    ulp = None
+    if reference is not None:
+        from fingerprint_reference_values import ulp_distance
+        reference_chunk = reference[np.newaxis, i_start:i_stop]
+        distance = ulp_distance(chunk, reference_chunk)
+        comparable = distance >= 0
+        overflow_mismatch = np.isnan(chunk) != np.isnan(reference_chunk)
+        # the sums are float64, the int64 sum of a few huge distances overflows
+        ulp = np.stack([
+            np.where(comparable, distance, 0).sum(axis=1, dtype=np.float64),
+            distance.max(axis=1, initial=0),
+            (distance > 0).sum(axis=1),
+            comparable.sum(axis=1),
+            overflow_mismatch.sum(axis=1)
+        ], axis=1)
+
+    return {'column': column, 'i_start': i_start, 'divergent': divergent, 'digests': digests, 'ulp': ulp}
+
+
+
+# new column result
+"""
+the empty running result of one column, which the partial results of its chunks are merged into
+"""
+def new_column_result(uuid_count, iterations):
+    return {'divergent': np.zeros(iterations, dtype=bool),
+            'signatures': [hashlib.blake2b(digest_size=16) for _ in range(uuid_count)],
+            'ulp': None}
+
+
+
+# merge chunk
+"""
+    merge the partial result of one chunk into its column's running result, so a partial can be dropped
+    as soon as it is merged. the partials of a column must be merged in i order (the signatures are
+    running hashes), which is what makes the merge deterministic
+"""
+def merge_chunk(result, partial):
+    result['divergent'][partial['i_start']:partial['i_start'] + len(partial['divergent'])] = partial['divergent']
+    for u, digest in enumerate(partial['digests']):
+        result['signatures'][u].update(digest)
+    if partial['ulp'] is not None:
+        if result['ulp'] is None:
+            result['ulp'] = partial['ulp'].copy()
+        else:
+            ulp = result['ulp']
+            ulp[:, 0] += partial['ulp'][:, 0]
+            ulp[:, 1] = np.maximum(ulp[:, 1], partial['ulp'][:, 1])
+            ulp[:, 2:] += partial['ulp'][:, 2:]
+
+
+
+# finish column result
+"""
+turn a column's running result into its final (divergent, signatures, ulp)
+"""
+def finish_column_result(result):
+    return result['divergent'], [signature.hexdigest() for signature in result['signatures']], result['ulp']
+
+
+
+# equivalence classes
+"""
+group UUIDs with identical signatures, returns a list of member lists (largest class first)
+"""
+def equivalence_classes(uuids, signatures):
+    classes = {}
+    for uuid, signature in zip(uuids, signatures):
+        classes.setdefault(signature, []).append(uuid)
+    return sorted(classes.values(), key=lambda members: (-len(members), members[0]))
+
+
+
+# load reference arrays
+"""
+load the reference values for every value column as float64 arrays (NaN for overflow)
+"""
+def load_reference_arrays(iterations):
+    from fingerprint_reference_values import load_reference_table
+    return {column: np.array([np.nan if value is None else value
+                              for value in load_reference_table(column[:-len('_value')], 0, iterations)])
+            for column in value_columns}
+
+
+
+# write summary
+"""
+    write the merged results: the divergence bits as divergence.npy (columns x iterations),
+    and the divergent iterations, ULP statistics and equivalence classes as a compact JSON summary
+"""
+def write_summary(store_directory, summary_filename, uuids, results):
+    divergence = np.stack([results[column][0] for column in columns])
+    np.save(f"{store_directory}/divergence.npy", divergence)
+
+    summary = {'uuids': len(uuids), 'columns': {}, 'ulp_errors': {uuid: {} for uuid in uuids}}
+    for column in columns:
+        divergent, signatures, ulp = results[column]
+        summary['columns'][column] = {
+            'divergent_iterations': [int(i) for i in np.nonzero(divergent)[0]],
+            'classes': equivalence_classes(uuids, signatures)
+        }
+        if ulp is not None:
+            for u, uuid in enumerate(uuids):
+                total = float(ulp[u, 0])
+                largest, incorrect, comparable, mismatches = (int(x) for x in ulp[u, 1:])
+                summary['ulp_errors'][uuid][column] = {
+                    'max_ulp': largest,
+                    'mean_ulp': total / comparable if comparable else 0.0,
+                    'incorrect_cells': incorrect,
+                    'overflow_mismatches': mismatches
+                }
+
+    # overall classes: UUIDs that agree on every value column
+    overall = [hashlib.blake2b("".join(results[column][1][u] for column in value_columns).encode(),
+                               digest_size=16).hexdigest() for u in range(len(uuids))]
+    summary['classes'] = equivalence_classes(uuids, overall)
+
+    with open(summary_filename, "w") as out_f:
+        json.dump(summary, out_f, indent=4)
+
+    return summary
+
+
+
+# analyze matrix store
+"""
+    analyze the whole store one (column, i-range) chunk at a time, with the chunk size picked
+    so that no chunk needs more than memory_budget bytes.
+    with workers > 1, the chunks are shards handed to a process pool; every worker opens the memory-mapped
+    matrices itself and only sends back the compact partial result, and the partials are merged
+    exactly like the serial ones, so the summary is the same
+"""
+def analyze_matrix_store(store_directory=matrix_store_directory, memory_budget=default_memory_budget,
+                         summary_filename=matrix_store_summary_filename, workers=1):
+    manifest = load_manifest(store_directory)
+    uuids, iterations = manifest['uuids'], manifest['iterations']
+    references = load_reference_arrays(iterations)
+
+    results = {column: new_column_result(len(uuids), iterations) for column in columns}
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        chunk_size = shard_size(len(uuids), iterations, workers, memory_budget)
+        shards = [(column, i_start, min(i_start + chunk_size, iterations))
+                  for column in columns for i_start in range(0, iterations, chunk_size)]
+        print(f"Analyzing {len(shards)} shards of {chunk_size} iterations on {workers} workers")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(analyze_chunk, store_directory, column, i_start, i_stop, references.get(column))
+                       for column, i_start, i_stop in shards]
+            # merged in shard order (i order within every column), and dropped as soon as they are merged
+            for k in range(len(futures)):
+                partial = futures[k].result()
+                futures[k] = None
+                merge_chunk(results[partial['column']], partial)
+    else:
+        chunk_size = chunk_size_for_budget(len(uuids), memory_budget)
+        for column in columns:
+            print(f"Analyzing {column} in chunks of {chunk_size} iterations")
+            for i_start in range(0, iterations, chunk_size):
+                merge_chunk(results[column], analyze_chunk(store_directory, column, i_start,
+                                                           min(i_start + chunk_size, iterations),
+                                                           references.get(column)))
+
+    results = {column: finish_column_result(result) for column, result in results.items()}
+
+    return write_summary(store_directory, summary_filename, uuids, results)
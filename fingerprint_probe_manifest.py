@@ -0,0 +1,121 @@
+# fingerprint probe manifest
+"""
+    most of the (function, i) cells of a fingerprint are the same on every machine, or overflow everywhere.
+    this picks the smallest set of cells (greedily) that still tells every known equivalence class apart,
+    and writes it as a probe manifest, so the collector's quick mode only has to run those cells.
+
+    it is a greedy set cover: the elements are the pairs of classes, and a cell covers the pairs whose
+    representatives have different values there. picking a cell splits the classes into the groups that
+    agree on every cell picked so far, and the next cell is the one that splits the most remaining pairs.
+    only divergent cells that are stable on every host are candidates (see fingerprint_matrix_store.py).
+"""
+
+import json
+import numpy as np
+
+from fingerprint_matrix_store import (matrix_store_directory, matrix_store_summary_filename, columns, value_columns,
+                                      load_manifest, open_column, cell_text)
+
+
+# where the probe manifest is written
+probe_manifest_filename = "python scripts/probe_manifest.json"
+
+
+
+# same key pairs
+"""
+    for every column of a (classes x cells) matrix of keys, count the pairs of rows with the same key
+    (sorting each column puts equal keys in runs, and each element pairs with the ones before it in its run)
+"""
+def same_key_pairs(keys):
+    ordered = np.sort(keys, axis=0)
+    rows = np.arange(len(ordered))[:, np.newaxis]
+    run_starts = np.ones(ordered.shape, dtype=bool)
+    run_starts[1:] = ordered[1:] != ordered[:-1]
+    first_of_run = np.maximum.accumulate(np.where(run_starts, rows, 0), axis=0)
+    return (rows - first_of_run).sum(axis=0)
+
+
+
+# greedy probe set
+"""
+    pick cells (columns of `values`, a classes x cells matrix of value ids) until every class has its own
+    combination of values, or no cell separates any more classes.
+    returns the picked cells, and the final group of every class (classes in the same group cannot be told apart)
+"""
+def greedy_probe_set(values):
+    class_count = len(values)
+    groups = np.zeros(class_count, dtype=np.int64)
+    picked = []
+    while len(np.unique(groups)) < class_count:
+        keys = groups[:, np.newaxis] * class_count + values
+        separated = same_key_pairs(groups[:, np.newaxis]) - same_key_pairs(keys)
+        best = int(np.argmax(separated))
+        if separated[best] == 0:
+            break
+        picked.append(best)
+        groups = np.unique(keys[:, best], return_inverse=True)[1].reshape(-1)
+    return picked, groups
+
+
+
+# build probe manifest
+"""
+    derive the probe manifest from an analyzed matrix store (its equivalence classes and divergence bits).
+    returns (and writes to output_filename):
+        probes       - the cells to run, as {'function', 'i'}, in the order they were picked
+        classes      - per class: its members, and its value at every probe (as the collector writes it)
+        unseparated  - groups of classes that differ only on cells that are unstable somewhere
+"""
+def build_probe_manifest(store_directory=matrix_store_directory, summary_filename=matrix_store_summary_filename,
+                         output_filename=probe_manifest_filename):
+    manifest = load_manifest(store_directory)
+    rows = {uuid: u for u, uuid in enumerate(manifest['uuids'])}
+    with open(summary_filename, "r") as f:
+        classes = json.load(f)['classes']
+    representatives = np.array([rows[members[0]] for members in classes], dtype=np.int64)
+
+    # the candidate cells: value cells where some UUIDs disagree, and that are stable on every host
+    divergence = np.load(f"{store_directory}/divergence.npy")
+    candidates, candidate_bits = [], []
+    for column in value_columns:
+        iterations = np.nonzero(divergence[columns.index(column)])[0]
+        if len(iterations):
+            matrix = open_column(store_directory, column)
+            candidates += [(column, int(i)) for i in iterations]
+            candidate_bits.append(np.asarray(matrix[representatives][:, iterations]).view(np.uint64))
+    print(f"{len(classes)} classes, {len(candidates)} candidate cells")
+
+    bits = np.hstack(candidate_bits) if candidate_bits else np.zeros((len(classes), 0), dtype=np.uint64)
+    # the values of each cell, numbered per cell (0 .. classes - 1), so they combine with the group numbers
+    values = np.zeros(bits.shape, dtype=np.int64)
+    for c in range(bits.shape[1]):
+        values[:, c] = np.unique(bits[:, c], return_inverse=True)[1].reshape(-1)
+    picked, groups = greedy_probe_set(values) if bits.shape[1] else ([], np.zeros(len(classes), dtype=np.int64))
+
+    probe_manifest = {
+        'probes': [{'function': candidates[c][0][:-len('_value')], 'i': candidates[c][1]} for c in picked],
+        'classes': [{'members': members, 'values': [cell_text(int(bits[k, c])) for c in picked]}
+                    for k, members in enumerate(classes)],
+        'unseparated': [[int(k) for k in np.nonzero(groups == group)[0]]
+                        for group in np.unique(groups) if (groups == group).sum() > 1]
+    }
+    with open(output_filename, "w") as out_f:
+        json.dump(probe_manifest, out_f, indent=4)
+
+    print(f"{len(picked)} probes separate {len(classes) - sum(len(group) - 1 for group in probe_manifest['unseparated'])}"
+          f" of {len(classes)} classes")
+    return probe_manifest
+
+
+
+# classify probes
+"""
+    match the values a machine returned for the probes of a manifest against its classes.
+    returns the index of the matching class, or None for a machine unlike any known class
+"""
+def classify_probes(probe_manifest, values):
+    for k, probe_class in enumerate(probe_manifest['classes']):
+        if probe_class['values'] == list(values):
+            return k
+    return None
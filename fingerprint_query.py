@@ -0,0 +1,128 @@
+# fingerprint query
+"""
+    an indexed SQLite copy of the divergent cells of the corpus, so questions like
+    "which UUIDs differ on tan_value for i in 300..320, and what CPUs are they?"
+    can be answered without grepping through inconsistent_rows.json.
+
+    the index is built from the matrix store (fingerprint_matrix_store.py), and only holds the cells where
+    the UUIDs disagree, along with every UUID's system information.
+"""
+
+import os
+import sqlite3
+
+# numpy (and the matrix store) are only needed to build the index, so querying starts quickly
+
+
+# the SQLite index file
+query_index_filename = "python scripts/fingerprint_index.sqlite"
+
+# how many divergent iterations of a column are read from the store at a time
+index_chunk_size = 1024
+
+
+
+# build query index
+"""
+    (re)build the SQLite index from the matrix store and the system information of every UUID.
+    elapsed columns differ between almost every pair of machines, so they are only indexed when asked for
+"""
+def build_query_index(system_data, store_directory=None, index_filename=query_index_filename,
+                      include_elapsed=False):
+    import numpy as np
+    from fingerprint_matrix_store import (matrix_store_directory, columns, value_columns, load_manifest, open_column,
+                                          cell_text)
+
+    store_directory = store_directory or matrix_store_directory
+    manifest = load_manifest(store_directory)
+    uuids = manifest['uuids']
+    divergence = np.load(f"{store_directory}/divergence.npy", mmap_mode='r')
+
+    # built under a temporary name, so an interrupted build never leaves a half-built index behind
+    temporary_filename = index_filename + ".tmp"
+    if os.path.exists(temporary_filename):
+        os.remove(temporary_filename)
+    connection = sqlite3.connect(temporary_filename)
+    connection.executescript("""
+        CREATE TABLE system_info (uuid TEXT, field TEXT, value TEXT);
+        CREATE TABLE cells (function TEXT, i INTEGER, uuid TEXT, value TEXT);
+    """)
+
+    connection.executemany("INSERT INTO system_info VALUES (?, ?, ?)",
+                           ((entry['UUID'], field, str(value))
+                            for entry in system_data for field, value in entry.items()))
+
+    indexed_columns = columns if include_elapsed else value_columns
+    for column in indexed_columns:
+        divergent_iterations = np.nonzero(divergence[columns.index(column)])[0]
+        print(f"Indexing {len(divergent_iterations)} divergent iterations of {column}")
+        matrix = open_column(store_directory, column)
+        for start in range(0, len(divergent_iterations), index_chunk_size):
+            iterations = divergent_iterations[start:start + index_chunk_size]
+            bits = np.ascontiguousarray(matrix[:, iterations]).view(np.uint64)
+            connection.executemany("INSERT INTO cells VALUES (?, ?, ?, ?)",
+                                   ((column, int(i), uuid, cell_text(int(bits[u, k])))
+                                    for k, i in enumerate(iterations) for u, uuid in enumerate(uuids)))
+
+    # the indexes are built after the inserts, which is much faster than keeping them up to date
+    connection.executescript("""
+        CREATE INDEX cells_by_function_and_i ON cells (function, i);
+        CREATE INDEX cells_by_uuid ON cells (uuid, function, i);
+        CREATE INDEX system_info_by_field ON system_info (field, value COLLATE NOCASE);
+        CREATE INDEX system_info_by_uuid ON system_info (uuid);
+    """)
+    connection.commit()
+    connection.close()
+    os.replace(temporary_filename, index_filename)
+
+
+
+# query
+"""
+    look up divergent cells, filtered by any combination of:
+        function   - column name, e.g. "tan_value"
+        i_range    - (first, last) iteration, inclusive
+        uuid       - a single UUID
+        where      - {system info field: value}, e.g. {"CPU Info": "x86_64", "Running on VM": "no"}
+    returns a list of {'function', 'i', 'uuid', 'value', 'system_info'} dictionaries, in (function, i, uuid) order.
+    raises FileNotFoundError if the index has not been built (connecting would create an empty one)
+"""
+def query(function=None, i_range=None, uuid=None, where=None, index_filename=query_index_filename):
+    conditions = []
+    parameters = []
+    if function is not None:
+        conditions.append("c.function = ?")
+        parameters.append(function)
+    if i_range is not None:
+        conditions.append("c.i BETWEEN ? AND ?")
+        parameters += [int(i_range[0]), int(i_range[1])]
+    if uuid is not None:
+        conditions.append("c.uuid = ?")
+        parameters.append(uuid)
+    for field, value in (where or {}).items():
+        conditions.append("c.uuid IN (SELECT uuid FROM system_info WHERE field = ? AND value = ? COLLATE NOCASE)")
+        parameters += [field, value]
+
+    sql = "SELECT c.function, c.i, c.uuid, c.value FROM cells c"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY c.function, c.i, c.uuid"
+
+    if not os.path.exists(index_filename):
+        raise FileNotFoundError(f"there is no query index at {index_filename}, build it with the index subcommand")
+    connection = sqlite3.connect(index_filename)
+    rows = connection.execute(sql, parameters).fetchall()
+
+    # system information for just the UUIDs in the result
+    system_info = {}
+    matched_uuids = sorted({row[2] for row in rows})
+    for start in range(0, len(matched_uuids), 500):
+        batch = matched_uuids[start:start + 500]
+        for row_uuid, field, value in connection.execute(
+                f"SELECT uuid, field, value FROM system_info WHERE uuid IN ({','.join('?' * len(batch))})", batch):
+            system_info.setdefault(row_uuid, {})[field] = value
+    connection.close()
+
+    return [{'function': row_function, 'i': i, 'uuid': row_uuid, 'value': value,
+             'system_info': system_info.get(row_uuid, {})}
+            for row_function, i, row_uuid, value in rows]
@@ -0,0 +1,269 @@
+# fingerprint reference values
+"""
+    generate the "true" values for every fingerprint kernel input, so the analyzer can say
+    which CPU is correct (and by how much), instead of only saying that CPUs disagree.
+
+    every input is built exactly the way fingerprinting.py builds it (same Python expression,
+    same float rounding), and the kernel is then evaluated on that exact double using
+    `decimal` arbitrary precision, and rounded once back to the nearest double.
+
+    the results never change, and they are expensive, so they are cached on disk,
+    keyed by kernel and input range.
+"""
+
+import os
+import json
+import math
+from decimal import Decimal, localcontext
+
+
+# directory holding the cached reference tables
+reference_cache_directory = "python scripts/reference_values"
+
+# bump this if the way reference values are computed ever changes, so old caches are ignored
+reference_cache_version = 1
+
+# the kernels from fingerprinting.py, by the name used in the csv columns
+kernels = ['sin', 'cos', 'e', 'log', 'cosh', 'tan']
+
+# extra decimal digits carried past what the input magnitude needs
+guard_digits = 40
+
+
+
+# decimal pi
+"""
+calculate pi to the given number of decimal digits (cached per precision)
+"""
+_pi_cache = {}
+def decimal_pi(digits):
+    if digits in _pi_cache:
+        return _pi_cache[digits]
+
+    with localcontext() as ctx:
+        ctx.prec = digits + 5
+        # Machin's formula: pi = 16*atan(1/5) - 4*atan(1/239)
+        pi = 16 * _decimal_atan_inverse(5) - 4 * _decimal_atan_inverse(239)
+    _pi_cache[digits] = +pi
+    return _pi_cache[digits]
+
+
+
+# decimal atan of 1/n
+"""
+arctangent of 1/n by its taylor series, at the current decimal precision
+"""
+def _decimal_atan_inverse(n):
+    n = Decimal(n)
+    n_squared = n * n
+    term = 1 / n
+    total = term
+    k = 1
+    while True:
+        term /= -n_squared
+        next_total = total + term / (2 * k + 1)
+        if next_total == total:
+            return total
+        total = next_total
+        k += 1
+
+
+
+# decimal sin and cos
+"""
+calculate (sin(x), cos(x)) for an exact Decimal x, reducing the argument by pi/2
+with enough digits of pi to keep the reduced argument accurate even for x near 1e308
+"""
+def decimal_sin_cos(x):
+    magnitude_digits = max(x.adjusted(), 0) + 1
+    digits = magnitude_digits + guard_digits
+
+    with localcontext() as ctx:
+        ctx.prec = digits
+        half_pi = decimal_pi(digits) / 2
+
+        # reduce x into [-pi/4, pi/4] and remember which quadrant it came from
+        quadrant = (x / half_pi).to_integral_value()
+        r = x - quadrant * half_pi
+
+        # taylor series for sin(r) and cos(r)
+        r_squared = r * r
+        sin_r = term = r
+        k = 1
+        while True:
+            term = -term * r_squared / ((2 * k) * (2 * k + 1))
+            if sin_r + term == sin_r:
+                break
+            sin_r += term
+            k += 1
+
+        cos_r = term = Decimal(1)
+        k = 1
+        while True:
+            term = -term * r_squared / ((2 * k - 1) * (2 * k))
+            if cos_r + term == cos_r:
+                break
+            cos_r += term
+            k += 1
+
+        quadrant = int(quadrant) % 4
+        if quadrant == 0: return +sin_r, +cos_r
+        elif quadrant == 1: return +cos_r, -sin_r
+        elif quadrant == 2: return -sin_r, -cos_r
+        else: return -cos_r, +sin_r
+
+
+
+# kernel input
+"""
+build the exact double (or int) input for kernel at i, the same way fingerprinting.py does.
+raises the same exceptions the collector catches as "Overflow"
+"""
+def kernel_input(kernel, i):
+    if kernel == "sin" or kernel == "cos": return 10**i * math.pi
+    elif kernel == "e": return math.e
+    elif kernel == "log": return 10**(i*-1)
+    elif kernel == "cosh": return i
+    elif kernel == "tan": return float(-1*10**i)
+    else: raise ValueError("Invalid operation specified.")
+
+
+
+# reference value
+"""
+calculate the correctly rounded value of kernel at i,
+returns None where the collector would have recorded "Overflow"
+"""
+def reference_value(kernel, i):
+    try:
+        x = kernel_input(kernel, i)
+    except (OverflowError, ValueError):
+        return None
+    # 10**308 * math.pi quietly becomes inf, which the math kernels then reject
+    if math.isinf(x):
+        return None
+    exact_x = Decimal(x)
+
+    with localcontext() as ctx:
+        ctx.prec = max(exact_x.adjusted(), 0) + 1 + guard_digits
+        ctx.Emax = 10**9
+        ctx.Emin = -10**9
+
+        if kernel == "sin":
+            value = decimal_sin_cos(exact_x)[0]
+        elif kernel == "cos":
+            value = decimal_sin_cos(exact_x)[1]
+        elif kernel == "e":
+            # math.e ** i raises the double nearest e to an integer power
+            value = exact_x ** i
+        elif kernel == "log":
+            # log10(0) is a domain error in the collector
+            if exact_x == 0:
+                return None
+            value = exact_x.log10()
+        elif kernel == "cosh":
+            value = (exact_x.exp() + (-exact_x).exp()) / 2
+        elif kernel == "tan":
+            sin_x, cos_x = decimal_sin_cos(exact_x)
+            value = sin_x / cos_x
+
+    # a single rounding from the high precision result down to the nearest double
+    rounded = float(value)
+    if math.isinf(rounded):
+        return None
+    return rounded
+
+
+
+# reference cache filename
+"""
+build the cache filename for kernel over the input range [start, stop)
+"""
+def reference_cache_filename(kernel, start, stop, directory=reference_cache_directory):
+    return f"{directory}/{kernel}_{start}_{stop}.json"
+
+
+
+# generate reference table
+"""
+calculate the reference values for kernel over [start, stop), and write them to the cache
+"""
+def generate_reference_table(kernel, start, stop, directory=reference_cache_directory):
+    print(f"Generating reference values for {kernel}, i = {start}..{stop - 1}")
+
+    values = []
+    overflowed = False
+    for i in range(start, stop):
+        # every kernel's input only moves further out as i grows,
+        # so once it has overflowed it stays overflowed
+        if overflowed:
+            values.append(None)
+            continue
+        value = reference_value(kernel, i)
+        if value is None:
+            overflowed = True
+        values.append(value)
+
+    os.makedirs(directory, exist_ok=True)
+    filename = reference_cache_filename(kernel, start, stop, directory)
+    temporary_filename = filename + ".tmp"
+    with open(temporary_filename, "w") as f:
+        json.dump({
+            'kernel': kernel,
+            'start': start,
+            'stop': stop,
+            'version': reference_cache_version,
+            'values': values
+        }, f)
+    os.replace(temporary_filename, filename)
+
+    return values
+
+
+
+# load reference table
+"""
+load the reference values for kernel over [start, stop) from the cache,
+generating (and caching) them first if they are not there yet.
+returns a list with one float (or None for overflow) per i
+"""
+def load_reference_table(kernel, start, stop, directory=reference_cache_directory):
+    filename = reference_cache_filename(kernel, start, stop, directory)
+    if os.path.exists(filename):
+        with open(filename, "r") as f:
+            table = json.load(f)
+        if table.get('version') == reference_cache_version:
+            return table['values']
+
+    return generate_reference_table(kernel, start, stop, directory)
+
+
+
+# ulp distance
+"""
+    vectorized distance, in units in the last place, between two float64 arrays, as float64
+    (the distance between opposite-signed extremes does not fit in an int64).
+    NaN in either array (the analyzer's marker for "Overflow") gives -1
+"""
+def ulp_distance(measured, reference):
+    import numpy as np
+
+    measured = np.asarray(measured, dtype=np.float64)
+    reference = np.asarray(reference, dtype=np.float64)
+
+    # map the float bit patterns onto a monotonic integer line, so that
+    # neighbouring doubles are neighbouring integers (and -0.0 == 0.0)
+    def ordered(a):
+        bits = a.view(np.int64)
+        return np.where(bits < 0, np.int64(-2**63) - bits, bits)
+
+    measured_ordered, reference_ordered = np.broadcast_arrays(ordered(measured), ordered(reference))
+    # on the same side of zero the int64 difference is exact; across zero it is the sum of the two
+    # magnitudes, which is exact as a uint64
+    same_sign = (measured_ordered < 0) == (reference_ordered < 0)
+    with np.errstate(over='ignore'):
+        difference = np.abs(np.where(same_sign, measured_ordered - reference_ordered, 0))
+    magnitudes = np.abs(measured_ordered).astype(np.uint64) + np.abs(reference_ordered).astype(np.uint64)
+    distance = np.where(same_sign, difference.astype(np.float64), magnitudes.astype(np.float64))
+    distance = np.where(np.isnan(measured) | np.isnan(reference), -1.0, distance)
+    return distance
@@ -0,0 +1,248 @@
+# fingerprint snapshots
+"""
+    freeze the state of the matrix store as a named baseline, and work out exactly which cells changed
+    between two baselines (e.g. before and after a kernel, libm, microcode or Python upgrade),
+    or between a new submission and the previous submission from the same host.
+
+    every (UUID, column, block of iterations) partition of a snapshot gets a 64-bit hash, so a diff first
+    compares the small hash arrays, and only reads the partitions whose hashes differ.
+    elapsed times never repeat exactly, so they are hashed after rounding to a quarter of a power of two;
+    a partition only looks changed when one of its timings moved by more than that.
+"""
+
+import os
+import json
+import shutil
+import time
+import numpy as np
+
+from fingerprint_matrix_store import (matrix_store_directory, columns, value_columns, elapsed_columns,
+                                      load_manifest, open_column, cell_text)
+
+
+# where snapshots are kept, and where diffs are written
+snapshots_directory = "python scripts/snapshots"
+snapshot_diff_filename = "python scripts/snapshot_diff.json"
+
+# iterations per hashed partition
+partition_size = 256
+
+# UUID rows hashed at a time when taking a snapshot
+snapshot_rows_per_chunk = 256
+
+# a timing counts as shifted when it changes by more than this factor (either way)
+timing_shift_factor = 1.5
+
+# the system info fields that identify a host, when the collector did not record a host id
+host_fields = ['OS Type', 'Running on VM', 'CPU Info', 'CPU Info (User Input)', 'CPU Generation (User Input)']
+
+
+
+# host key
+"""
+the identity of the host a submission came from: the collector's host id, or a string built from its system info
+"""
+def host_key(system_info):
+    if system_info.get('Host ID'):
+        return system_info['Host ID']
+    return "|".join(str(system_info.get(field, '')) for field in host_fields)
+
+
+
+# hashable bits
+"""
+the bits a partition is hashed over: values as they are, elapsed times rounded on a log scale
+"""
+def hashable_bits(column, chunk):
+    if column in elapsed_columns:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            buckets = np.round(np.log2(np.abs(chunk)) * 4)
+        return np.where(np.isfinite(buckets), buckets, np.nan).view(np.uint64)
+    return chunk.view(np.uint64)
+
+
+
+# partition hashes
+"""
+    hash every (row, partition) of a 2-D block of bits, vectorized.
+    each cell is multiplied by a fixed odd constant for its position and mixed, then a partition's cells are summed
+"""
+_position_constants = (np.random.default_rng(20240601).integers(1, 2**63, size=partition_size, dtype=np.uint64)
+                       * np.uint64(2) + np.uint64(1))
+def partition_hashes(bits):
+    rows, width = bits.shape
+    padded_width = -(-width // partition_size) * partition_size
+    padded = np.zeros((rows, padded_width), dtype=np.uint64)
+    padded[:, :width] = bits
+    padded = padded.reshape(rows, -1, partition_size)
+
+    mixed = padded * _position_constants
+    mixed ^= mixed >> np.uint64(29)
+    mixed *= np.uint64(0xBF58476D1CE4E5B9)
+    mixed ^= mixed >> np.uint64(32)
+    return mixed.sum(axis=2, dtype=np.uint64)
+
+
+
+# take snapshot
+"""
+    freeze the current matrix store (and the system info of its UUIDs) as snapshot `name`
+"""
+def take_snapshot(name, system_data, store_directory=matrix_store_directory):
+    manifest = load_manifest(store_directory)
+    uuids = manifest['uuids']
+    directory = f"{snapshots_directory}/{name}"
+    os.makedirs(directory, exist_ok=True)
+
+    system_info = {entry['UUID']: entry for entry in system_data}
+    blocks = -(-manifest['iterations'] // partition_size)
+    hashes = np.zeros((len(uuids), len(columns), blocks), dtype=np.uint64)
+    for c, column in enumerate(columns):
+        print(f"Snapshotting {column}")
+        shutil.copyfile(f"{store_directory}/{column}.npy", f"{directory}/{column}.npy")
+        matrix = open_column(directory, column)
+        for u in range(0, len(uuids), snapshot_rows_per_chunk):
+            rows = np.ascontiguousarray(matrix[u:u + snapshot_rows_per_chunk])
+            hashes[u:u + snapshot_rows_per_chunk, c] = partition_hashes(hashable_bits(column, rows))
+    np.save(f"{directory}/hashes.npy", hashes)
+
+    divergence = np.load(f"{store_directory}/divergence.npy")
+    np.save(f"{directory}/divergence.npy", divergence)
+
+    with open(f"{directory}/manifest.json", "w") as f:
+        json.dump({
+            'name': name,
+            'taken': time.strftime("%Y-%m-%d %H:%M:%S"),
+            'uuids': uuids,
+            'iterations': manifest['iterations'],
+            'system_info': {uuid: system_info.get(uuid, {}) for uuid in uuids}
+        }, f, indent=4)
+
+
+
+# cell deltas
+"""
+    the cell-level differences between two rows of one column over [i_start, i_stop):
+    changed values for value columns, shifted timings for elapsed columns
+"""
+def cell_deltas(column, before, after, i_start):
+    before_bits, after_bits = before.view(np.uint64), after.view(np.uint64)
+    if column in value_columns:
+        changed = np.nonzero(before_bits != after_bits)[0]
+    else:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = after / before
+        changed = np.nonzero((ratio > timing_shift_factor) | (ratio < 1 / timing_shift_factor)
+                             | (np.isnan(before) != np.isnan(after)))[0]
+    return [{'column': column, 'i': int(i_start + k),
+             'before': cell_text(int(before_bits[k])),
+             'after': cell_text(int(after_bits[k]))} for k in changed]
+
+
+
+# diff snapshots
+"""
+    compare snapshot `before_name` with snapshot `after_name`, only reading the partitions whose hashes differ.
+    returns (and writes to snapshot_diff_filename):
+        added_uuids / removed_uuids
+        changed_values     - per UUID, the value cells that changed
+        timing_shifts      - per UUID, the elapsed cells that moved by more than timing_shift_factor
+        new_divergences / resolved_divergences  - per column, the iterations where UUIDs started/stopped disagreeing
+"""
+def diff_snapshots(before_name, after_name, output_filename=snapshot_diff_filename):
+    before_directory, after_directory = f"{snapshots_directory}/{before_name}", f"{snapshots_directory}/{after_name}"
+    with open(f"{before_directory}/manifest.json", "r") as f:
+        before_manifest = json.load(f)
+    with open(f"{after_directory}/manifest.json", "r") as f:
+        after_manifest = json.load(f)
+
+    before_rows = {uuid: u for u, uuid in enumerate(before_manifest['uuids'])}
+    after_rows = {uuid: u for u, uuid in enumerate(after_manifest['uuids'])}
+    common = [uuid for uuid in after_manifest['uuids'] if uuid in before_rows]
+
+    before_hashes = np.load(f"{before_directory}/hashes.npy")
+    after_hashes = np.load(f"{after_directory}/hashes.npy")
+    blocks = min(before_hashes.shape[2], after_hashes.shape[2])
+
+    diff = {
+        'before': before_name,
+        'after': after_name,
+        'added_uuids': [uuid for uuid in after_manifest['uuids'] if uuid not in before_rows],
+        'removed_uuids': [uuid for uuid in before_manifest['uuids'] if uuid not in after_rows],
+        'changed_values': {},
+        'timing_shifts': {},
+        'new_divergences': {},
+        'resolved_divergences': {}
+    }
+
+    # the hash comparison: which (UUID, column, partition) need to be read at all
+    common_before = np.array([before_rows[uuid] for uuid in common], dtype=np.int64)
+    common_after = np.array([after_rows[uuid] for uuid in common], dtype=np.int64)
+    changed_partitions = np.argwhere(before_hashes[common_before, :, :blocks]
+                                     != after_hashes[common_after, :, :blocks])
+    print(f"{len(changed_partitions)} changed partitions")
+
+    matrices = {}
+    for k, c, block in changed_partitions:
+        column = columns[c]
+        if column not in matrices:
+            matrices[column] = (open_column(before_directory, column), open_column(after_directory, column))
+        before_matrix, after_matrix = matrices[column]
+        i_start = block * partition_size
+        i_stop = min(i_start + partition_size, before_matrix.shape[1], after_matrix.shape[1])
+        deltas = cell_deltas(column, np.asarray(before_matrix[common_before[k], i_start:i_stop]),
+                             np.asarray(after_matrix[common_after[k], i_start:i_stop]), i_start)
+        if deltas:
+            target = diff['changed_values'] if column in value_columns else diff['timing_shifts']
+            target.setdefault(common[k], []).extend(deltas)
+
+    # divergence bits are small (columns x iterations), so they are compared directly
+    before_divergence = np.load(f"{before_directory}/divergence.npy")
+    after_divergence = np.load(f"{after_directory}/divergence.npy")
+    width = min(before_divergence.shape[1], after_divergence.shape[1])
+    for c, column in enumerate(columns):
+        new = np.nonzero(after_divergence[c, :width] & ~before_divergence[c, :width])[0]
+        resolved = np.nonzero(before_divergence[c, :width] & ~after_divergence[c, :width])[0]
+        if len(new):
+            diff['new_divergences'][column] = [int(i) for i in new]
+        if len(resolved):
+            diff['resolved_divergences'][column] = [int(i) for i in resolved]
+
+    with open(output_filename, "w") as out_f:
+        json.dump(diff, out_f, indent=4)
+
+    return diff
+
+
+
+# diff host
+"""
+    compare a submission with the previous submission from the same host (the most recent other UUID
+    with the same host key, by when its system info file was written), within the current matrix store.
+    system_data entries need a 'Submitted' time (seconds) to order the submissions
+"""
+def diff_host(uuid, system_data, store_directory=matrix_store_directory, output_filename=snapshot_diff_filename):
+    manifest = load_manifest(store_directory)
+    rows = {row_uuid: u for u, row_uuid in enumerate(manifest['uuids'])}
+    system_info = {entry['UUID']: entry for entry in system_data}
+    if uuid not in system_info or uuid not in rows:
+        raise ValueError(f"UUID {uuid} is not in the matrix store")
+
+    host = host_key(system_info[uuid])
+    earlier = [entry for entry in system_data
+               if entry['UUID'] != uuid and entry['UUID'] in rows and host_key(entry) == host
+               and entry['Submitted'] <= system_info[uuid]['Submitted']]
+    if not earlier:
+        raise ValueError(f"no earlier submission from the same host as {uuid}")
+    previous = max(earlier, key=lambda entry: entry['Submitted'])['UUID']
+
+    diff = {'before': previous, 'after': uuid, 'host': host, 'changed_values': [], 'timing_shifts': []}
+    for column in columns:
+        matrix = open_column(store_directory, column)
+        deltas = cell_deltas(column, np.asarray(matrix[rows[previous]]), np.asarray(matrix[rows[uuid]]), 0)
+        diff['changed_values' if column in value_columns else 'timing_shifts'].extend(deltas)
+
+    with open(output_filename, "w") as out_f:
+        json.dump(diff, out_f, indent=4)
+
+    return diff
@@ -24,6 +24,7 @@ import time
 import math
 import platform
 import csv
+import itertools
 
 # for hashing the script itself for integrity check
 import hashlib
@@ -74,10 +75,10 @@ def test_for_bit_overflow(i, operation):
 """
  calculate sin(10^i * pi) fingerprint
 """
-def sin_fingerprint(i):
-    start = time.time()
+def sin_fingerprint(i, clock=time.time):
+    start = clock()
     val = math.sin(10** i * math.pi)
-    elapsed = time.time() - start
+    elapsed = clock() - start
     
     return {i:[val, elapsed]}
 
@@ -87,10 +88,10 @@ def sin_fingerprint(i):
 """
 calculate cos(10^i * pi) fingerprint
 """
-def cos_fingerprint(i):
-    start = time.time()
+def cos_fingerprint(i, clock=time.time):
+    start = clock()
     val = math.cos(10** i * math.pi)
-    elapsed = time.time() - start
+    elapsed = clock() - start
     
     return {i:[val, elapsed]}
 
@@ -100,10 +101,10 @@ def cos_fingerprint(i):
 """
  calculate e^x fingerprint
 """
-def e_fingerprint(i):
-    start = time.time()
+def e_fingerprint(i, clock=time.time):
+    start = clock()
     val = math.e ** (i)
-    elapsed = time.time() - start
+    elapsed = clock() - start
     
     return {i:[val, elapsed]}
 
@@ -113,11 +114,11 @@ def e_fingerprint(i):
 """
 calculate log(10^-i) fingerprint
 """
-def log_fingerprint(i):
-    start = time.time()
+def log_fingerprint(i, clock=time.time):
+    start = clock()
     val = math.log10(10**(i*-1))
     #print(f"Calculating log for i={i} \t val = {val}")
-    elapsed = time.time() - start
+    elapsed = clock() - start
     
     return {i:[val, elapsed]}
 
@@ -127,10 +128,10 @@ def log_fingerprint(i):
 """
 calculate cosh(i)
 """
-def cosh_fingerprint(i):
-    start = time.time()
+def cosh_fingerprint(i, clock=time.time):
+    start = clock()
     val = math.cosh(i)
-    elapsed = time.time() - start
+    elapsed = clock() - start
     
     return {i:[val, elapsed]}
 
@@ -140,59 +141,1077 @@ def cosh_fingerprint(i):
 """
 calculate tan(-1*10^i)
 """
-def tan_fingerprint(i):
-    start = time.time()
+def tan_fingerprint(i, clock=time.time):
+    start = clock()
     val = math.tan(-1*10**i)
-    elapsed = time.time() - start
+    elapsed = clock() - start
     
     return {i:[val, elapsed]}
 
 
 
+# checkpoint settings
+"""
+    the full sweep writes a checkpoint every checkpoint_interval seconds: the completed cells, plus what is
+    needed to carry on (the system information answers, the script hash and the options), so an interrupted
+    run can be continued with --resume <UUID> instead of starting over
+"""
+checkpoint_interval = 30.0
+
+# the command line options that change what a run writes, which a resumed run takes from its checkpoint
+checkpoint_options = ["libm", "probes", "precision", "compress", "schedule", "schedule_seed"]
+
+
+
+# checkpoint filename
+"""
+build the filename of the checkpoint for a run
+"""
+def checkpoint_filename(uuid):
+    return f"fingerprint_checkpoint_{uuid}.json"
+
+
+
+# write checkpoint
+"""
+    write the collector state and the completed cells to the checkpoint file.
+    the write goes to a temporary file first, then replaces the checkpoint in one rename,
+    so an interruption in the middle of a write leaves the previous checkpoint intact
+"""
+def write_checkpoint(uuid, state, results):
+    import json
+    state = dict(state,
+                 completed=sum(cell is not None for function_results in results for cell in function_results),
+                 results=[[cell[i] if cell is not None else None for i, cell in enumerate(function_results)]
+                          for function_results in results])
+
+    filename = checkpoint_filename(uuid)
+    with open(filename + ".tmp", "w") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(filename + ".tmp", filename)
+
+
+
+# load checkpoint
+"""
+    load the checkpoint of run `uuid`, and check that it was written by this exact script on this system.
+    returns the collector state, and the completed cells (same format as fingerprint_cpu(), None where not run yet)
+"""
+def load_checkpoint(uuid):
+    import json
+    with open(checkpoint_filename(uuid), "r") as f:
+        state = json.load(f)
+
+    if state['script_hash'] != self_hash():
+        raise ValueError("the script has changed since the checkpoint was written")
+    if state['os_type'] != platform.system() or state['cpu_info'] != platform.processor():
+        raise ValueError("the checkpoint was written on a different system "
+                         f"({state['os_type']}, {state['cpu_info']})")
+
+    results = [[{i: cell} if cell is not None else None for i, cell in enumerate(function_results)]
+               for function_results in state.pop('results')]
+    return state, results
+
+
+
+# frequency settings
+"""
+    the sweep samples the core frequency at the start of every block of frequency_block_size iterations,
+    so the analyzer can turn each block's elapsed times into cycles, whatever the clock was doing.
+    the frequency comes from cpufreq's scaling_cur_freq, where the OS has it. the rate of a calibrated
+    busy loop is always sampled too: where there is no cpufreq it is the fallback, as a unit of time
+    that scales with the clock the same way the kernels do
+"""
+frequency_block_size = 500
+
+# roughly how long each busy-loop sample takes (seconds)
+busy_loop_duration = 0.002
+
+
+
+# read scaling frequency
+"""
+read the current frequency (Hz) of the cpus this process may run on, averaged, or None without cpufreq
+"""
+def read_scaling_frequency():
+    cpus = os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else range(os.cpu_count() or 1)
+    frequencies = []
+    for cpu in cpus:
+        try:
+            with open(f"/sys/devices/system/cpu/cpu{cpu}/cpufreq/scaling_cur_freq", "r") as f:
+                frequencies.append(int(f.read()) * 1000)  # the file is in kHz
+        except (OSError, ValueError):
+            continue
+    return sum(frequencies) / len(frequencies) if frequencies else None
+
+
+
+# calibrate busy loop
+"""
+find how many busy-loop iterations take about busy_loop_duration seconds on this machine
+"""
+def calibrate_busy_loop():
+    loop_iterations = 1000
+    while True:
+        start = time.perf_counter()
+        for _ in range(loop_iterations):
+            pass
+        took = time.perf_counter() - start
+        if took >= busy_loop_duration / 4:
+            return max(1, int(loop_iterations * busy_loop_duration / took))
+        loop_iterations *= 2
+
+
+
+# sample frequency
+"""
+sample the frequency for the block of iterations starting at block_start:
+scaling_cur_freq (Hz, if available) and the busy-loop rate (iterations per second)
+"""
+def sample_frequency(block_start, loop_iterations):
+    frequency = read_scaling_frequency()
+    start = time.perf_counter()
+    for _ in range(loop_iterations):
+        pass
+    loop_rate = loop_iterations / (time.perf_counter() - start)
+    return {
+        "block_start": block_start,
+        "frequency_hz": frequency if frequency is not None else "N/A",
+        "loop_rate": loop_rate,
+        "source": "scaling_cur_freq" if frequency is not None else "busy-loop"
+    }
+
+
+
+# scheduler settings
+"""
+    the order the (operation, i) cells of the sweep are run in:
+        interleaved - every operation for i = 0, then every operation for i = 1, ... (the original order)
+        blocked     - every i for sin, then every i for cos, ...
+        random      - a seeded shuffle of all the cells, so warm caches, branch predictors and frequency ramps
+                      do not line up with particular operations or i
+    the order is an array of cell numbers (i * 6 + operation), built once, so running it allocates nothing per cell.
+    the mode and seed are recorded in the system info, and the analyzer rebuilds the order from them
+"""
+schedule_modes = ["interleaved", "blocked", "random"]
+schedule_seed = 2718
+
+
+
+# execution order
+"""
+build the order of the cells of a sweep, as an array of cell numbers (i * 6 + operation)
+"""
+def execution_order(iterations, mode="interleaved", seed=schedule_seed):
+    from array import array
+    if mode == "interleaved":
+        order = array('I', range(iterations * 6))
+    elif mode == "blocked":
+        order = array('I', (i * 6 + f for f in range(6) for i in range(iterations)))
+    elif mode == "random":
+        import random
+        order = array('I', range(iterations * 6))
+        random.Random(seed).shuffle(order)
+    else: raise ValueError("Invalid schedule specified.")
+    return order
+
+
+
+# order digest
+"""
+a short digest of an execution order, recorded so a rebuilt order can be checked against the one that ran
+"""
+def order_digest(order):
+    return hashlib.sha256(order.tobytes()).hexdigest()[:16]
+
+
+
 # fingerprint cpu
 """
     Perform the fingerprinting process for the CPU by iterating through a range of values
     and collecting the results of the various mathematical operations.
+    the cells are run in the order of the schedule (see execution_order()).
+    results continues a run from its completed cells (None where a cell has not run yet), and
+    checkpoint(results) is called every checkpoint_interval seconds (and once at the end), if given.
+    if a frequency list is given, a frequency sample is appended to it at the start of every block
+    (blocks are counted in rows' worth of cells, so for the interleaved schedule they are blocks of i).
+    clock is what the kernels time themselves with: the sweep keeps time.time(), so its timings stay
+    comparable with earlier corpora, and the interference mode passes the finer time.perf_counter()
 """
-def fingerprint_cpu():
+def fingerprint_cpu(iterations=10000, results=None, checkpoint=None, frequency=None,
+                    schedule="interleaved", seed=schedule_seed, clock=time.time):
+    operations = list(fingerprint_functions.keys())
+    kernels = list(fingerprint_functions.values())
+    order = execution_order(iterations, schedule, seed)
+
+    if results is None:
+        results = [[None] * iterations for _ in operations]
+    # the completed cells are always the start of the order
+    first = sum(cell is not None for function_results in results for cell in function_results)
+
+    last_checkpoint = time.perf_counter()
+    loop_iterations = calibrate_busy_loop() if frequency is not None else None
+    block_cells = frequency_block_size * len(operations)
+
+    for position in range(first, len(order)):
+        if frequency is not None and (position % block_cells == 0 or position == first):
+            frequency.append(sample_frequency(position // len(operations), loop_iterations))
+
+        i, f = divmod(order[position], len(operations))
+        if not test_for_bit_overflow(i, operations[f]): results[f][i] = kernels[f](i, clock)
+        else: results[f][i] = {i: ["Overflow", "N/A"]}
+
+        if position % len(operations) == len(operations) - 1:
+            print(f"Progress: {(position + 1) // len(operations)}/{iterations}", end='\r')
+
+        if checkpoint is not None and time.perf_counter() - last_checkpoint >= checkpoint_interval:
+            checkpoint(results)
+            last_checkpoint = time.perf_counter()
+
+    if checkpoint is not None:
+        checkpoint(results)
+
+    return results
+
+
+
+# repeat worker
+"""
+    run fingerprint_cpu() once, as repeat number `run`, and write the values and elapsed times
+    straight into the shared memory block (laid out as described in repeat_fingerprint())
+"""
+def _repeat_worker(shared_memory_name, run, repeats, iterations, schedule="interleaved", seed=schedule_seed):
+    from multiprocessing import shared_memory
+    results = fingerprint_cpu(iterations, schedule=schedule, seed=seed)
+    cells = repeats * 6 * iterations
+
+    block = shared_memory.SharedMemory(name=shared_memory_name)
+    try:
+        # the view has to be released before the block can be closed, even when writing fails
+        view = block.buf.cast('d')
+        try:
+            for f in range(6):
+                for i in range(iterations):
+                    val, elapsed = results[f][i][i]
+                    index = (run * 6 + f) * iterations + i
+                    # "Overflow"/"N/A" become NaN, the kernels never return NaN themselves
+                    view[index] = val if val != "Overflow" else math.nan
+                    view[cells + index] = elapsed if elapsed != "N/A" else math.nan
+        finally:
+            view.release()
+    finally:
+        block.close()
+
+
+
+# repeat fingerprint
+"""
+    run fingerprint_cpu() `repeats` times in one session (spread over `workers` processes),
+    combining the runs in one shared memory block instead of R separate result sets:
+        values[run][function][i]  followed by  elapsed[run][function][i]
+    returns the results of the first run (same format as fingerprint_cpu()), and the per-cell stability:
+        stability[function][i] = [bit identical in every run?, mean elapsed, elapsed standard deviation]
+"""
+def repeat_fingerprint(repeats, workers=1, iterations=10000, schedule="interleaved", seed=schedule_seed):
+    from multiprocessing import Pool, shared_memory
+    import statistics
+
+    cells = repeats * 6 * iterations
+    block = shared_memory.SharedMemory(create=True, size=2 * cells * 8)
+    try:
+        with Pool(workers) as pool:
+            pool.starmap(_repeat_worker, [(block.name, run, repeats, iterations, schedule, seed)
+                                          for run in range(repeats)])
+
+        # the views have to be released before the block can be closed, even when reading fails,
+        # or close() raises a BufferError that hides the original error
+        values = block.buf.cast('d')
+        bits = block.buf.cast('Q')
+        try:
+            results = [[],[],[],[],[],[]]
+            stability = [[],[],[],[],[],[]]
+            for f in range(6):
+                for i in range(iterations):
+                    indexes = [(run * 6 + f) * iterations + i for run in range(repeats)]
+
+                    val = values[indexes[0]]
+                    elapsed = values[cells + indexes[0]]
+                    results[f].append({i: [val, elapsed] if not math.isnan(val) else ["Overflow", "N/A"]})
+
+                    stable = len(set(bits[index] for index in indexes)) == 1
+                    timings = [values[cells + index] for index in indexes if not math.isnan(values[cells + index])]
+                    mean = statistics.fmean(timings) if timings else "N/A"
+                    deviation = statistics.pstdev(timings) if timings else "N/A"
+                    stability[f].append([stable, mean, deviation])
+        finally:
+            values.release()
+            bits.release()
+    finally:
+        block.close()
+        block.unlink()
+
+    return results, stability
+
+
+
+# libm backend settings
+"""
+    the libm backend calls the platform's C math library directly through ctypes, skipping CPython's
+    argument handling and special-case checks, so its values and timings are the libm/CPU's alone
+"""
+# calls per timed batch, and how many batches each cell gets (the per-call time is the fastest batch's average)
+libm_repeats = 300
+libm_rounds = 3
+
+# the libm function behind each kernel (e^i is pow(e, i), which is what math.e ** i calls, not exp(i))
+libm_functions = {"sin": "sin", "cos": "cos", "e": "pow", "log": "log10", "cosh": "cosh", "tan": "tan"}
+
+
+
+# load libm
+"""
+    load the platform's C math library, with every kernel function (and fabs, which is used
+    to measure the cost of a bare ctypes call) declared as double f(double), and pow as double pow(double, double)
+"""
+def load_libm():
+    import ctypes
+    import ctypes.util
+
+    if platform.system() == "Windows":
+        libm = ctypes.CDLL("ucrtbase")
+    else:
+        # on macOS the math functions live in libSystem, which find_library("c") finds
+        libm = ctypes.CDLL(ctypes.util.find_library("m") or ctypes.util.find_library("c"))
+
+    for name in list(libm_functions.values()) + ["fabs"]:
+        function = getattr(libm, name)
+        function.restype = ctypes.c_double
+        function.argtypes = [ctypes.c_double, ctypes.c_double] if name == "pow" else [ctypes.c_double]
+    return libm
+
+
+
+# libm input
+"""
+build the double that the libm backend passes for kernel `operation` at i
+(the same expressions as the math kernels, so both backends see the same argument; for e it is the exponent)
+"""
+def libm_input(i, operation):
+    if operation == "sin" or operation == "cos": return 10**i * math.pi
+    elif operation == "e": return float(i)
+    elif operation == "log": return float(10**(i*-1))
+    elif operation == "cosh": return float(i)
+    elif operation == "tan": return float(-1*10**i)
+    else: raise ValueError("Invalid operation specified.")
+
+
+
+# libm fingerprint
+"""
+    run every kernel through libm for i in 0..iterations-1, one ctypes call per cell (ctypes cannot run
+    a C loop over an array), and time every cell over `rounds` batches of `repeats` calls, keeping the fastest.
+    the same batches of fabs calls (the cost of the ctypes call itself) are timed next to it, and kept apart:
+    the difference of two such small times is mostly noise.
+    returns results in the same format as fingerprint_cpu(), with the per-call baseline as a third entry:
+    {i: [value, elapsed, baseline]}
+"""
+def libm_fingerprint(iterations=10000, repeats=libm_repeats, rounds=libm_rounds):
+    libm = load_libm()
+    baseline = libm.fabs
+
     results = [[],[],[],[],[],[]]
+    for f, operation in enumerate(libm_functions):
+        function = getattr(libm, libm_functions[operation])
+
+        # the arguments that can be built; the rest overflow, like they do in the math kernels
+        arguments = {}
+        for i in range(iterations):
+            try:
+                x = libm_input(i, operation)
+            except OverflowError:
+                continue
+            if not math.isinf(x):
+                arguments[i] = (math.e, x) if operation == "e" else (x,)
+
+        for i in range(iterations):
+            if i not in arguments:
+                results[f].append({i: ["Overflow", "N/A", "N/A"]})
+                continue
+
+            value = function(*arguments[i])
+            call_time = min(time_batch(function, arguments[i], repeats) for _ in range(rounds))
+            baseline_time = min(time_batch(baseline, arguments[i][-1:], repeats) for _ in range(rounds))
+
+            results[f].append({i: [value, call_time / repeats, baseline_time / repeats]})
+
+        print(f"libm backend: {operation} done", end='\r')
+
+    return results
+
+
+
+# special operand probe settings
+"""
+    the probes send operands of every class (normal, subnormal, zero, inf, NaN) through basic arithmetic
+    and libm calls on purpose. subnormal operands and results are where CPUs take microcode assists,
+    or flush to zero (FTZ/DAZ), so their timings and values are architecture dependent.
+    every cell is timed over batches of calls (the fastest of a few batches is kept), and saved as the raw
+    time per call: the cost of the Python call is the same for every operand of an operation, so it cancels
+    in the differences between operand classes, which is what the analyzer reports
+"""
+# the operands, by class, at controlled magnitudes
+probe_operands = {
+    "normal": [1.5, 2.0**-1000, 2.0**1000],
+    "subnormal": [2.0**-1030, 2.0**-1060, 5e-324],
+    "zero": [0.0, -0.0],
+    "inf": [math.inf, -math.inf],
+    "nan": [math.nan]
+}
+
+# the probed operations: (function, second operand or None for one-argument functions)
+# mul_tiny turns the smallest normal operands into subnormal results
+probe_operations = {
+    "add": ("add", None),
+    "mul": ("mul", 0.75),
+    "mul_tiny": ("mul", 2.0**-60),
+    "div": ("truediv", 3.0),
+    "sqrt": ("sqrt", None),
+    "log": ("log", None),
+    "exp": ("exp", None),
+    "sin": ("sin", None)
+}
+
+# calls per timed batch, and how many batches each cell gets
+probe_repeats = 10000
+probe_rounds = 5
 
-    iterations = 10000
-    for i in range(iterations):
-        if not test_for_bit_overflow(i, "sin"): results[0].append(sin_fingerprint(i))
-        else: results[0].append({i: ["Overflow", "N/A"]})
 
-        if not test_for_bit_overflow(i, "cos"): results[1].append(cos_fingerprint(i))
-        else: results[1].append({i: ["Overflow", "N/A"]})
 
-        if not test_for_bit_overflow(i, "e"): results[2].append(e_fingerprint(i))
-        else: results[2].append({i: ["Overflow", "N/A"]})
+# probe function
+"""
+look up the callable behind a probed operation; arithmetic comes from the operator module, the rest from math
+"""
+def probe_function(operation):
+    import operator
+    name, _ = probe_operations[operation]
+    return getattr(operator, name) if hasattr(operator, name) else getattr(math, name)
+
+
+
+# time batch
+"""
+time `repeats` calls of function(*arguments), returns the elapsed seconds for the whole batch
+"""
+def time_batch(function, arguments, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function(*arguments)
+    return time.perf_counter() - start
+
+
 
-        if not test_for_bit_overflow(i, "log"): results[3].append(log_fingerprint(i))
-        else: results[3].append({i: ["Overflow", "N/A"]})
+# probe fingerprint
+"""
+    run every probed operation over every operand, returns a list of dictionaries, one per cell:
+    operation, operand class, operand, value (or "Error" when the call raises), and elapsed time per call
+"""
+def probe_fingerprint(repeats=probe_repeats, rounds=probe_rounds):
+    probes = []
+    for operation, (_, second_operand) in probe_operations.items():
+        function = probe_function(operation)
+
+        for operand_class, operands in probe_operands.items():
+            for x in operands:
+                if operation == "add": arguments = (x, x)
+                elif second_operand is None: arguments = (x,)
+                else: arguments = (x, second_operand)
+
+                try:
+                    val = function(*arguments)
+                except (ValueError, OverflowError):
+                    probes.append({"operation": operation, "operand_class": operand_class,
+                                   "operand": repr(x), "value": "Error", "elapsed": "N/A"})
+                    continue
+
+                elapsed = min(time_batch(function, arguments, repeats) for _ in range(rounds)) / repeats
+                probes.append({"operation": operation, "operand_class": operand_class,
+                               "operand": repr(x), "value": repr(val), "elapsed": elapsed})
 
-        if not test_for_bit_overflow(i, "cosh"): results[4].append(cosh_fingerprint(i))
-        else: results[4].append({i: ["Overflow", "N/A"]})
+        print(f"Probes: {operation} done", end='\r')
 
-        if not test_for_bit_overflow(i, "tan"): results[5].append(tan_fingerprint(i))
-        else: results[5].append({i: ["Overflow", "N/A"]})
+    return probes
 
-        print(f"Progress: {i+1}/iterations", end='\r')
+
+
+# precision tier settings
+"""
+    the precision tiers run the same kernels as the sweep through numpy's vectorized loops, at float32, float64
+    and longdouble (x87 extended precision on x86, quad precision on some ARM and POWER systems, plain double
+    with MSVC). float32 goes through numpy's SIMD paths, which differ between architectures far more than libm.
+    every block of i is timed as one vectorized call, and each cell of the block gets the time per element
+"""
+precision_tiers = ["float32", "float64", "longdouble"]
+precision_block_size = 50
+precision_repeats = 20
+
+
+
+# precision kernels
+"""
+    the inputs and kernels of every operation at one precision tier, built in that tier the same way as the
+    math kernels, e.g. sin(10^i * pi) with 10^i and pi rounded to the tier. returns {operation: (inputs, kernel)}
+"""
+def precision_kernels(np, dtype, iterations):
+    i = np.arange(iterations).astype(dtype)
+    ten = dtype(10)
+    pi = dtype("3.14159265358979323846264338327950288")
+    e = dtype("2.71828182845904523536028747135266250")
+    with np.errstate(all='ignore'):
+        return {
+            "sin": (np.power(ten, i) * pi, np.sin),
+            "cos": (np.power(ten, i) * pi, np.cos),
+            "e": (i, lambda x: np.power(e, x)),
+            "log": (np.power(ten, -i), np.log10),
+            "cosh": (i, np.cosh),
+            "tan": (-np.power(ten, i), np.tan)
+        }
+
+
+
+# precision fingerprint
+"""
+    run every kernel for i in 0..iterations-1 at every precision tier.
+    returns {tier: [(values, elapsed), ...]} with one pair of numpy arrays per operation, in the order of
+    fingerprint_functions; cells whose input or result overflowed the tier are not finite
+"""
+def precision_fingerprint(iterations=10000, tiers=precision_tiers, block_size=precision_block_size,
+                          repeats=precision_repeats):
+    import numpy as np
+
+    results = {}
+    for tier in tiers:
+        kernels = precision_kernels(np, np.dtype(tier).type, iterations)
+        results[tier] = []
+        for operation in fingerprint_functions:
+            inputs, kernel = kernels[operation]
+            with np.errstate(all='ignore'):
+                values = kernel(inputs)
+                elapsed = np.empty(iterations)
+                for start in range(0, iterations, block_size):
+                    block = inputs[start:start + block_size]
+                    elapsed[start:start + block_size] = min(time_batch(kernel, (block,), 1)
+                                                            for _ in range(repeats)) / len(block)
+            elapsed[~np.isfinite(values)] = np.nan
+            results[tier].append((values, elapsed))
+        print(f"Precision tiers: {tier} done", end='\r')
 
     return results
 
 
 
+# quick fingerprint
+"""
+    run only the cells listed in a probe manifest (made by the analyzer from the equivalence classes of its corpus),
+    and match their values against the classes of the manifest, which takes milliseconds instead of a full sweep.
+    returns the probes (function, i, value, elapsed) and the index of the matching class, or None if no class matches
+"""
+def quick_fingerprint(manifest):
+    probes = []
+    for probe in manifest['probes']:
+        operation, i = probe['function'], probe['i']
+        if not test_for_bit_overflow(i, operation): val, elapsed = fingerprint_functions[operation](i)[i]
+        else: val, elapsed = "Overflow", "N/A"
+        probes.append({"function": operation, "i": i, "value": str(val), "elapsed": elapsed})
+
+    values = [probe["value"] for probe in probes]
+    match = next((k for k, probe_class in enumerate(manifest['classes']) if probe_class['values'] == values), None)
+    return probes, match
+
+
+
+# adaptive sampling settings
+"""
+    the adaptive mode samples the same kernels at non-integer exponents t, e.g. sin(10^t * pi).
+    the random generator is seeded, and the sequence of samples does not depend on what was measured,
+    so every machine samples the same t values in the same order (a faster machine just gets further)
+"""
+adaptive_seed = 1729
+
+# fraction of samples drawn uniformly over the whole domain, instead of around a region of interest
+adaptive_exploration_fraction = 0.2
+
+# range of the exponent t that each kernel is sampled over (slightly past where it overflows)
+adaptive_domains = {
+    "sin": (0.0, 308.5),
+    "cos": (0.0, 308.5),
+    "e": (-746.0, 710.0),
+    "log": (0.0, 324.0),
+    "cosh": (-711.0, 711.0),
+    "tan": (0.0, 308.5)
+}
+
+# the kernels, by name, in the same order as the results of fingerprint_cpu()
+fingerprint_functions = {
+    "sin": sin_fingerprint,
+    "cos": cos_fingerprint,
+    "e": e_fingerprint,
+    "log": log_fingerprint,
+    "cosh": cosh_fingerprint,
+    "tan": tan_fingerprint
+}
+
+
+
+# adaptive regions
+"""
+    build the regions of interest for each kernel as (center, width, weight),
+    from where CPUs are known to diverge, plus any hints from previous corpora ({kernel: [i, ...]})
+"""
+def adaptive_regions(hints=None):
+    regions = {operation: [] for operation in adaptive_domains}
+
+    # argument-reduction boundaries: libm implementations switch reduction algorithms
+    # as the argument crosses these powers of two
+    for k in [20, 27, 52, 63, 105, 1023]:
+        regions["sin"].append((math.log10(2**k / math.pi), 0.5, 1.0))
+        regions["cos"].append((math.log10(2**k / math.pi), 0.5, 1.0))
+        regions["tan"].append((math.log10(2**k), 0.5, 1.0))
+
+    # near overflow
+    max_float = 1.7976931348623157e308
+    regions["sin"].append((math.log10(max_float / math.pi), 0.25, 2.0))
+    regions["cos"].append((math.log10(max_float / math.pi), 0.25, 2.0))
+    regions["tan"].append((math.log10(max_float), 0.25, 2.0))
+    regions["e"].append((math.log(max_float), 1.0, 2.0))
+    regions["cosh"].append((math.log(max_float) + math.log(2), 1.0, 2.0))
+    regions["cosh"].append((-math.log(max_float) - math.log(2), 1.0, 2.0))
+
+    # subnormal results (e) and subnormal operands (log)
+    regions["e"].append((-726.0, 10.0, 2.0))
+    regions["log"].append((316.0, 5.0, 2.0))
+
+    # where previous corpora showed divergence
+    if hints:
+        for operation, iterations in hints.items():
+            if operation not in regions:
+                print(f"Ignoring the hints for {operation!r}, the adaptive mode only samples: {', '.join(regions)}")
+                continue
+            for i in iterations:
+                regions[operation].append((float(i), 0.5, 4.0))
+
+    return regions
+
+
+
+# adaptive fingerprint
+"""
+    sample the kernels at randomized, non-integer inputs until time_budget seconds have passed,
+    densifying around the regions of interest. returns a list of dictionaries, one per sample
+"""
+def adaptive_fingerprint(time_budget, hints=None, seed=adaptive_seed):
+    import random
+    rng = random.Random(seed)
+
+    regions = adaptive_regions(hints)
+    operations = list(fingerprint_functions.keys())
+    # the cumulative weights of each kernel's regions, so a draw does not sum them again
+    cum_weights = {operation: list(itertools.accumulate(weight for _, _, weight in regions[operation]))
+                   for operation in regions}
+
+    samples = []
+    deadline = time.perf_counter() + time_budget
+    while time.perf_counter() < deadline:
+        operation = operations[len(samples) % len(operations)]
+
+        low, high = adaptive_domains[operation]
+        if rng.random() < adaptive_exploration_fraction or not regions[operation]:
+            t = rng.uniform(low, high)
+        else:
+            center, width, _ = rng.choices(regions[operation], cum_weights=cum_weights[operation])[0]
+            t = min(max(rng.gauss(center, width), low), high)
+
+        if not test_for_bit_overflow(t, operation): val, elapsed = fingerprint_functions[operation](t)[t]
+        else: val, elapsed = "Overflow", "N/A"
+
+        samples.append({
+            "sample": len(samples),
+            "function": operation,
+            "t": t,
+            "value": val,
+            "elapsed": elapsed
+        })
+
+        if len(samples) % 1000 == 0:
+            print(f"Samples: {len(samples)}", end='\r')
+
+    return samples
+
+
+
+# interference settings
+"""
+    the interference mode times the kernels while a co-runner process loads another core.
+    the measuring process and the co-runner are pinned with os.sched_setaffinity (where the OS has it),
+    either to two SMT siblings of one physical core (sharing its FP units and L1/L2 caches),
+    or to two different physical cores (sharing only the last level cache and memory bandwidth)
+"""
+# the co-runner workloads, and what each one loads
+interference_workloads = {
+    "fp": "the floating point units",
+    "memory": "the caches and memory bandwidth",
+    "spin": "issue slots only (an idle spin loop)"
+}
+
+# size of the buffer the memory workload streams through (well past any last level cache)
+interference_memory_bytes = 64 * 1024**2
+
+# how long a co-runner runs before the kernels are timed, so it has reached a steady state
+interference_warmup = 0.5
+
+
+
+# parse cpu list
+"""
+parse a Linux cpu list, e.g. "0,4" or "0-1,8-9", into a set of cpu numbers
+"""
+def parse_cpu_list(text):
+    cpus = set()
+    for part in text.strip().split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.update(range(int(first), int(last) + 1))
+        elif part:
+            cpus.add(int(part))
+    return cpus
+
+
+
+# interference cores
+"""
+    pick the cpu the kernels are timed on, and the cpus the co-runner may run on, for a placement:
+        "sibling" - an SMT sibling of the measuring cpu
+        "other"   - any cpu that is not on the measuring cpu's physical core
+    returns (measuring cpu, co-runner cpus, whether the placement could be honoured);
+    the cpus are None where the OS does not support pinning
+"""
+def interference_cores(placement):
+    if not hasattr(os, "sched_setaffinity"):
+        return None, None, False
+
+    available = os.sched_getaffinity(0)
+    measure_cpu = min(available)
+    try:
+        with open(f"/sys/devices/system/cpu/cpu{measure_cpu}/topology/thread_siblings_list", "r") as f:
+            siblings = parse_cpu_list(f.read()) | {measure_cpu}
+    except OSError:
+        siblings = {measure_cpu}
+
+    if placement == "sibling":
+        candidates = sorted((siblings & available) - {measure_cpu})
+    else:
+        candidates = sorted(available - siblings)
+    if candidates:
+        return measure_cpu, {candidates[0]}, True
+
+    # no such cpu: keep the co-runner off the measuring cpu at least
+    return measure_cpu, (available - {measure_cpu}) or available, False
+
+
+
+# co runner
+"""
+    the co-runner process: pin itself to `cpus`, signal `ready`, and run `workload` until `stop` is set
+"""
+def _co_runner(workload, cpus, ready, stop):
+    if cpus is not None:
+        os.sched_setaffinity(0, cpus)
+
+    if workload == "fp":
+        try:
+            import numpy as np
+            matrix = np.random.default_rng(0).random((128, 128))
+            ready.set()
+            while not stop.is_set():
+                for _ in range(100):
+                    matrix = matrix @ matrix
+                    matrix /= np.abs(matrix).max()
+        except ImportError:
+            x = 0.5
+            ready.set()
+            while not stop.is_set():
+                for _ in range(10000):
+                    x = math.sin(x * 1.0000001 + 0.25) * math.sqrt(x + 2.0)
+
+    elif workload == "memory":
+        # copied in place, a slice assignment would build a temporary copy of half the buffer every time
+        half = interference_memory_bytes // 2
+        try:
+            import numpy as np
+            buffer = np.zeros(interference_memory_bytes, dtype=np.uint8)
+            ready.set()
+            while not stop.is_set():
+                np.copyto(buffer[:half], buffer[half:])
+                np.copyto(buffer[half:], buffer[:half])
+        except ImportError:
+            buffer = memoryview(bytearray(interference_memory_bytes))
+            ready.set()
+            while not stop.is_set():
+                buffer[:half] = buffer[half:]
+                buffer[half:] = buffer[:half]
+
+    elif workload == "spin":
+        ready.set()
+        while not stop.is_set():
+            pass
+
+    else: raise ValueError("Invalid workload specified.")
+
+
+
+# interference fingerprint
+"""
+    run fingerprint_cpu() once without a co-runner ("none"), then once alongside each co-runner workload,
+    with the measuring process pinned to one cpu and the co-runner placed according to `placement`.
+    returns ({condition: results in the same format as fingerprint_cpu()}, measuring cpu, co-runner cpus).
+    raises RuntimeError where the co-runner could only share the measuring cpu (a single cpu host), since
+    the timings would then measure time slicing, not interference
+"""
+def interference_fingerprint(workloads, placement="sibling", iterations=10000, schedule="interleaved",
+                             seed=schedule_seed):
+    import multiprocessing
+
+    measure_cpu, co_runner_cpus, placed = interference_cores(placement)
+    if measure_cpu is not None and measure_cpu in co_runner_cpus:
+        raise RuntimeError("only one cpu is available, so the co-runner would share the measuring cpu")
+    if measure_cpu is None:
+        print("This OS does not support pinning processes to cpus, the co-runners will run wherever the OS puts them")
+    elif not placed:
+        print(f"No {placement} cpu is available, the co-runners will run on cpus {sorted(co_runner_cpus)}")
+
+    original_affinity = os.sched_getaffinity(0) if measure_cpu is not None else None
+    if measure_cpu is not None:
+        os.sched_setaffinity(0, {measure_cpu})
+
+    # the slowdowns are ratios of medians of single calls, which need a finer clock than time.time()
+    clock = time.perf_counter
+
+    conditions = {}
+    try:
+        print("Interference: none")
+        conditions["none"] = fingerprint_cpu(iterations, schedule=schedule, seed=seed, clock=clock)
+
+        for workload in workloads:
+            print(f"\nInterference: {workload} co-runner, loading {interference_workloads[workload]}")
+            ready, stop = multiprocessing.Event(), multiprocessing.Event()
+            co_runner = multiprocessing.Process(target=_co_runner, args=(workload, co_runner_cpus, ready, stop),
+                                                daemon=True)
+            co_runner.start()
+            try:
+                ready.wait()
+                time.sleep(interference_warmup)
+                conditions[workload] = fingerprint_cpu(iterations, schedule=schedule, seed=seed, clock=clock)
+            finally:
+                stop.set()
+                co_runner.join()
+    finally:
+        if original_affinity is not None:
+            os.sched_setaffinity(0, original_affinity)
+
+    return conditions, measure_cpu, co_runner_cpus
+
+
+
+# host id settings
+"""
+    the machine identifiers the host id is derived from, in order of preference: the board's DMI UUID and
+    serial number (usually only readable by root), the OS installation's machine id, and on Windows its MachineGuid.
+    the host name is only used when none of them can be read, and the run then records that it was
+"""
+host_id_files = {
+    "dmi product_uuid": "/sys/class/dmi/id/product_uuid",
+    "dmi board_serial": "/sys/class/dmi/id/board_serial",
+    "machine-id": "/etc/machine-id",
+    "dbus machine-id": "/var/lib/dbus/machine-id"
+}
+
+# values firmware fills in when it has no real identifier
+host_id_placeholders = {"", "0", "none", "not specified", "not applicable", "default string", "to be filled by o.e.m.",
+                        "00000000-0000-0000-0000-000000000000", "ffffffff-ffff-ffff-ffff-ffffffffffff",
+                        "03000200-0400-0500-0006-000700080009"}
+
+
+
+# machine identifier
+"""
+return (identifier, source) for the first machine identifier that can be read, or (host name, "hostname")
+"""
+def machine_identifier():
+    for source, filename in host_id_files.items():
+        try:
+            with open(filename, "r") as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.lower() not in host_id_placeholders:
+            return value, source
+
+    if platform.system() == "Windows":
+        try:
+            import winreg
+            with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\Microsoft\Cryptography") as key:
+                return winreg.QueryValueEx(key, "MachineGuid")[0], "windows MachineGuid"
+        except OSError:
+            pass
+
+    return platform.node(), "hostname"
+
+
+
+# host id
+"""
+    a stable identity for this machine, so that runs on the same host months apart can be linked (every run
+    gets a new UUID). it is a hash of attributes that do not change between runs: the architecture, the CPU
+    model, the number of logical CPUs and a machine identifier (see machine_identifier()), so it survives OS,
+    kernel, libm and Python updates. returns (host id, source of the machine identifier)
+"""
+def host_id():
+    cpu_model = platform.processor()
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    cpu_model = line.split(":", 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    identifier, source = machine_identifier()
+    attributes = [platform.machine(), cpu_model, str(os.cpu_count()), identifier]
+    return hashlib.sha256("|".join(attributes).encode()).hexdigest()[:16], source
+
+
+
+# output compression
+"""
+    the CSV files can be written compressed (stdlib gzip or xz): most of a results file is the same
+    few strings ("Overflow", "N/A") over and over, so it compresses very well.
+    the analyzer reads compressed files directly
+"""
+output_compression = {"gzip": ".gz", "xz": ".xz"}
+
+
+
+# output filename
+"""
+the filename an output is written to, with the compression's extension added
+"""
+def output_filename(filename, compression=None):
+    return filename + output_compression.get(compression, "")
+
+
+
+# open output
+"""
+open an output file for writing text, compressed with `compression` ("gzip", "xz" or None)
+"""
+def open_output(filename, compression=None):
+    if compression == "gzip":
+        import gzip
+        return gzip.open(output_filename(filename, compression), "wt", newline='')
+    if compression == "xz":
+        import lzma
+        return lzma.open(output_filename(filename, compression), "wt", newline='')
+    return open(filename, "w", newline='')
+
+
+
 # main function to run/command the fingerprinting process
 """
  main script
 """
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="CPU Fingerprinting Tool")
+    parser.add_argument("--adaptive", type=float, metavar="SECONDS",
+                        help="instead of the full 0..9999 sweep, sample randomized non-integer inputs for this many seconds")
+    parser.add_argument("--hints", metavar="FILE",
+                        help="adaptive hints file from the analyzer ({kernel: [i, ...]}), to densify sampling where CPUs diverged")
+    parser.add_argument("--quick", metavar="MANIFEST",
+                        help="instead of the full sweep, only run the cells of the analyzer's probe manifest, and classify this machine")
+    parser.add_argument("--repeat", type=int, metavar="R",
+                        help="run the fingerprint R times in this session and record which cells are stable on this machine")
+    parser.add_argument("--libm", action="store_true",
+                        help="also run the kernels through the C math library (ctypes), and record them next to the math results")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes for --repeat (default 1, so runs do not disturb each other's timing)")
+    parser.add_argument("--interference", metavar="WORKLOADS",
+                        help="also time the kernels alongside co-runner workloads, comma separated: "
+                             + ", ".join(interference_workloads))
+    parser.add_argument("--placement", choices=["sibling", "other"], default="sibling",
+                        help="run the co-runner on an SMT sibling of the measuring core, or on another core (default sibling)")
+    parser.add_argument("--resume", metavar="UUID",
+                        help="continue an interrupted run from its checkpoint (fingerprint_checkpoint_<UUID>.json)")
+    parser.add_argument("--schedule", choices=schedule_modes, default="interleaved",
+                        help="the order the (operation, i) cells are run in (default interleaved, the original order)")
+    parser.add_argument("--schedule-seed", type=int, default=schedule_seed,
+                        help=f"seed for the random schedule (default {schedule_seed})")
+    parser.add_argument("--probes", action="store_true",
+                        help="also time arithmetic and libm calls on normal, subnormal, zero, inf and NaN operands")
+    parser.add_argument("--precision", action="store_true",
+                        help="also run the kernels vectorized with numpy at float32, float64 and longdouble precision")
+    parser.add_argument("--compress", choices=list(output_compression),
+                        help="write the CSV files compressed (.csv.gz or .csv.xz), the analyzer reads them directly")
+    args = parser.parse_args()
+    if args.resume and (args.adaptive is not None or args.repeat or args.interference or args.quick):
+        parser.error("--resume only continues the full sweep, not --adaptive, --repeat, --interference or --quick runs")
+    # each of these modes runs instead of the plain sweep, so only one of them can be given
+    modes = [flag for flag, given in [("--adaptive", args.adaptive is not None), ("--quick", args.quick),
+                                      ("--repeat", args.repeat), ("--interference", args.interference)] if given]
+    if len(modes) > 1:
+        parser.error(f"{' and '.join(modes)} cannot be combined, run them one at a time")
+    if args.hints and args.adaptive is None:
+        parser.error("--hints only applies to --adaptive")
+    if args.workers != 1 and not args.repeat:
+        parser.error("--workers only applies to --repeat")
+    if args.libm and (args.adaptive is not None or args.quick):
+        parser.error("--libm runs next to the full sweep, not --adaptive or --quick")
+    if (args.schedule != "interleaved" or args.schedule_seed != schedule_seed) and (args.adaptive is not None
+                                                                                   or args.quick):
+        parser.error("--schedule and --schedule-seed order the full sweep, not --adaptive or --quick")
+    if args.interference:
+        workloads = [workload.strip() for workload in args.interference.split(",") if workload.strip()]
+        for workload in workloads:
+            if workload not in interference_workloads:
+                parser.error(f"unknown interference workload {workload!r}, choose from: {', '.join(interference_workloads)}")
+        # on a single cpu, the co-runner could only share the measuring cpu
+        measure_cpu, co_runner_cpus, _ = interference_cores(args.placement)
+        if measure_cpu is not None and measure_cpu in co_runner_cpus:
+            parser.error("--interference needs a second cpu for the co-runner, and only one is available")
+
     print("Welcome to the CPU Fingerprinting Tool!")
 
+    # an interrupted run picks up its answers and completed rows from the checkpoint
+    resumed_results = None
+    frequency_samples = []
+    if args.resume:
+        try:
+            checkpoint_state, resumed_results = load_checkpoint(args.resume)
+        except (OSError, ValueError) as e:
+            print(f"Cannot resume run {args.resume}: {e}")
+            exit(1)
+        os_type, os_type_from_user = checkpoint_state['os_type'], checkpoint_state['os_type_from_user']
+        vm_check = checkpoint_state['vm_check']
+        cpu_info, cpu_info_from_user = checkpoint_state['cpu_info'], checkpoint_state['cpu_info_from_user']
+        cpu_generation_from_user = checkpoint_state['cpu_generation_from_user']
+        for option, value in checkpoint_state['options'].items():
+            setattr(args, option, value)
+        frequency_samples = checkpoint_state.get('frequency_samples', [])
+        print(f"Resuming run {args.resume} after {checkpoint_state['completed']} completed cells")
+
     # get system information
     """ this is the meta-data of the system that is being fingerprinted, so that the data can be matched and analyzed later """
-    while True:
+    while not args.resume:
         # get OS type
         try:
             os_type = platform.system()
@@ -239,8 +1258,66 @@ if __name__ == "__main__":
     print("Starting fingerprinting process...")
     time.sleep(1)  # Simulate some delay for user experience
 
+    # Generate a unique identifier for the results (up front, so the checkpoints can be named after it)
+    import uuid
+    uuid = args.resume or str(uuid.uuid4())
+    print(f"UUID for this session: {uuid}\n")
+
     # call the fingerprinting function
-    results = fingerprint_cpu()
+    if args.adaptive is not None:
+        hints = None
+        if args.hints:
+            import json
+            with open(args.hints, "r") as f:
+                hints = json.load(f)
+        samples = adaptive_fingerprint(args.adaptive, hints)
+    elif args.quick:
+        import json
+        with open(args.quick, "r") as f:
+            probe_manifest = json.load(f)
+        quick_probes, quick_class = quick_fingerprint(probe_manifest)
+        if quick_class is None:
+            print(f"Quick fingerprint: {len(quick_probes)} probes, no known class matches (a new class)")
+        else:
+            print(f"Quick fingerprint: {len(quick_probes)} probes, matches class {quick_class} "
+                  f"({len(probe_manifest['classes'][quick_class]['members'])} known UUIDs)")
+    elif args.repeat:
+        results, stability = repeat_fingerprint(args.repeat, args.workers, schedule=args.schedule,
+                                                seed=args.schedule_seed)
+    elif args.interference:
+        conditions, measure_cpu, co_runner_cpus = interference_fingerprint(workloads, args.placement,
+                                                                           schedule=args.schedule,
+                                                                           seed=args.schedule_seed)
+        results = conditions["none"]
+    else:
+        checkpoint_state = {
+            'uuid': uuid,
+            'script_hash': self_hash(),
+            'os_type': os_type,
+            'os_type_from_user': os_type_from_user,
+            'vm_check': vm_check,
+            'cpu_info': cpu_info,
+            'cpu_info_from_user': cpu_info_from_user,
+            'cpu_generation_from_user': cpu_generation_from_user,
+            'options': {option: getattr(args, option) for option in checkpoint_options},
+            'frequency_samples': frequency_samples
+        }
+        results = fingerprint_cpu(results=resumed_results,
+                                  checkpoint=lambda results: write_checkpoint(uuid, checkpoint_state, results),
+                                  frequency=frequency_samples, schedule=args.schedule, seed=args.schedule_seed)
+    # adaptive and quick runs do not run the full sweep
+    swept = args.adaptive is None and not args.quick
+    if args.libm and swept:
+        libm_results = libm_fingerprint(len(results[0]))
+    if args.probes:
+        probes = probe_fingerprint()
+    if args.precision:
+        try:
+            import numpy as np
+            precision_results = precision_fingerprint(len(results[0]) if swept else 10000)
+        except ImportError:
+            print("numpy is not installed, skipping the precision tiers")
+            args.precision = False
 
     print("Fingerprinting completed.")
     print("Thank you for using the CPU fingerprinting tool! Saving results...")
@@ -249,12 +1326,6 @@ if __name__ == "__main__":
 
     # try and load the system information and calculation data into a file
     try:
-        # Generate a unique identifier for the results
-        import uuid
-        uuid = str(uuid.uuid4())
-        print(f"Generated UUID for this session: {uuid}\n")
-        time.sleep(1)  # Simulate some delay for user experience
-
         # Hash the script for integrity check
         """ I beg you, please do not be mean and delete, change, or do something funny with the data files. 
             I am trying to do research here, and I need the data to be accurate.
@@ -276,47 +1347,166 @@ if __name__ == "__main__":
             file.write(f"CPU Generation (User Input): {cpu_generation_from_user}\n")
             file.write(f"Script Hash: {self_hash}\n")
             file.write(f"Results UUID: {uuid}\n")
+            host, host_id_source = host_id()
+            file.write(f"Host ID: {host}\n")
+            file.write(f"Host ID Source: {host_id_source}\n")
+            file.write(f"Collected (UTC): {time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())}\n")
+            if args.adaptive is not None:
+                file.write(f"Adaptive Seed: {adaptive_seed}\n")
+                file.write(f"Adaptive Time Budget: {args.adaptive}\n")
+            if args.repeat:
+                file.write(f"Repeats: {args.repeat}\n")
+            if args.quick:
+                file.write(f"Quick Class: {quick_class if quick_class is not None else 'none'}\n")
+            if swept:
+                file.write(f"Schedule: {args.schedule}\n")
+                file.write(f"Schedule Seed: {args.schedule_seed}\n")
+                file.write(f"Schedule Digest: {order_digest(execution_order(len(results[0]), args.schedule, args.schedule_seed))}\n")
+            if args.precision:
+                file.write(f"Long Double Mantissa Bits: {np.finfo(np.longdouble).nmant}\n")
+            if args.interference and args.adaptive is None and not args.repeat:
+                file.write(f"Interference Placement: {args.placement}\n")
+                file.write("Kernel Clock: perf_counter\n")
+                file.write(f"Interference CPUs: {measure_cpu if measure_cpu is not None else 'unpinned'}/"
+                           f"{','.join(str(cpu) for cpu in sorted(co_runner_cpus)) if co_runner_cpus else 'unpinned'}\n")
         time.sleep(1)  # Simulate some delay for user experience
 
 
-        # Save results of data collection to a CSV file
-        with open(f"fingerprint_results_{uuid}.csv", "w", newline='') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=["i", "sin_value", "sin_elapsed",
-                                                    "cos_value", "cos_elapsed",
-                                                    "e_value", "e_elapsed",
-                                                    "log_value", "log_elapsed",
-                                                    "cosh_value", "cosh_elapsed",
-                                                    "tan_value", "tan_elapsed"])
-            writer.writeheader()
-            for i in range(len(results[0])):
-                writer.writerow({
-                    "i": i,
-                    "sin_value": results[0][i][i][0],
-                    "sin_elapsed": results[0][i][i][1],
-                    "cos_value": results[1][i][i][0],
-                    "cos_elapsed": results[1][i][i][1],
-                    "e_value": results[2][i][i][0],
-                    "e_elapsed": results[2][i][i][1],
-                    "log_value": results[3][i][i][0],
-                    "log_elapsed": results[3][i][i][1],
-                    "cosh_value": results[4][i][i][0],
-                    "cosh_elapsed": results[4][i][i][1],
-                    "tan_value": results[5][i][i][0],
-                    "tan_elapsed": results[5][i][i][1]
-                })
+        # Save the adaptive samples, with the inputs they were taken at, to a CSV file
+        if args.adaptive is not None:
+            csv_filename = output_filename(f"fingerprint_adaptive_{uuid}.csv", args.compress)
+            with open_output(f"fingerprint_adaptive_{uuid}.csv", args.compress) as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=["sample", "function", "t", "value", "elapsed"])
+                writer.writeheader()
+                for sample in samples:
+                    writer.writerow(sample)
+
+        # Save the probes of the quick fingerprint to a CSV file
+        elif args.quick:
+            csv_filename = output_filename(f"fingerprint_quick_{uuid}.csv", args.compress)
+            with open_output(f"fingerprint_quick_{uuid}.csv", args.compress) as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=["function", "i", "value", "elapsed"])
+                writer.writeheader()
+                for probe in quick_probes:
+                    writer.writerow(probe)
+
+        else:
+            # Save results of data collection to a CSV file
+            csv_filename = output_filename(f"fingerprint_results_{uuid}.csv", args.compress)
+            with open_output(f"fingerprint_results_{uuid}.csv", args.compress) as csvfile:
+                fieldnames = ["i", "sin_value", "sin_elapsed",
+                              "cos_value", "cos_elapsed",
+                              "e_value", "e_elapsed",
+                              "log_value", "log_elapsed",
+                              "cosh_value", "cosh_elapsed",
+                              "tan_value", "tan_elapsed"]
+                # the libm backend's columns go right after the math ones
+                if args.libm:
+                    fieldnames += [f"{operation}_libm_{column}" for operation in libm_functions
+                                   for column in ["value", "elapsed", "baseline"]]
+                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+                writer.writeheader()
+                for i in range(len(results[0])):
+                    row = {
+                        "i": i,
+                        "sin_value": results[0][i][i][0],
+                        "sin_elapsed": results[0][i][i][1],
+                        "cos_value": results[1][i][i][0],
+                        "cos_elapsed": results[1][i][i][1],
+                        "e_value": results[2][i][i][0],
+                        "e_elapsed": results[2][i][i][1],
+                        "log_value": results[3][i][i][0],
+                        "log_elapsed": results[3][i][i][1],
+                        "cosh_value": results[4][i][i][0],
+                        "cosh_elapsed": results[4][i][i][1],
+                        "tan_value": results[5][i][i][0],
+                        "tan_elapsed": results[5][i][i][1]
+                    }
+                    if args.libm:
+                        for f, operation in enumerate(libm_functions):
+                            row[f"{operation}_libm_value"] = libm_results[f][i][i][0]
+                            row[f"{operation}_libm_elapsed"] = libm_results[f][i][i][1]
+                            row[f"{operation}_libm_baseline"] = libm_results[f][i][i][2]
+                    writer.writerow(row)
+
+            # Save which cells were stable over the repeated runs to a CSV file
+            if args.repeat:
+                with open_output(f"fingerprint_stability_{uuid}.csv", args.compress) as stabilityfile:
+                    operations = ["sin", "cos", "e", "log", "cosh", "tan"]
+                    writer = csv.writer(stabilityfile)
+                    writer.writerow(["i"] + [f"{operation}_{column}" for operation in operations
+                                             for column in ["stable", "elapsed_mean", "elapsed_std"]])
+                    for i in range(len(stability[0])):
+                        row = [i]
+                        for f in range(6):
+                            stable, mean, deviation = stability[f][i]
+                            row += [int(stable), mean, deviation]
+                        writer.writerow(row)
+
+            # Save the elapsed times under every interference condition to a CSV file
+            if args.interference and not args.repeat:
+                with open_output(f"fingerprint_interference_{uuid}.csv", args.compress) as interferencefile:
+                    operations = ["sin", "cos", "e", "log", "cosh", "tan"]
+                    writer = csv.writer(interferencefile)
+                    writer.writerow(["condition", "i"] + [f"{operation}_elapsed" for operation in operations])
+                    for condition, condition_results in conditions.items():
+                        for i in range(len(condition_results[0])):
+                            writer.writerow([condition, i] + [condition_results[f][i][i][1] for f in range(6)])
+
+        # Save the frequency samples of every timing block of the sweep to a CSV file
+        if frequency_samples:
+            with open_output(f"fingerprint_frequency_{uuid}.csv", args.compress) as frequencyfile:
+                writer = csv.DictWriter(frequencyfile, fieldnames=["block_start", "block_stop", "frequency_hz",
+                                                                   "loop_rate", "source"])
+                writer.writeheader()
+                block_stops = [sample["block_start"] for sample in frequency_samples[1:]] + [len(results[0])]
+                for sample, block_stop in zip(frequency_samples, block_stops):
+                    writer.writerow(dict(sample, block_stop=block_stop))
+
+        # Save the special operand probes to a CSV file
+        if args.probes:
+            with open_output(f"fingerprint_probes_{uuid}.csv", args.compress) as probesfile:
+                writer = csv.DictWriter(probesfile, fieldnames=["operation", "operand_class", "operand",
+                                                                "value", "elapsed"])
+                writer.writeheader()
+                for probe in probes:
+                    writer.writerow(probe)
+
+        # Save the kernels at every precision tier to a CSV file, one row per (tier, i)
+        if args.precision:
+            with open_output(f"fingerprint_precision_{uuid}.csv", args.compress) as precisionfile:
+                writer = csv.writer(precisionfile)
+                writer.writerow(["tier", "i"] + [f"{operation}_{column}" for operation in fingerprint_functions
+                                                 for column in ["value", "elapsed"]])
+                for tier, tier_results in precision_results.items():
+                    for i in range(len(tier_results[0][0])):
+                        row = [tier, i]
+                        for values, elapsed in tier_results:
+                            # the shortest text that reads back as exactly the same value of the tier
+                            if np.isfinite(values[i]):
+                                row += [np.format_float_scientific(values[i], unique=True), elapsed[i]]
+                            else:
+                                row += ["Overflow", "N/A"]
+                        writer.writerow(row)
 
     
     except Exception as e:  
         print(f"An error occurred while saving results: {e}")
         print("Please try again or contact me at garrnic3@isu.edu if the issue persists.")
+        if os.path.exists(checkpoint_filename(uuid)):
+            print(f"The completed run is kept in its checkpoint, try again with: --resume {uuid}")
         exit(1)    
 
 
+    # the results are saved, so the checkpoint is not needed anymore
+    if os.path.exists(checkpoint_filename(uuid)):
+        os.remove(checkpoint_filename(uuid))
+
     print("Results saved successfully.")
     time.sleep(1)  # Simulate some delay for user experience
 
     print("Thank you so much for using this CPU fingerprinting tool! \n" \
     "I am very grateful for your time and effort in helping me to gather data\n"
-    f"Please email the resulting files \"{file.name}\" and \"{csvfile.name}\" to me at garrnic3@isu.edu\n")
+    f"Please email the resulting files \"{file.name}\" and \"{csv_filename}\" to me at garrnic3@isu.edu\n")
     print("Have a great day!")
 
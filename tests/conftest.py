@@ -0,0 +1,132 @@
+# test corpus
+"""
+    a small synthetic corpus for the tests: four UUIDs in three equivalence classes, written the way
+    the collector writes them, and aggregated and analyzed in memory by the analyzer.
+    every test runs in its own temporary directory, with the data files under "python scripts/"
+"""
+
+import os
+import sys
+import csv
+import json
+import math
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fingerprinting
+import fingerprint_data_and_elapsed_time_analyzer as analyzer
+
+
+iterations = 40
+functions = ['sin', 'cos', 'e', 'log', 'cosh', 'tan']
+uuids = [f"0000000{k}-aaaa-bbbb-cccc-dddddddddddd" for k in range(4)]
+
+# UUIDs 0 and 1 agree everywhere, 2 and 3 each differ from them (and each other) in their own cells
+expected_classes = [uuids[:2], uuids[2:3], uuids[3:]]
+
+
+
+# kernel values
+"""
+the values the collector's kernels return for i in [0, iterations), as (function, i) -> float or "Overflow"
+"""
+def kernel_values():
+    values = {}
+    for function, kernel in fingerprinting.fingerprint_functions.items():
+        for i in range(iterations):
+            if fingerprinting.test_for_bit_overflow(i, function):
+                values[(function, i)] = "Overflow"
+            else:
+                values[(function, i)] = kernel(i)[i][0]
+    return values
+
+
+
+# perturbed value
+"""
+the value UUID number k reports for one cell: the true kernel value, one ULP off in the cells of its class
+"""
+def perturbed_value(k, function, i, value):
+    if value == "Overflow":
+        return value
+    if k == 2 and function == "tan" and 10 <= i <= 14:
+        return math.nextafter(value, math.inf)
+    if k == 3 and function == "cosh" and i % 7 == 3:
+        return math.nextafter(value, -math.inf)
+    if k == 3 and function == "log" and i == 5:
+        return "Overflow"
+    return value
+
+
+
+# write corpus
+"""
+    write one fingerprint_results csv and system_info txt per UUID to data_directory.
+    system_info holds extra "Key: Value" lines per UUID (e.g. a host id and collection time).
+    with libm, the libm backend's columns are written too, where UUID 1 is one ULP off in every fifth sin cell
+"""
+def write_corpus(data_directory, corpus_uuids=uuids, perturbation=perturbed_value, system_info=None, libm=False):
+    os.makedirs(data_directory, exist_ok=True)
+    values = kernel_values()
+    for k, uuid in enumerate(corpus_uuids):
+        with open(f"{data_directory}/system_info_{uuid}.txt", "w") as f:
+            f.write("OS Type: Linux\n"
+                    "OS Type (User Input): linux\n"
+                    f"Running on VM: {'yes' if k % 2 else 'no'}\n"
+                    "CPU Info: x86_64\n"
+                    f"CPU Info (User Input): {['intel', 'amd'][k // 2 % 2]}\n"
+                    "CPU Generation (User Input): IDK\n"
+                    "Script Hash: abc\n"
+                    f"Results UUID: {uuid}\n")
+            for key, value in (system_info or {}).get(uuid, {}).items():
+                f.write(f"{key}: {value}\n")
+
+        with open(f"{data_directory}/fingerprint_results_{uuid}.csv", "w", newline='') as f:
+            fieldnames = ["i"] + [f"{function}_{kind}" for function in functions for kind in ("value", "elapsed")]
+            if libm:
+                fieldnames += [f"{function}_libm_{kind}" for function in functions
+                               for kind in ("value", "elapsed", "baseline")]
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            for i in range(iterations):
+                row = {"i": i}
+                for function in functions:
+                    value = perturbation(k, function, i, values[(function, i)])
+                    row[f"{function}_value"] = value
+                    # the timings differ between every pair of UUIDs on the even iterations
+                    row[f"{function}_elapsed"] = "N/A" if value == "Overflow" else 1e-6 * (1 + (k + 1) * (i % 2 == 0))
+                    if libm:
+                        libm_value = values[(function, i)]
+                        if k == 1 and function == "sin" and i % 5 == 0 and libm_value != "Overflow":
+                            libm_value = math.nextafter(libm_value, math.inf)
+                        row[f"{function}_libm_value"] = libm_value
+                        row[f"{function}_libm_elapsed"] = "N/A" if libm_value == "Overflow" else 3e-7
+                        row[f"{function}_libm_baseline"] = "N/A" if libm_value == "Overflow" else 1e-7
+                writer.writerow(row)
+
+
+
+# corpus
+"""
+    the synthetic corpus in a temporary working directory, aggregated and analyzed by the in-memory analyzer.
+    returns the inconsistent rows analyze() found
+"""
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_corpus(analyzer.data_directory)
+    analyzer.aggregate()
+    analyzer.analyze()
+    with open(analyzer.inconsistant_rows_filename, "r") as f:
+        return json.load(f)
+
+
+
+# divergent cells
+"""
+the (column, i) cells of the inconsistent rows, optionally only those of the given columns
+"""
+def divergent_cells(inconsistent_rows, columns=None):
+    return {(row['function'], row['iteration']) for row in inconsistent_rows
+            if columns is None or row['function'] in columns}
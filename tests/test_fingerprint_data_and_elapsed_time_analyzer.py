@@ -0,0 +1,282 @@
+# analyzer tests
+"""
+the analyzer's smaller stages, on the synthetic corpus
+"""
+
+import os
+import sys
+import csv
+import json
+import math
+import shutil
+import itertools
+import statistics
+import pytest
+
+import fingerprinting
+import fingerprint_data_and_elapsed_time_analyzer as analyzer
+from conftest import iterations, uuids, functions, write_corpus, divergent_cells
+
+
+def test_adaptive_hints_only_hold_the_sampled_kernels(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_corpus(analyzer.data_directory, libm=True)
+    analyzer.aggregate()
+    analyzer.analyze()
+    with open(analyzer.inconsistant_rows_filename, "r") as f:
+        inconsistent_rows = json.load(f)
+    assert ('sin_libm_value', 0) in divergent_cells(inconsistent_rows)
+
+    analyzer.export_adaptive_hints()
+    with open(analyzer.adaptive_hints_filename, "r") as f:
+        hints = json.load(f)
+    assert set(hints) <= set(fingerprinting.adaptive_domains) and 'sin' not in hints
+    assert hints['tan'] == [10, 11, 12, 13, 14]
+    # and the collector reads them back
+    assert (10.0, 0.5, 4.0) in fingerprinting.adaptive_regions(hints)['tan']
+
+
+def test_adaptive_regions_skip_unknown_kernels(capsys):
+    regions = fingerprinting.adaptive_regions({'sin_libm': [3], 'cos': [4]})
+    assert (4.0, 0.5, 4.0) in regions['cos'] and 'sin_libm' not in regions
+    assert "sin_libm" in capsys.readouterr().out
+
+
+def test_probe_penalties_are_differences_between_classes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_corpus(analyzer.data_directory, uuids[:2])
+    # UUID 1 flushes subnormal results to zero, and pays no penalty for them
+    for k, uuid in enumerate(uuids[:2]):
+        with open(f"{analyzer.data_directory}/fingerprint_probes_{uuid}.csv", "w", newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["operation", "operand_class", "operand", "value", "elapsed"])
+            writer.writerow(["mul", "normal", "1.5", "1.125", 4e-8])
+            writer.writerow(["mul", "normal", "2.0", "1.5", 6e-8])
+            writer.writerow(["mul", "subnormal", "5e-324", "0.0" if k else "5e-324", 5e-8 if k else 2.05e-7])
+            writer.writerow(["log", "zero", "0.0", "Error", "N/A"])
+
+    operand_classes, value_differences = analyzer.analyze_probes()
+    assert math.isclose(operand_classes[uuids[0]]['mul']['subnormal_penalty'], 1.55e-7)
+    assert math.isclose(operand_classes[uuids[1]]['mul']['subnormal_penalty'], 0.0, abs_tol=1e-20)
+    assert operand_classes[uuids[0]]['mul']['median_elapsed'] == {'normal': 5e-8, 'subnormal': 2.05e-7}
+    assert 'log' not in operand_classes[uuids[0]]
+    assert value_differences == [{'operation': 'mul', 'operand': '5e-324',
+                                  'values': {uuids[0]: '5e-324', uuids[1]: '0.0'}}]
+
+
+def test_analyze_stage_writes_hints_before_any_adaptive_run(corpus):
+    assert not any(filename.startswith("fingerprint_adaptive_") for filename in os.listdir(analyzer.data_directory))
+    analyzer.analyze_stage()
+    with open(analyzer.adaptive_hints_filename, "r") as f:
+        hints = json.load(f)
+    assert hints['tan'] == [10, 11, 12, 13, 14] and 5 in hints['log']
+
+
+def test_interference_skips_runs_that_shared_the_measuring_cpu(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_corpus(analyzer.data_directory, uuids[:2], system_info={
+        uuids[0]: {'Interference Placement': 'other', 'Interference CPUs': '0/2'},
+        uuids[1]: {'Interference Placement': 'sibling', 'Interference CPUs': '0/0'}})
+    for uuid in uuids[:2]:
+        with open(f"{analyzer.data_directory}/fingerprint_interference_{uuid}.csv", "w", newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["condition", "i"] + [f"{function}_elapsed" for function in functions])
+            for condition, elapsed in [("none", 1e-7), ("memory", 1.5e-7)]:
+                for i in range(3):
+                    writer.writerow([condition, i] + [elapsed] * len(functions))
+
+    slowdowns = analyzer.analyze_interference()
+    assert list(slowdowns) == [uuids[0]]
+    assert math.isclose(slowdowns[uuids[0]]['conditions']['memory']['sin'], 1.5)
+
+
+def test_watch_matches_analyze(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_corpus("held", libm=True)
+    os.makedirs(analyzer.data_directory)
+
+    # each poll's sleep delivers the next batch of UUIDs (a file is ingested once it is unchanged for a poll)
+    deliveries = {1: uuids[:2], 3: uuids[2:3], 5: uuids[3:]}
+    polls = itertools.count(1)
+    def sleep(seconds):
+        poll = next(polls)
+        if poll == 8:
+            raise KeyboardInterrupt
+        for uuid in deliveries.get(poll, []):
+            for filename in os.listdir("held"):
+                if uuid in filename:
+                    shutil.move(f"held/{filename}", f"{analyzer.data_directory}/{filename}")
+    monkeypatch.setattr(analyzer.time, "sleep", sleep)
+
+    analyzer.watch(poll_interval=0)
+    with open(analyzer.inconsistant_rows_filename, "r") as f:
+        watched = json.load(f)
+    with open(analyzer.watch_status_filename, "r") as f:
+        assert json.load(f)['ingested_uuids'] == len(uuids)
+
+    analyzer.aggregate()
+    analyzer.analyze()
+    with open(analyzer.inconsistant_rows_filename, "r") as f:
+        analyzed = json.load(f)
+    assert any(row['function'] == 'sin_libm_value' for row in analyzed)
+    assert sorted(watched, key=lambda row: (row['iteration'], row['function'])) == \
+        sorted(analyzed, key=lambda row: (row['iteration'], row['function']))
+
+
+def test_order_effects_follow_the_recorded_schedule(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    order = fingerprinting.execution_order(iterations, "random", 5)
+    write_corpus(analyzer.data_directory, system_info={
+        uuids[0]: {'Schedule': 'random', 'Schedule Seed': 5, 'Schedule Digest': fingerprinting.order_digest(order)},
+        uuids[1]: {'Schedule': 'blocked', 'Schedule Digest': 'not the digest'}})
+
+    # the first UUID slows down over its run, by position in its random order
+    positions = {cell: position for position, cell in enumerate(order)}
+    filename = f"{analyzer.data_directory}/fingerprint_results_{uuids[0]}.csv"
+    with open(filename, "r", newline='') as f:
+        rows = list(csv.DictReader(f))
+    for row in rows:
+        for k, function in enumerate(functions):
+            if row[f"{function}_elapsed"] != "N/A":
+                row[f"{function}_elapsed"] = 1e-6 * (1 + positions[int(row['i']) * len(functions) + k] / len(order))
+    with open(filename, "w", newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    analyzer.analyze_order_effects()
+    with open(analyzer.order_effects_filename, "r") as f:
+        order_effects = json.load(f)
+
+    # a schedule that does not rebuild to its digest is skipped, runs from before the scheduler are interleaved
+    assert set(order_effects) == {uuids[0], uuids[2], uuids[3]}
+    assert order_effects[uuids[2]]['schedule'] == 'interleaved'
+    for function in functions:
+        result = order_effects[uuids[0]]['functions'][function]
+        assert result['last_to_first'] > 1.5
+        assert result['after_same'] is not None and result['after_other'] is not None
+        # interleaved runs never run a function twice in a row
+        assert order_effects[uuids[2]]['functions'][function]['after_same'] is None
+
+
+def test_cycles_scale_each_block_by_its_own_sample(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_corpus(analyzer.data_directory)
+    blocks = {uuids[0]: [(0, 2e9, 1e8, "scaling_cur_freq")],
+              uuids[1]: [(0, "N/A", 1e8, "busy-loop"), (20, "N/A", 2e8, "busy-loop")]}
+    for uuid, samples in blocks.items():
+        with open(f"{analyzer.data_directory}/fingerprint_frequency_{uuid}.csv", "w", newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["block_start", "block_stop", "frequency_hz", "loop_rate", "source"])
+            stops = [sample[0] for sample in samples[1:]] + [iterations]
+            writer.writerows((start, stop, frequency_hz, loop_rate, source)
+                             for (start, frequency_hz, loop_rate, source), stop in zip(samples, stops))
+
+    cycle_costs = analyzer.analyze_cycles()
+
+    assert set(cycle_costs) == set(blocks)
+    for k, uuid in enumerate(blocks):
+        records = analyzer.read_csv(analyzer.data_directory, f"fingerprint_results_{uuid}.csv")
+        for function in functions:
+            timed = [record for record in records if record[f"{function}_elapsed"] != "N/A"]
+            result = cycle_costs[uuid]['functions'][function]
+            if k == 0:
+                assert result['median_cycles'] == pytest.approx(
+                    statistics.median(float(record[f"{function}_elapsed"]) * 2e9 for record in timed))
+            else:
+                assert result['median_cycles'] is None
+            # interleaved, so the blocks are blocks of i
+            assert result['median_loop_units'] == pytest.approx(statistics.median(
+                float(record[f"{function}_elapsed"]) * (1e8 if k == 0 or record['i'] < 20 else 2e8)
+                for record in timed))
+    assert cycle_costs[uuids[1]]['loop_rate'] == [1e8, 2e8]
+    assert cycle_costs[uuids[0]]['frequency_hz'] == [2e9, 2e9]
+
+
+# write precision file
+"""
+write one UUID's precision tiers the way the collector does, perturbed by perturbation(tier, function, i, value)
+"""
+def write_precision_file(data_directory, uuid, precision_results, perturbation=lambda tier, function, i, value: value):
+    np = pytest.importorskip("numpy")
+    with open(f"{data_directory}/fingerprint_precision_{uuid}.csv", "w", newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["tier", "i"] + [f"{function}_{column}" for function in functions
+                                         for column in ["value", "elapsed"]])
+        for tier, tier_results in precision_results.items():
+            for i in range(len(tier_results[0][0])):
+                row = [tier, i]
+                for function, (values, elapsed) in zip(functions, tier_results):
+                    value = perturbation(tier, function, i, values[i])
+                    if np.isfinite(value):
+                        row += [np.format_float_scientific(value, unique=True), elapsed[i]]
+                    else:
+                        row += ["Overflow", "N/A"]
+                writer.writerow(row)
+
+
+def test_precision_tier_text_round_trips():
+    np = pytest.importorskip("numpy")
+    for tier, tier_results in fingerprinting.precision_fingerprint(iterations, repeats=1).items():
+        for values, elapsed in tier_results:
+            finite = values[np.isfinite(values)]
+            parsed = np.array([np.format_float_scientific(value, unique=True) for value in finite], dtype=tier)
+            # compared as values, the padding bytes of an x87 long double are not part of it
+            assert ((parsed == finite) & (np.signbit(parsed) == np.signbit(finite))).all(), tier
+
+
+def test_precision_tiers_find_one_ulp(tmp_path, monkeypatch):
+    np = pytest.importorskip("numpy")
+    monkeypatch.chdir(tmp_path)
+    write_corpus(analyzer.data_directory, system_info={
+        uuid: {'Long Double Mantissa Bits': np.finfo(np.longdouble).nmant} for uuid in uuids})
+    precision_results = fingerprinting.precision_fingerprint(iterations, repeats=1)
+    for k, uuid in enumerate(uuids):
+        # the last UUID is one float32 ULP off in tan at i = 3
+        def perturbation(tier, function, i, value):
+            if k == len(uuids) - 1 and tier == "float32" and function == "tan" and i == 3:
+                return np.nextafter(value, np.float32(np.inf))
+            return value
+        write_precision_file(analyzer.data_directory, uuid, precision_results, perturbation)
+
+    precision_tiers = analyzer.analyze_precision_tiers()
+
+    assert set(precision_tiers) == {"float32", "float64", f"longdouble/{np.finfo(np.longdouble).nmant}"}
+    for tier, result in precision_tiers.items():
+        assert result['uuids'] == sorted(uuids)
+        for function, entry in result['functions'].items():
+            if tier == "float32" and function == "tan":
+                assert entry['divergent'] == [[3, 3]] and entry['max_ulp_spread'] == 1.0
+            else:
+                assert entry['divergent_count'] == 0, (tier, function)
+
+
+def test_precision_tiers_do_not_need_numpy_without_tier_data(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_corpus(analyzer.data_directory)
+    monkeypatch.setitem(sys.modules, "numpy", None)
+    monkeypatch.delitem(sys.modules, "fingerprint_group_by", raising=False)
+    assert analyzer.analyze_precision_tiers() == {}
+
+
+def test_compressed_results_read_back_the_same(corpus):
+    directory = analyzer.data_directory
+    for k, uuid in enumerate(uuids):
+        filename = f"fingerprint_results_{uuid}.csv"
+        plain = analyzer.read_csv(directory, filename)
+        compression = ["gzip", "xz"][k % 2]
+        with open(f"{directory}/{filename}", "r", newline='') as source, \
+                fingerprinting.open_output(f"{directory}/{filename}", compression) as target:
+            shutil.copyfileobj(source, target)
+        os.remove(f"{directory}/{filename}")
+
+        compressed_filename = fingerprinting.output_filename(filename, compression)
+        assert compressed_filename == filename + [".gz", ".xz"][k % 2]
+        assert analyzer.is_data_file(compressed_filename, "fingerprint_results_", ".csv")
+        assert analyzer.read_csv(directory, compressed_filename) == plain
+
+    # the whole analysis reads them like the plain files
+    analyzer.aggregate()
+    analyzer.analyze()
+    with open(analyzer.inconsistant_rows_filename, "r") as f:
+        assert json.load(f) == corpus
@@ -0,0 +1,144 @@
+# drift store tests
+"""
+the delta-encoded drift store against the runs it was built from, and against the in-memory analyze()
+"""
+
+import os
+import json
+import math
+import shutil
+import pytest
+
+import fingerprinting
+import fingerprint_drift_store
+import fingerprint_data_and_elapsed_time_analyzer as analyzer
+from fingerprint_drift_store import (drift_store_directory, update_drift_store, load_runs, decode_run, run_rows,
+                                     host_drift)
+from fingerprint_matrix_store import value_columns
+from conftest import write_corpus
+
+
+# six runs of one host, one a month apart, each one ULP off in its own cos cells
+runs = [f"0000000{k}-eeee-ffff-0000-111111111111" for k in range(6)]
+host = "0123456789abcdef"
+
+
+def run_value(k, function, i, value):
+    if value != "Overflow" and function == "cos" and i % 6 == k:
+        return math.nextafter(value, math.inf)
+    return value
+
+
+# held runs
+"""
+write all six runs to a holding directory, so they can be moved into the data directory in any order
+"""
+def write_held_runs():
+    write_corpus("held", runs, run_value, system_info={
+        uuid: {'Host ID': host, 'Host ID Source': 'machine-id', 'Collected (UTC)': f"2026-{k + 1:02d}-01 00:00:00"}
+        for k, uuid in enumerate(runs)})
+
+
+def deliver(uuids):
+    for uuid in uuids:
+        for filename in os.listdir("held"):
+            if uuid in filename:
+                shutil.move(f"held/{filename}", f"{analyzer.data_directory}/{filename}")
+
+
+def update():
+    return update_drift_store(analyzer.data_directory, analyzer.read_csv, analyzer.is_data_file,
+                              analyzer.read_system_data())
+
+
+@pytest.fixture
+def drift_corpus(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # short chains of deltas, so the keyframes are exercised too
+    monkeypatch.setattr(fingerprint_drift_store, "keyframe_interval", 3)
+    os.makedirs(analyzer.data_directory)
+    write_held_runs()
+
+
+def assert_round_trip():
+    host_directory = f"{drift_store_directory}/{host}"
+    stored = load_runs(host_directory)
+    assert [run['uuid'] for run in stored] == runs
+    for k, run in enumerate(stored):
+        values, buckets = decode_run(host_directory, stored, k)
+        expected_values, expected_buckets, timing = run_rows(
+            analyzer.read_csv(analyzer.data_directory, f"fingerprint_results_{run['uuid']}.csv"))
+        assert (values == expected_values).all()
+        assert (buckets == expected_buckets).all()
+        assert run['timing'] == timing
+        assert run['keyframe'] == (k % 3 == 0)
+
+
+def test_in_order_runs_round_trip(drift_corpus):
+    deliver(runs)
+    assert update() == len(runs)
+    assert_round_trip()
+    assert update() == 0
+
+
+def test_late_runs_rewrite_the_chain(drift_corpus):
+    # runs 1 and 3 arrive after the later runs were stored, so the stored runs after them move
+    deliver([runs[0], runs[2], runs[4], runs[5]])
+    assert update() == 4
+    deliver([runs[1], runs[3]])
+    assert update() == 2
+    assert_round_trip()
+
+
+def test_drift_matches_analyze(drift_corpus):
+    deliver(runs[3:])
+    update()
+    deliver(runs[:3])
+    update()
+    drift = host_drift(host)
+    assert drift['hostname_fallback'] is False
+
+    analyzer.aggregate()
+    analyzer.analyze()
+    with open(analyzer.inconsistant_rows_filename, "r") as f:
+        inconsistent_rows = json.load(f)
+
+    assert [run['uuid'] for run in drift['runs']] == runs
+    for transition in drift['transitions']:
+        before, after = transition['before'], transition['after']
+        expected = {(row['function'], row['iteration'], row['values'][before], row['values'][after])
+                    for row in inconsistent_rows
+                    if row['function'] in value_columns and row['values'][before] != row['values'][after]}
+        assert {(column, cell['i'], cell['before'], cell['after'])
+                for column, cells in transition['changed_values'].items() for cell in cells} == expected
+        assert expected
+
+
+def test_hostname_fallback_is_flagged(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # runs from a collector that did not record the source of its host id
+    write_corpus(analyzer.data_directory, runs[:2], run_value, system_info={
+        uuid: {'Host ID': host, 'Collected (UTC)': f"2026-{k + 1:02d}-01 00:00:00"} for k, uuid in enumerate(runs[:2])})
+    update()
+    assert host_drift(host)['hostname_fallback'] is True
+    with open(f"{drift_store_directory}/{host}/runs.json", "r") as f:
+        assert json.load(f)['hostname_fallback'] is True
+
+
+def test_host_id_prefers_machine_identifiers(tmp_path, monkeypatch):
+    machine_id = tmp_path / "machine-id"
+    machine_id.write_text("5c1d2e3f4a5b6c7d8e9f0a1b2c3d4e5f\n")
+    monkeypatch.setattr(fingerprinting, "host_id_files", {
+        "dmi product_uuid": str(tmp_path / "missing"),
+        "dmi board_serial": str(tmp_path / "board_serial"),
+        "machine-id": str(machine_id)})
+    (tmp_path / "board_serial").write_text("To be filled by O.E.M.\n")
+
+    monkeypatch.setattr(fingerprinting.platform, "node", lambda: "first-name")
+    first, source = fingerprinting.host_id()
+    monkeypatch.setattr(fingerprinting.platform, "node", lambda: "second-name")
+    assert fingerprinting.host_id() == (first, "machine-id") and source == "machine-id"
+
+    machine_id.unlink()
+    monkeypatch.setattr(fingerprinting.platform, "system", lambda: "Linux")
+    assert fingerprinting.host_id()[1] == "hostname"
@@ -0,0 +1,58 @@
+# explorer tests
+"""
+the explorer's indexes against the in-memory analyze() on the same corpus
+"""
+
+import os
+import numpy as np
+
+import fingerprint_data_and_elapsed_time_analyzer as analyzer
+from fingerprint_explorer import explorer_index_directory, load_explorer_index, cell_detail, value_table
+from fingerprint_matrix_store import value_columns
+from conftest import uuids, iterations, divergent_cells
+
+
+def test_cell_detail_matches_analyze(corpus, tmp_path):
+    analyzer.explore(output_filename=str(tmp_path / "heatmap.png"))
+    index = load_explorer_index()
+
+    divergent = divergent_cells(corpus, value_columns)
+    for row in corpus:
+        if row['function'] not in value_columns:
+            continue
+        column, i = row['function'], row['iteration']
+        table, left_out = value_table(index, column, i)
+        assert left_out == 0
+        assert {uuid: str(value) for uuid, k, value in table} == {uuid: str(value) for uuid, value in row['values'].items()}
+        assert sum(members for _, _, members in cell_detail(index, column, i)) == len(uuids)
+    for column in value_columns:
+        for i in range(iterations):
+            assert (cell_detail(index, column, i) is None) == ((column, i) not in divergent)
+
+
+def test_heatmap_counts_divergent_iterations(corpus, tmp_path):
+    analyzer.explore(output_filename=str(tmp_path / "heatmap.png"))
+    heatmap = load_explorer_index()['heatmap']
+
+    divergent = divergent_cells(corpus, value_columns)
+    for c, column in enumerate(value_columns):
+        assert heatmap[c].sum() == sum(1 for cell in divergent if cell[0] == column)
+
+
+def test_explore_saves_the_heatmap(corpus, tmp_path):
+    output_filename = tmp_path / "heatmap.png"
+    analyzer.explore(output_filename=str(output_filename))
+    with open(output_filename, "rb") as f:
+        assert f.read(8) == b"\x89PNG\r\n\x1a\n"
+
+
+def test_empty_corpus_has_nothing_to_explore(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(analyzer.data_directory)
+    output_filename = tmp_path / "heatmap.png"
+    analyzer.explore(output_filename=str(output_filename))
+
+    index = load_explorer_index(explorer_index_directory)
+    assert index['iterations'] == 0 and index['heatmap'].shape == (len(value_columns), 0)
+    assert cell_detail(index, value_columns[0], 0) is None
+    assert not output_filename.exists()
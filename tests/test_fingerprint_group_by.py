@@ -0,0 +1,129 @@
+# group by tests
+"""
+the single-pass group-by against the in-memory analyze() and measure_ulp_errors() on the same corpus
+"""
+
+import os
+import csv
+import json
+import numpy as np
+import pytest
+
+import fingerprint_data_and_elapsed_time_analyzer as analyzer
+from fingerprint_group_by import reduce_value_chunk, compact_ranges
+from fingerprint_matrix_store import value_columns
+from conftest import uuids, divergent_cells
+
+
+# expected group table
+"""
+the internal / separates / differs ranges of every group, worked out from analyze()'s inconsistent rows
+"""
+def expected_group_table(inconsistent_rows, system_data, fields):
+    system_info = {entry['UUID']: entry for entry in system_data}
+    groups = {}
+    for uuid in uuids:
+        groups.setdefault(tuple(system_info[uuid][field] for field in fields), []).append(uuid)
+
+    table = {}
+    for key, members in groups.items():
+        for column in value_columns:
+            cells = {'internal': [], 'separates': [], 'differs': []}
+            for row in sorted((row for row in inconsistent_rows if row['function'] == column),
+                              key=lambda row: row['iteration']):
+                group_values = {row['values'][uuid] for uuid in members}
+                others = {uuid: value for uuid, value in row['values'].items() if uuid not in members}
+                other_groups = [{row['values'][uuid] for uuid in other}
+                                for other_key, other in groups.items() if other_key != key]
+                if len(group_values) > 1:
+                    cells['internal'].append(row['iteration'])
+                elif len(set(others.values())) == 1 and group_values != set(others.values()):
+                    cells['separates'].append(row['iteration'])
+                if len(group_values) == 1 and any(len(values) == 1 and values != group_values
+                                                  for values in other_groups):
+                    cells['differs'].append(row['iteration'])
+            table[(key, column)] = {kind: compact_ranges(iterations) for kind, iterations in cells.items()}
+    return table
+
+
+@pytest.mark.parametrize("fields", [["Running on VM"], ["CPU Info (User Input)"],
+                                    ["Running on VM", "CPU Info (User Input)"]])
+def test_group_table_matches_analyze(corpus, fields):
+    table = analyzer.group_divergence(fields)
+    expected = expected_group_table(corpus, analyzer.read_system_data(), fields)
+
+    assert sum(group['members'] for group in table['groups']) == len(uuids)
+    for group in table['groups']:
+        key = tuple(group['group'][field] for field in fields)
+        for column in value_columns:
+            result = group['columns'][column]
+            assert {kind: result[kind] for kind in expected[(key, column)]} == expected[(key, column)], (key, column)
+
+
+def test_group_ulp_matches_measure_ulp_errors(corpus):
+    table = analyzer.group_divergence(["Running on VM"])
+    analyzer.measure_ulp_errors()
+    with open(analyzer.ulp_errors_filename, "r") as f:
+        ulp_errors = json.load(f)
+    system_info = {entry['UUID']: entry for entry in analyzer.read_system_data()}
+
+    for group in table['groups']:
+        members = [uuid for uuid in uuids if system_info[uuid]['Running on VM'] == group['group']['Running on VM']]
+        for column in value_columns:
+            assert group['columns'][column]['max_ulp'] == max(ulp_errors[uuid][column]['max_ulp'] for uuid in members)
+
+
+def test_reduce_value_chunk_matches_pairwise():
+    rng = np.random.default_rng(7)
+    sizes = rng.integers(1, 4, size=30)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    bits = rng.integers(0, 3, size=(int(sizes.sum()), 50)).astype(np.uint64)
+    # most groups uniform, so there is something to separate and differ
+    for start, size in zip(starts, sizes):
+        if rng.random() < 0.8:
+            bits[start:start + size] = bits[start]
+
+    internal, separates, differs = reduce_value_chunk(bits, starts)
+
+    group_min = np.minimum.reduceat(bits, starts, axis=0)
+    uniform = group_min == np.maximum.reduceat(bits, starts, axis=0)
+    pairwise = (uniform[:, np.newaxis] & uniform[np.newaxis, :]
+                & (group_min[:, np.newaxis] != group_min[np.newaxis, :])).any(axis=1)
+    assert (internal == ~uniform).all()
+    assert (differs == pairwise).all()
+    for g, (start, size) in enumerate(zip(starts, sizes)):
+        rest = np.delete(bits, np.s_[start:start + size], axis=0)
+        rest_uniform = (rest == rest[0]).all(axis=0)
+        assert (separates[g] == (uniform[g] & rest_uniform & (rest[0] != bits[start]))).all()
+
+
+def test_unstable_cells_are_masked(corpus):
+    # every divergent cosh cell is unstable on the first host
+    unstable = sorted(i for column, i in divergent_cells(corpus, ['cosh_value']))
+    assert unstable
+    with open(f"{analyzer.data_directory}/fingerprint_stability_{uuids[0]}.csv", "w", newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['i'] + [column[:-len('_value')] + '_stable' for column in value_columns])
+        writer.writeheader()
+        for i in unstable:
+            writer.writerow({**{column[:-len('_value')] + '_stable': 1 for column in value_columns},
+                             'i': i, 'cosh_stable': 0})
+
+    fields = ["Running on VM", "CPU Info (User Input)"]
+    table = analyzer.group_divergence(fields)
+    analyzer.analyze()
+    with open(analyzer.inconsistant_rows_filename, "r") as f:
+        expected = expected_group_table(json.load(f), analyzer.read_system_data(), fields)
+
+    for group in table['groups']:
+        key = tuple(group['group'][field] for field in fields)
+        assert not any(group['columns']['cosh_value'][kind] for kind in ['internal', 'separates', 'differs'])
+        for column in value_columns:
+            result = group['columns'][column]
+            assert {kind: result[kind] for kind in expected[(key, column)]} == expected[(key, column)], (key, column)
+
+
+def test_empty_store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(analyzer.data_directory)
+    table = analyzer.group_divergence(["Running on VM"])
+    assert table == {'fields': ["Running on VM"], 'groups': []}
@@ -0,0 +1,131 @@
+# matrix store tests
+"""
+the out-of-core matrix store against the in-memory analyze() and measure_ulp_errors() on the same corpus
+"""
+
+import json
+import math
+import struct
+import tracemalloc
+import numpy as np
+
+import fingerprint_data_and_elapsed_time_analyzer as analyzer
+from fingerprint_matrix_store import (matrix_store_directory, build_matrix_store, analyze_matrix_store,
+                                      load_manifest, open_column, parse_cell, parse_column, cell_text, columns, value_columns,
+                                      overflow_bits, not_available_bits, missing_bits, chunk_working_set,
+                                      chunk_size_for_budget, widen_matrix, analyze_chunk)
+from conftest import uuids, iterations, expected_classes, divergent_cells, write_corpus
+
+
+def test_parse_cell_bits():
+    for value in [0.0, -0.0, 1.0, -1.5, 5e-324, 1.7976931348623157e308, math.pi]:
+        assert parse_cell(repr(value)) == struct.unpack('<Q', struct.pack('<d', value))[0]
+    assert parse_cell("Overflow") == overflow_bits
+    assert parse_cell("N/A") == parse_cell("") == parse_cell(None) == not_available_bits
+
+
+def test_parse_column_matches_parse_cell():
+    texts = [repr(math.sin(10**i * math.pi)) for i in range(30)] + ["Overflow", "N/A", "", None, "-0.0"]
+    assert parse_column(texts).tolist() == [parse_cell(text) for text in texts]
+
+
+def test_cell_text_round_trips_parse_cell():
+    for text in [repr(0.0), repr(-0.0), repr(5e-324), repr(math.pi), "Overflow", "N/A"]:
+        assert cell_text(parse_cell(text)) == text
+    assert cell_text(missing_bits) is None
+
+
+def test_divergence_and_classes_match_analyze(corpus):
+    build_matrix_store(analyzer.data_directory, analyzer.read_csv, analyzer.is_data_file)
+    summary = analyze_matrix_store(memory_budget=4 * 8 * chunk_working_set * 7)  # chunks of 7 iterations
+
+    stored = {(column, i) for column in columns
+              for i in summary['columns'][column]['divergent_iterations']}
+    assert stored == divergent_cells(corpus, columns)
+    assert summary['classes'] == expected_classes
+
+
+def test_ulp_errors_match_measure_ulp_errors(corpus):
+    build_matrix_store(analyzer.data_directory, analyzer.read_csv, analyzer.is_data_file)
+    summary = analyze_matrix_store()
+    analyzer.measure_ulp_errors()
+    with open(analyzer.ulp_errors_filename, "r") as f:
+        in_memory = json.load(f)
+
+    for uuid in uuids:
+        for column in value_columns:
+            stored, expected = summary['ulp_errors'][uuid][column], in_memory[uuid][column]
+            for field in ['max_ulp', 'incorrect_cells', 'overflow_mismatches']:
+                assert stored[field] == expected[field], (uuid, column, field)
+            assert math.isclose(stored['mean_ulp'], expected['mean_ulp'])
+
+
+def test_shorter_first_file_is_widened(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_corpus(analyzer.data_directory, uuids[:2])
+    # the first UUID (in filename order) only has the first half of the iterations
+    filename = f"{analyzer.data_directory}/fingerprint_results_{uuids[0]}.csv"
+    with open(filename, "r") as f:
+        lines = f.readlines()
+    with open(filename, "w") as f:
+        f.writelines(lines[:1 + iterations // 2])
+
+    stored_uuids, stored_iterations = build_matrix_store(analyzer.data_directory, analyzer.read_csv, analyzer.is_data_file)
+    assert stored_uuids == uuids[:2] and stored_iterations == iterations
+    assert load_manifest()['iterations'] == iterations
+
+    for column in columns:
+        bits = np.asarray(open_column(matrix_store_directory, column)).view(np.uint64)
+        assert (bits[0, iterations // 2:] == missing_bits).all()
+        assert (bits[0, :iterations // 2] == bits[1, :iterations // 2]).all() or column.endswith('_elapsed')
+        assert not (bits[1] == missing_bits).any()
+
+
+def test_header_only_results_are_skipped(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_corpus(analyzer.data_directory, uuids[:3])
+    # the middle UUID (in filename order) was interrupted before its first row
+    with open(f"{analyzer.data_directory}/fingerprint_results_{uuids[1]}.csv", "r") as f:
+        header = f.readline()
+    with open(f"{analyzer.data_directory}/fingerprint_results_{uuids[1]}.csv", "w") as f:
+        f.write(header)
+
+    stored_uuids, stored_iterations = build_matrix_store(analyzer.data_directory, analyzer.read_csv, analyzer.is_data_file)
+    assert stored_uuids == [uuids[0], uuids[2]] and stored_iterations == iterations
+    for column in columns:
+        assert open_column(matrix_store_directory, column).shape == (2, iterations)
+    assert analyze_matrix_store()['classes'] == [[uuids[0]], [uuids[2]]]
+
+
+def test_chunk_fits_its_share_of_the_budget(tmp_path):
+    # a store big enough for the arrays to outweigh the Python objects
+    store_directory = str(tmp_path)
+    uuid_count, stored_iterations = 64, 4096
+    rng = np.random.default_rng(3)
+    matrix = widen_matrix(store_directory, 'sin_value', None, uuid_count, stored_iterations, 0)
+    matrix[:] = rng.integers(0, 3, size=(uuid_count, stored_iterations)) * 0.5
+    matrix.flush()
+    np.save(f"{store_directory}/unstable.npy", np.zeros((len(columns), stored_iterations), dtype=bool))
+    reference = rng.integers(0, 3, size=stored_iterations) * 0.5
+
+    memory_budget = 4 * 1024**2
+    chunk_size = chunk_size_for_budget(uuid_count, memory_budget)
+    assert chunk_size < stored_iterations
+    tracemalloc.start()
+    analyze_chunk(store_directory, 'sin_value', 100, 100 + chunk_size, reference)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert peak <= memory_budget
+
+
+def test_parallel_analysis_matches_serial(corpus):
+    build_matrix_store(analyzer.data_directory, analyzer.read_csv, analyzer.is_data_file)
+    # small enough a budget for every column to be split into several shards
+    memory_budget = 4 * 8 * chunk_working_set * 16
+    serial = analyze_matrix_store(memory_budget=memory_budget, workers=1)
+    serial_divergence = np.load(f"{matrix_store_directory}/divergence.npy")
+    parallel = analyze_matrix_store(memory_budget=memory_budget, workers=2)
+
+    assert (np.load(f"{matrix_store_directory}/divergence.npy") == serial_divergence).all()
+    assert parallel == serial
+    assert parallel['classes'] == expected_classes
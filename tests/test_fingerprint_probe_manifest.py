@@ -0,0 +1,56 @@
+# probe manifest tests
+"""
+the greedy probe set against the classes and divergent cells the in-memory analyze() finds on the same corpus
+"""
+
+import itertools
+import numpy as np
+
+import fingerprinting
+import fingerprint_data_and_elapsed_time_analyzer as analyzer
+from fingerprint_probe_manifest import greedy_probe_set, classify_probes
+from conftest import expected_classes, divergent_cells
+
+
+def test_probes_separate_the_classes_of_analyze(corpus):
+    manifest = analyzer.export_probe_manifest()
+    assert [probe_class['members'] for probe_class in manifest['classes']] == expected_classes
+    assert manifest['unseparated'] == []
+
+    # every probe is a cell where analyze() found the UUIDs disagreeing
+    divergent = divergent_cells(corpus)
+    probes = [(f"{probe['function']}_value", probe['i']) for probe in manifest['probes']]
+    assert set(probes) <= divergent
+    # three classes need two probes
+    assert len(probes) == 2
+
+    # the values of each class at the probes are the values analyze() recorded for its members
+    rows = {(row['function'], row['iteration']): row['values'] for row in corpus}
+    for k, probe_class in enumerate(manifest['classes']):
+        for uuid in probe_class['members']:
+            values = [rows[probe][uuid] for probe in probes]
+            assert values == probe_class['values']
+            assert classify_probes(manifest, values) == k
+
+
+def test_quick_fingerprint_matches_its_class(corpus):
+    manifest = analyzer.export_probe_manifest()
+    # this machine's kernels give the unperturbed values of the first class
+    probes, match = fingerprinting.quick_fingerprint(manifest)
+    assert match == 0 and len(probes) == len(manifest['probes'])
+    assert classify_probes(manifest, [None] * len(manifest['probes'])) is None
+
+
+def test_greedy_probe_set_separates_what_all_cells_separate():
+    rng = np.random.default_rng(3)
+    for _ in range(20):
+        values = rng.integers(0, 3, size=(12, 15))
+        values[5] = values[4]  # two classes no cell separates
+        picked, groups = greedy_probe_set(values)
+
+        # two classes share a group exactly when they agree on every cell, picked or not
+        for a, b in itertools.combinations(range(len(values)), 2):
+            assert (groups[a] == groups[b]) == (values[a] == values[b]).all()
+            if groups[a] != groups[b]:
+                assert (values[a, picked] != values[b, picked]).any()
+        assert len(set(picked)) == len(picked)
@@ -0,0 +1,83 @@
+# query index tests
+"""
+the SQLite query index against the in-memory analyze() on the same corpus
+"""
+
+import os
+import time
+import pytest
+
+import fingerprint_data_and_elapsed_time_analyzer as analyzer
+from fingerprint_matrix_store import matrix_store_directory
+import fingerprint_query
+from fingerprint_query import query
+from conftest import uuids
+
+
+def test_query_matches_analyze(corpus):
+    analyzer.build_query_index(include_elapsed=True)
+
+    expected = {(row['function'], row['iteration'], uuid, value)
+                for row in corpus for uuid, value in row['values'].items()}
+    assert {(row['function'], row['i'], row['uuid'], row['value']) for row in query()} == expected
+
+
+def test_query_filters(corpus):
+    analyzer.build_query_index()
+
+    rows = query(function="tan_value", i_range=(10, 12))
+    assert {row['i'] for row in rows} == {10, 11, 12}
+    assert {row['uuid'] for row in rows} == set(uuids)
+
+    on_vm = query(where={"Running on VM": "YES"})
+    assert on_vm and {row['uuid'] for row in on_vm} == {uuids[1], uuids[3]}
+    assert all(row['system_info']['Running on VM'] == "yes" for row in on_vm)
+
+
+def test_store_is_rebuilt_when_the_data_changes(corpus):
+    divergence_filename = f"{matrix_store_directory}/divergence.npy"
+    assert analyzer.matrix_store_is_stale()
+    analyzer.build_query_index()
+    assert not analyzer.matrix_store_is_stale()
+
+    # a store older than one of the results files
+    earlier = time.time() - 100
+    os.utime(divergence_filename, (earlier, earlier))
+    assert analyzer.matrix_store_is_stale()
+    analyzer.build_query_index()
+    assert not analyzer.matrix_store_is_stale()
+
+    # a UUID removed from the data directory after the store was built
+    for filename in os.listdir(analyzer.data_directory):
+        os.utime(f"{analyzer.data_directory}/{filename}", (earlier - 10, earlier - 10))
+    os.remove(f"{analyzer.data_directory}/fingerprint_results_{uuids[3]}.csv")
+    os.utime(divergence_filename, (earlier, earlier))
+    os.utime(analyzer.data_directory, (earlier + 10, earlier + 10))
+    assert analyzer.matrix_store_is_stale()
+    analyzer.build_query_index()
+    assert uuids[3] not in {row['uuid'] for row in query()}
+
+
+def test_query_builds_a_missing_or_stale_index(corpus, capsys):
+    index_filename = fingerprint_query.query_index_filename
+    with pytest.raises(FileNotFoundError):
+        query()
+    assert not os.path.exists(index_filename)
+
+    rows = analyzer.print_query(function="tan_value")
+    assert {row['i'] for row in rows} == {10, 11, 12, 13, 14}
+
+    # new results arrive after the index was built
+    earlier = time.time() - 100
+    os.utime(index_filename, (earlier, earlier))
+    os.utime(f"{matrix_store_directory}/divergence.npy", (earlier, earlier))
+    assert analyzer.query_index_is_stale()
+    analyzer.print_query()
+    assert not analyzer.query_index_is_stale()
+
+
+def test_query_without_index_or_data(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    assert analyzer.print_query() is None
+    assert "no query index" in capsys.readouterr().out
+    assert not os.path.exists(fingerprint_query.query_index_filename)
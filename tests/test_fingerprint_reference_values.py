@@ -0,0 +1,49 @@
+# reference values tests
+"""
+ulp_distance against exact distances worked out with Python ints
+"""
+
+import math
+import struct
+import numpy as np
+
+from fingerprint_reference_values import ulp_distance
+
+
+# exact ulp distance
+"""
+the distance between two doubles, counted on the same monotonic integer line in Python ints
+"""
+def exact_ulp_distance(a, b):
+    def ordered(x):
+        bits = struct.unpack('<q', struct.pack('<d', x))[0]
+        return -2**63 - bits if bits < 0 else bits
+    return abs(ordered(a) - ordered(b))
+
+
+largest = 1.7976931348623157e308
+smallest = 5e-324
+values = [0.0, -0.0, smallest, -smallest, 1.0, -1.0, math.pi, -math.pi, 1e-300, -1e300,
+          largest, -largest, math.nextafter(largest, 0), -math.nextafter(largest, 0), math.inf, -math.inf]
+
+
+def test_matches_exact_distances():
+    measured, reference = np.meshgrid(values, values)
+    distance = ulp_distance(measured, reference)
+    assert distance.dtype == np.float64
+    for m, r, d in zip(measured.ravel(), reference.ravel(), distance.ravel()):
+        assert d == float(exact_ulp_distance(m, r)), (m, r)
+
+
+def test_extremes_are_not_clipped():
+    # the two ends of the line are more than 2**63 apart
+    assert ulp_distance([largest], [-largest])[0] == float(exact_ulp_distance(largest, -largest)) > 2**63
+    assert ulp_distance([-math.inf], [math.inf])[0] == ulp_distance([math.inf], [-math.inf])[0] > 2**63
+    assert ulp_distance([-largest], [math.nextafter(-largest, 0)])[0] == 1
+
+
+def test_neighbours_and_zeros():
+    assert ulp_distance([0.0], [-0.0])[0] == 0
+    assert ulp_distance([smallest], [-smallest])[0] == 2
+    assert ulp_distance([1.0], [math.nextafter(1.0, 2)])[0] == 1
+    assert ulp_distance([math.nan, 1.0], [1.0, math.nan]).tolist() == [-1, -1]
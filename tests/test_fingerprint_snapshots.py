@@ -0,0 +1,100 @@
+# snapshot tests
+"""
+the hash-partitioned snapshot diff against the in-memory analyze() before and after the corpus changes
+"""
+
+import os
+import csv
+import json
+import math
+
+import fingerprint_data_and_elapsed_time_analyzer as analyzer
+from fingerprint_matrix_store import columns
+from fingerprint_snapshots import diff_snapshots, diff_host
+from conftest import uuids, write_corpus, divergent_cells
+
+
+# edit results
+"""
+rewrite one UUID's results csv, with edit(row) applied to every row
+"""
+def edit_results(uuid, edit):
+    filename = f"{analyzer.data_directory}/fingerprint_results_{uuid}.csv"
+    with open(filename, "r", newline='') as f:
+        reader = csv.DictReader(f)
+        fieldnames, rows = reader.fieldnames, list(reader)
+    with open(filename, "w", newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        for row in rows:
+            edit(row)
+            writer.writerow(row)
+
+
+# analyzed divergence
+"""
+aggregate and analyze the corpus in memory, and return its divergent (column, i) cells
+"""
+def analyzed_divergence():
+    analyzer.aggregate()
+    analyzer.analyze()
+    with open(analyzer.inconsistant_rows_filename, "r") as f:
+        return divergent_cells(json.load(f), columns)
+
+
+def test_diff_snapshots_matches_analyze(corpus):
+    before_divergence = divergent_cells(corpus, columns)
+    analyzer.snapshot("before")
+
+    # UUID 1 changes one value and one timing, and UUID 3 leaves the corpus
+    def edit(row):
+        if row['i'] == '20':
+            row['cos_value'] = repr(math.nextafter(float(row['cos_value']), math.inf))
+        if row['i'] == '4':
+            row['sin_elapsed'] = repr(float(row['sin_elapsed']) * 10)
+    edit_results(uuids[1], edit)
+    os.remove(f"{analyzer.data_directory}/fingerprint_results_{uuids[3]}.csv")
+    os.remove(f"{analyzer.data_directory}/system_info_{uuids[3]}.txt")
+    after_divergence = analyzed_divergence()
+
+    analyzer.snapshot("after")
+    diff = diff_snapshots("before", "after")
+
+    assert diff['removed_uuids'] == [uuids[3]] and diff['added_uuids'] == []
+    assert {uuid: [(cell['column'], cell['i']) for cell in cells]
+            for uuid, cells in diff['changed_values'].items()} == {uuids[1]: [('cos_value', 20)]}
+    assert {uuid: [(cell['column'], cell['i']) for cell in cells]
+            for uuid, cells in diff['timing_shifts'].items()} == {uuids[1]: [('sin_elapsed', 4)]}
+
+    new = {(column, i) for column, iterations in diff['new_divergences'].items() for i in iterations}
+    resolved = {(column, i) for column, iterations in diff['resolved_divergences'].items() for i in iterations}
+    assert new == after_divergence - before_divergence
+    assert resolved == before_divergence - after_divergence
+    assert ('cos_value', 20) in new and ('cosh_value', 3) in resolved
+
+
+def test_unchanged_snapshots_have_no_diff(corpus):
+    analyzer.snapshot("first")
+    analyzer.snapshot("second")
+    diff = diff_snapshots("first", "second")
+    assert not (diff['changed_values'] or diff['timing_shifts'] or diff['new_divergences']
+                or diff['resolved_divergences'] or diff['added_uuids'] or diff['removed_uuids'])
+
+
+def test_diff_host_matches_analyze(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # UUIDs 0 and 2 are two runs of the same host, 2 the later one
+    write_corpus(analyzer.data_directory, system_info={
+        uuids[0]: {'Host ID': 'host-a', 'Collected (UTC)': '2026-01-01 00:00:00'},
+        uuids[2]: {'Host ID': 'host-a', 'Collected (UTC)': '2026-02-01 00:00:00'},
+        uuids[1]: {'Host ID': 'host-b', 'Collected (UTC)': '2026-01-15 00:00:00'}})
+    analyzer.analyze_out_of_core()
+    analyzer.aggregate()
+    analyzer.analyze()
+    with open(analyzer.inconsistant_rows_filename, "r") as f:
+        expected = {(row['function'], row['iteration']) for row in json.load(f)
+                    if row['function'].endswith('_value') and row['values'][uuids[0]] != row['values'][uuids[2]]}
+
+    diff = diff_host(uuids[2], analyzer.read_system_data())
+    assert diff['before'] == uuids[0] and diff['host'] == 'host-a'
+    assert {(cell['column'], cell['i']) for cell in diff['changed_values']} == expected
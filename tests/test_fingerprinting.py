@@ -0,0 +1,209 @@
+# collector tests
+"""
+the collector's modes that do not need a person at the keyboard, run at a small size
+"""
+
+import os
+import sys
+import csv
+import gzip
+import json
+import math
+import shutil
+import hashlib
+import platform
+import itertools
+import subprocess
+import pytest
+
+import fingerprinting
+
+
+def test_probes_cover_every_operation_and_class():
+    probes = fingerprinting.probe_fingerprint(repeats=10, rounds=2)
+    assert len(probes) == len(fingerprinting.probe_operations) * sum(
+        len(operands) for operands in fingerprinting.probe_operands.values())
+    assert {(probe['operation'], probe['operand_class']) for probe in probes} == {
+        (operation, operand_class) for operation in fingerprinting.probe_operations
+        for operand_class in fingerprinting.probe_operands}
+
+    for probe in probes:
+        # a raw time per call, never a difference that can come out negative
+        assert probe['elapsed'] == "N/A" if probe['value'] == "Error" else probe['elapsed'] > 0
+    by_cell = {(probe['operation'], probe['operand']): probe['value'] for probe in probes}
+    assert by_cell[('log', '0.0')] == "Error" and by_cell[('sqrt', '-inf')] == "Error"
+    assert by_cell[('mul_tiny', repr(2.0**-1000))] == repr(2.0**-1060)
+    assert by_cell[('add', repr(5e-324))] == repr(1e-323)
+
+
+def test_kernels_time_with_the_given_clock():
+    ticks = itertools.count(0.0, 0.5)
+    results = fingerprinting.fingerprint_cpu(3, clock=lambda: next(ticks))
+    assert all(cell[i][1] in (0.5, "N/A") for function_results in results for i, cell in enumerate(function_results))
+    # without one, the kernels keep the sweep's time.time()
+    assert fingerprinting.sin_fingerprint(1)[1][1] < 0.5
+
+
+def test_interference_refuses_a_shared_cpu(monkeypatch):
+    monkeypatch.setattr(fingerprinting, "interference_cores", lambda placement: (0, {0}, False))
+    with pytest.raises(RuntimeError):
+        fingerprinting.interference_fingerprint(["spin"], iterations=2)
+
+
+@pytest.mark.skipif(not hasattr(os, "sched_getaffinity") or len(os.sched_getaffinity(0)) < 2,
+                    reason="needs a second cpu for the co-runner")
+def test_interference_times_every_condition(monkeypatch):
+    monkeypatch.setattr(fingerprinting, "interference_warmup", 0.0)
+    affinity = os.sched_getaffinity(0)
+    conditions, measure_cpu, co_runner_cpus = fingerprinting.interference_fingerprint(["spin"], "other", iterations=4)
+    assert os.sched_getaffinity(0) == affinity
+    assert set(conditions) == {"none", "spin"} and measure_cpu not in co_runner_cpus
+    for results in conditions.values():
+        assert [[cell[i][0] for i, cell in enumerate(function_results)] for function_results in results] == \
+            [[cell[i][0] for i, cell in enumerate(function_results)] for function_results in conditions["none"]]
+
+
+@pytest.mark.parametrize("flags", [["--repeat", "2", "--interference", "spin"], ["--adaptive", "1", "--repeat", "2"],
+                                   ["--quick", "manifest.json", "--adaptive", "0"], ["--hints", "hints.json"],
+                                   ["--libm", "--quick", "manifest.json"], ["--workers", "4"],
+                                   ["--resume", "some-uuid", "--repeat", "2"]])
+def test_incompatible_flags_are_rejected(tmp_path, flags):
+    # rejected before the system information questions, so no input is needed
+    run = subprocess.run([sys.executable, fingerprinting.__file__] + flags, cwd=tmp_path, stdin=subprocess.DEVNULL,
+                         capture_output=True, text=True, timeout=60)
+    assert run.returncode == 2 and "error:" in run.stderr
+    assert not os.listdir(tmp_path)
+
+
+# checkpoint state
+"""
+the collector state a checkpoint holds, for a run on this system with the given options
+"""
+def checkpoint_state(uuid, **options):
+    return {'uuid': uuid, 'script_hash': fingerprinting.self_hash(),
+            'os_type': platform.system(), 'os_type_from_user': 'linux', 'vm_check': 'no',
+            'cpu_info': platform.processor(), 'cpu_info_from_user': 'intel', 'cpu_generation_from_user': 'IDK',
+            'options': dict({option: None for option in fingerprinting.checkpoint_options}, **options),
+            'frequency_samples': []}
+
+
+# cell values
+"""
+the values of fingerprint_cpu() results, without the timings
+"""
+def cell_values(results):
+    return [[cell[i][0] for i, cell in enumerate(function_results)] for function_results in results]
+
+
+def test_checkpoint_round_trip(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    results = fingerprinting.fingerprint_cpu(5, schedule="random")
+    results[2][4] = None
+    state = checkpoint_state("run", libm=True, compress="xz", schedule="random", schedule_seed=5)
+    fingerprinting.write_checkpoint("run", state, results)
+
+    loaded_state, loaded_results = fingerprinting.load_checkpoint("run")
+    assert loaded_state == dict(state, completed=29)
+    assert loaded_results == results
+
+
+def test_checkpoint_of_another_script_or_system_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    results = fingerprinting.fingerprint_cpu(2)
+    fingerprinting.write_checkpoint("run", dict(checkpoint_state("run"), script_hash="0" * 64), results)
+    with pytest.raises(ValueError, match="script has changed"):
+        fingerprinting.load_checkpoint("run")
+
+    fingerprinting.write_checkpoint("run", dict(checkpoint_state("run"), cpu_info="another cpu"), results)
+    with pytest.raises(ValueError, match="different system"):
+        fingerprinting.load_checkpoint("run")
+
+
+def test_resumed_sweep_matches_an_uninterrupted_one(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(fingerprinting, "checkpoint_interval", 0.0)
+    uninterrupted = fingerprinting.fingerprint_cpu(30, schedule="blocked")
+
+    # interrupted after its 50th checkpoint (one per cell)
+    checkpoints = itertools.count(1)
+    def checkpoint(results):
+        fingerprinting.write_checkpoint("run", checkpoint_state("run"), results)
+        if next(checkpoints) == 50:
+            raise KeyboardInterrupt
+    with pytest.raises(KeyboardInterrupt):
+        fingerprinting.fingerprint_cpu(30, checkpoint=checkpoint, schedule="blocked")
+
+    state, results = fingerprinting.load_checkpoint("run")
+    assert state['completed'] == 50
+    resumed = fingerprinting.fingerprint_cpu(30, results=results, schedule="blocked")
+    assert cell_values(resumed) == cell_values(uninterrupted)
+
+
+def test_resume_restores_the_output_options(tmp_path):
+    # a sweep that completed every cell, but was interrupted before its results were saved
+    results = fingerprinting.fingerprint_cpu()
+    script = tmp_path / "fingerprinting.py"
+    shutil.copy(fingerprinting.__file__, script)
+    state = checkpoint_state("run", probes=True, precision=True, compress="gzip", schedule="blocked", schedule_seed=7)
+    state['script_hash'] = hashlib.sha256(script.read_bytes()).hexdigest()
+    with open(tmp_path / "fingerprint_checkpoint_run.json", "w") as f:
+        json.dump(dict(state, completed=0, results=[[cell[i] for i, cell in enumerate(function_results)]
+                                                    for function_results in results]), f)
+
+    run = subprocess.run([sys.executable, str(script), "--resume", "run"], cwd=tmp_path, stdin=subprocess.DEVNULL,
+                         capture_output=True, text=True, timeout=600)
+    assert run.returncode == 0, run.stdout + run.stderr
+    assert {"fingerprint_results_run.csv.gz", "fingerprint_probes_run.csv.gz",
+            "fingerprint_precision_run.csv.gz"} <= set(os.listdir(tmp_path))
+    assert not (tmp_path / "fingerprint_checkpoint_run.json").exists()
+    with open(tmp_path / "system_info_run.txt", "r") as f:
+        system_info = f.read()
+    assert "Schedule: blocked\n" in system_info and "Schedule Seed: 7\n" in system_info
+
+    with gzip.open(tmp_path / "fingerprint_results_run.csv.gz", "rt") as f:
+        rows = list(csv.DictReader(f))
+    assert [row['tan_value'] for row in rows] == [str(cell[i][0]) for i, cell in enumerate(results[5])]
+
+
+@pytest.mark.parametrize("mode", ["interleaved", "blocked", "random"])
+def test_execution_order_is_a_permutation(mode):
+    order = fingerprinting.execution_order(25, mode, seed=11)
+    assert sorted(order) == list(range(25 * 6))
+
+
+def test_random_order_is_reproducible_from_its_seed():
+    order = fingerprinting.execution_order(25, "random", seed=11)
+    assert order == fingerprinting.execution_order(25, "random", seed=11)
+    assert order != fingerprinting.execution_order(25, "random", seed=12)
+    assert fingerprinting.order_digest(order) == fingerprinting.order_digest(
+        fingerprinting.execution_order(25, "random", seed=11))
+    assert fingerprinting.execution_order(3, "blocked").tolist()[:6] == [0, 6, 12, 1, 7, 13]
+    with pytest.raises(ValueError):
+        fingerprinting.execution_order(3, "sideways")
+
+
+def test_schedule_does_not_change_the_values():
+    interleaved = cell_values(fingerprinting.fingerprint_cpu(20))
+    for mode in ["blocked", "random"]:
+        assert cell_values(fingerprinting.fingerprint_cpu(20, schedule=mode, seed=3)) == interleaved
+
+
+def test_frequency_is_sampled_at_every_block(monkeypatch):
+    monkeypatch.setattr(fingerprinting, "frequency_block_size", 10)
+    monkeypatch.setattr(fingerprinting, "busy_loop_duration", 0.0001)
+    monkeypatch.setattr(fingerprinting, "read_scaling_frequency", lambda: 2e9)
+    frequency = []
+    fingerprinting.fingerprint_cpu(25, frequency=frequency, schedule="random")
+    assert [sample['block_start'] for sample in frequency] == [0, 10, 20]
+    assert all(sample['frequency_hz'] == 2e9 and sample['source'] == "scaling_cur_freq" and sample['loop_rate'] > 0
+               for sample in frequency)
+
+    # without cpufreq only the busy loop is sampled, and a resumed sweep samples where it picks up
+    monkeypatch.setattr(fingerprinting, "read_scaling_frequency", lambda: None)
+    results = fingerprinting.fingerprint_cpu(25)
+    for function_results in results:
+        function_results[13:] = [None] * 12
+    frequency = []
+    fingerprinting.fingerprint_cpu(25, results=results, frequency=frequency)
+    assert [(sample['block_start'], sample['frequency_hz'], sample['source']) for sample in frequency] == \
+        [(13, "N/A", "busy-loop"), (20, "N/A", "busy-loop")]